@@ -19,6 +19,8 @@ Available modules
 ---------------------
 track
     Tracking Non-Rigid Clusters in 2D matrix
+tracker
+    Incremental tracking of one frame at a time
 forecast
     Forecasting the movement of the Clusters by extrapolation
 
@@ -61,6 +63,7 @@ from the community.
 from ._version import __version__
 from .default_parameters import default_parameters
 from pyfortracc.track import track
+from pyfortracc.tracker import Tracker
 from pyfortracc.forecast import forecast
 from pyfortracc.features_extraction import features_extraction
 from pyfortracc.spatial_operations import spatial_operations
@@ -0,0 +1,2 @@
+from .workload import synthetic_workload, synthetic_table, read_workload
+from .suite import run_benchmark, compare_reports, STAGES
@@ -0,0 +1,227 @@
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import platform
+import threading
+import psutil
+import pandas as pd
+import pyarrow.parquet as pq
+from datetime import datetime
+from pyfortracc._version import __version__
+from pyfortracc.features_extraction import features_extraction
+from pyfortracc.spatial_operations import spatial_operations
+from pyfortracc.cluster_linking import cluster_linking
+from pyfortracc.concat import concat
+from pyfortracc.post_processing.duration import compute_duration
+from pyfortracc.forecast import forecast
+from pyfortracc.utilities.executor import start_executor, stop_executor
+from pyfortracc.utilities.utils import set_nworkers
+from .workload import read_workload
+
+# Stages of the benchmark, in the order they are run
+STAGES = ('features_extraction', 'spatial_operations', 'cluster_linking',
+          'concat', 'compute_duration', 'forecast')
+
+
+def measure(fnc, *args, interval=0.05, **kwargs):
+    """
+    Run a function measuring its wall time and the peak resident memory of
+    the process and its workers, sampled by a background thread.
+
+    Parameters
+    ----------
+    fnc : function
+        Function to be measured.
+    *args, **kwargs
+        Arguments of the function.
+    interval : float
+        Sampling interval of the memory, in seconds.
+
+    Returns
+    -------
+    seconds : float
+        Wall time of the function.
+    peak_rss_mb : float
+        Peak of the summed resident memory of the process and its children,
+        in MB.
+    """
+    process = psutil.Process()
+    peak = [0]
+    done = threading.Event()
+
+    def sample():
+        while True:
+            rss = process.memory_info().rss
+            for child in process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    continue
+            peak[0] = max(peak[0], rss)
+            if done.wait(interval):
+                return
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        fnc(*args, **kwargs)
+    finally:
+        seconds = time.perf_counter() - start
+        done.set()
+        sampler.join()
+    return seconds, peak[0] / 1024 / 1024
+
+
+def run_stage(stage, name_list, read_function, parallel):
+    """
+    Run a stage of the benchmark.
+    """
+    if stage == 'features_extraction':
+        features_extraction(name_list, read_function, parallel=parallel)
+    elif stage == 'spatial_operations':
+        spatial_operations(name_list, read_function, parallel=parallel)
+    elif stage == 'cluster_linking':
+        cluster_linking(name_list, parallel=parallel)
+    elif stage == 'concat':
+        concat(name_list, parallel=parallel)
+    elif stage == 'compute_duration':
+        compute_duration(name_list, parallel=parallel)
+    elif stage == 'forecast':
+        # The forecast changes the output_path of its name_list
+        forecast(dict(name_list), read_function)
+
+
+def run_benchmark(name_list, read_function=read_workload, stages=STAGES,
+                  parallel=False, workload=None, report_file=None,
+                  label=None):
+    """
+    Track a workload timing each stage, and write a JSON report that can be
+    compared with the reports of other versions by compare_reports.
+
+    The output_path of the name_list is removed before the run. If the
+    forecast parameters are not set, the last observed frame is forecast
+    with the previous frames.
+
+    Parameters
+    ----------
+    name_list : dict
+        Parameters of the workload, as returned by synthetic_workload.
+    read_function : function
+        Function to read the frames.
+    stages : tuple
+        Stages to be run, in the order of STAGES.
+    parallel : bool
+        If True, the stages run in parallel with the workers of the
+        executor of the name_list, started once as in track.
+    workload : dict, optional
+        Summary of the workload, as returned by synthetic_workload.
+    report_file : str, optional
+        Path of the JSON report.
+    label : str, optional
+        Label of the run, e.g. the version or branch being measured.
+
+    Returns
+    -------
+    report : dict
+        Environment, workload, wall time and peak memory of each stage and
+        size of the tracking table.
+    """
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError('Invalid stage: {}'.format(stage))
+    shutil.rmtree(name_list['output_path'], ignore_errors=True)
+    if 'forecast' in stages and 'forecast_time' not in name_list:
+        files = sorted(glob.glob(name_list['input_path'] + '*'))
+        last_stamp = datetime.strptime(os.path.basename(files[-1]),
+                                       name_list['timestamp_pattern'])
+        name_list['forecast_time'] = str(last_stamp)
+        name_list['observation_window'] = min(5, len(files) - 1)
+        name_list['lead_time'] = 2
+    results = {}
+    if parallel:
+        start_executor(name_list)
+    try:
+        for stage in stages:
+            seconds, peak_rss = measure(run_stage, stage, name_list,
+                                        read_function, parallel)
+            results[stage] = {'seconds': round(seconds, 4),
+                              'peak_rss_mb': round(peak_rss, 1)}
+    finally:
+        stop_executor()
+    tables = glob.glob(name_list['output_path'] + 'track/trackingtable/*.parquet')
+    report = {'label': label,
+              'date': datetime.now().isoformat(timespec='seconds'),
+              'version': __version__,
+              'python': sys.version.split()[0],
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'parallel': parallel,
+              'n_jobs': set_nworkers(name_list) if parallel else 1,
+              'executor': name_list.get('executor', 'process'),
+              'workload': workload,
+              'stages': results,
+              'total_seconds': round(sum(r['seconds']
+                                         for r in results.values()), 4),
+              'n_rows': int(sum(pq.ParquetFile(table).metadata.num_rows
+                                for table in tables))}
+    if report_file is not None:
+        with open(report_file, 'w') as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def load_report(report):
+    """
+    Load a report from a JSON file, or return it if it is already loaded.
+    """
+    if isinstance(report, dict):
+        return report
+    with open(report) as f:
+        return json.load(f)
+
+
+def compare_reports(base, new, tolerance=0.2, min_seconds=0.5):
+    """
+    Compare the stages of two benchmark reports of the same workload.
+
+    Parameters
+    ----------
+    base : dict or str
+        Reference report or path of its JSON file.
+    new : dict or str
+        Report to be checked or path of its JSON file.
+    tolerance : float
+        Relative increase of a metric considered a regression.
+    min_seconds : float
+        Stages faster than this in both reports are not flagged by time,
+        as their timing is dominated by noise.
+
+    Returns
+    -------
+    comparison : pd.DataFrame
+        Base and new value, ratio and regression flag of the wall time and
+        peak memory of each stage.
+    """
+    base, new = load_report(base), load_report(new)
+    if base['workload'] != new['workload']:
+        raise ValueError('The reports have different workloads')
+    rows = []
+    for stage in STAGES:
+        if stage not in base['stages'] or stage not in new['stages']:
+            continue
+        for metric in ('seconds', 'peak_rss_mb'):
+            base_value = base['stages'][stage][metric]
+            new_value = new['stages'][stage][metric]
+            ratio = new_value / base_value if base_value else float('nan')
+            regression = ratio > 1 + tolerance
+            if metric == 'seconds' and max(base_value, new_value) < min_seconds:
+                regression = False
+            rows.append({'stage': stage, 'metric': metric,
+                         'base': base_value, 'new': new_value,
+                         'ratio': round(ratio, 3),
+                         'regression': regression})
+    return pd.DataFrame(rows)
@@ -0,0 +1,296 @@
+import os
+import numpy as np
+import pandas as pd
+from pyfortracc.utilities.bubble_simulation import draw_bubble
+
+
+def read_workload(path):
+    """
+    Read function of the synthetic frames.
+
+    Parameters
+    ----------
+    path : str
+        Path of the frame.
+
+    Returns
+    -------
+    numpy array
+        2D field of the frame.
+    """
+    return np.load(path)
+
+
+def new_system(rng, y_dim, x_dim, radius, n_levels, life, dateline):
+    """
+    Create a system at a random position with a random size, speed and
+    number of threshold levels. With dateline, a part of the systems is
+    created near the right edge moving east, so it crosses the edge.
+    """
+    r = rng.uniform(*radius)
+    speed = rng.uniform(0.1, 0.4) * r
+    angle = rng.uniform(0, 2 * np.pi)
+    x = rng.uniform(0, x_dim)
+    if dateline and rng.random() < 0.2:
+        x = x_dim - rng.uniform(0, 3 * r)
+        angle = rng.uniform(-np.pi / 4, np.pi / 4)
+    return {'x': x, 'y': rng.uniform(r, y_dim - r),
+            'rx': r * rng.uniform(0.7, 1.3), 'ry': r,
+            'vx': speed * np.cos(angle), 'vy': speed * np.sin(angle),
+            'dr': rng.uniform(-0.05, 0.05) * r,
+            'levels': int(rng.integers(1, n_levels + 1)),
+            'age': 0, 'life': int(rng.integers(*life)), 'target': None}
+
+
+def draw_system(frame, system, thresholds, dateline):
+    """
+    Draw a system as nested ellipses, one for each threshold level, keeping
+    the maximum of the overlapping systems. With dateline, the columns out
+    of the grid are wrapped to the other side.
+    """
+    y_dim, x_dim = frame.shape
+    rx, ry = max(system['rx'], 1), max(system['ry'], 1)
+    x0, y0 = int(np.floor(system['x'] - rx - 1)), int(np.floor(system['y'] - ry - 1))
+    patch = np.zeros((int(2 * ry) + 4, int(2 * rx) + 4), dtype=frame.dtype)
+    # The inner levels are drawn over the outer ones
+    for level in range(system['levels']):
+        scale = 1 - level / (system['levels'] + 1)
+        draw_bubble(patch, system['x'] - x0, system['y'] - y0,
+                    rx * scale, ry * scale, thresholds[level] + 1)
+    rows = np.arange(y0, y0 + patch.shape[0])
+    cols = np.arange(x0, x0 + patch.shape[1])
+    if dateline:
+        cols = cols % x_dim
+    row_in = (rows >= 0) & (rows < y_dim)
+    col_in = (cols >= 0) & (cols < x_dim)
+    patch = patch[row_in][:, col_in]
+    region = np.ix_(rows[row_in], cols[col_in])
+    frame[region] = np.maximum(frame[region], patch)
+
+
+def synthetic_workload(output_dir, y_dim=200, x_dim=400, n_frames=24,
+                       n_clusters=20, merge_rate=0.05, split_rate=0.05,
+                       thresholds=(10, 25, 40), dateline=True, radius=(4, 12),
+                       life=(6, 30), delta_time=10, seed=42):
+    """
+    Generate a synthetic workload of moving elliptical systems, built on
+    the bubbles of bubble_simulation, and the name_list to track it.
+
+    Each system has nested ellipses with the values of its threshold
+    levels, moves with a constant velocity, grows or decays and dies after
+    its lifetime. New systems keep the number of systems near n_clusters.
+    At each frame a system splits with probability split_rate, creating a
+    new system that moves away from it, or starts to move to its nearest
+    system with probability merge_rate, being merged into it when their
+    centers are closer than half of their radii. With dateline, the grid
+    is periodic in x (global grid) and part of the systems cross the right
+    edge, so the edges of the name_list are enabled.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory of the workload. The frames are written at
+        output_dir + 'input/' as '%Y%m%d_%H%M.npy' files.
+    y_dim, x_dim : int
+        Shape of the grid, up to 1800 x 3600 for a global 0.1 degree grid.
+    n_frames : int
+        Number of frames.
+    n_clusters : int
+        Mean number of systems per frame.
+    merge_rate : float
+        Probability of a system to start merging at each frame.
+    split_rate : float
+        Probability of a system to split at each frame.
+    thresholds : tuple
+        Thresholds of the name_list, the systems have from one to
+        len(thresholds) levels.
+    dateline : bool
+        If True, the grid is periodic in x.
+    radius : tuple
+        Range of the radius of the new systems, in pixels.
+    life : tuple
+        Range of the lifetime of the new systems, in frames.
+    delta_time : int
+        Time between frames, in minutes.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    name_list : dict
+        Parameters to track the workload.
+    summary : dict
+        Parameters of the workload and number of generated events.
+    """
+    rng = np.random.default_rng(seed)
+    input_path = output_dir + 'input/'
+    os.makedirs(input_path, exist_ok=True)
+    thresholds = list(thresholds)
+    n_levels = len(thresholds)
+    args = (rng, y_dim, x_dim, radius, n_levels, life, dateline)
+    systems = [new_system(*args) for _ in range(n_clusters)]
+    events = {'new': n_clusters, 'split': 0, 'merge': 0, 'dateline': 0}
+    timestamps = pd.date_range('2000-01-01', periods=n_frames,
+                               freq='{}min'.format(delta_time))
+    for tstamp in timestamps:
+        # Merge the systems that reached their target
+        alive = {id(system) for system in systems}
+        for system in systems:
+            target = system['target']
+            if target is None or id(target) not in alive or \
+                target.get('merged') or system.get('merged'):
+                continue
+            dist = np.hypot(target['x'] - system['x'], target['y'] - system['y'])
+            if dist < (target['ry'] + system['ry']) / 2:
+                target['rx'] = np.hypot(target['rx'], system['rx'])
+                target['ry'] = np.hypot(target['ry'], system['ry'])
+                target['levels'] = max(target['levels'], system['levels'])
+                system['merged'] = True
+                events['merge'] += 1
+        systems = [s for s in systems if not s.get('merged') and
+                   s['age'] < s['life'] and s['ry'] >= 1]
+        # Start merges and splits
+        for system in list(systems):
+            if len(systems) > 1 and system['target'] is None and \
+                rng.random() < merge_rate:
+                others = [s for s in systems if s is not system]
+                dist = [np.hypot(s['x'] - system['x'], s['y'] - system['y'])
+                        for s in others]
+                target = others[int(np.argmin(dist))]
+                # Reach the target in three frames
+                system['target'] = target
+                system['vx'] = (target['x'] - system['x']) / 3
+                system['vy'] = (target['y'] - system['y']) / 3
+            elif rng.random() < split_rate and system['ry'] >= 2 * radius[0]:
+                child = dict(system, age=0, target=None,
+                             levels=int(rng.integers(1, system['levels'] + 1)))
+                for axis in ('rx', 'ry'):
+                    system[axis] *= 0.8
+                    child[axis] *= 0.6
+                child['vx'], child['vy'] = -system['vy'], system['vx']
+                systems.append(child)
+                events['split'] += 1
+        # Keep the number of systems
+        while len(systems) < n_clusters:
+            systems.append(new_system(*args))
+            events['new'] += 1
+        frame = np.zeros((y_dim, x_dim), dtype=np.float32)
+        for system in systems:
+            draw_system(frame, system, thresholds, dateline)
+        np.save(input_path + tstamp.strftime('%Y%m%d_%H%M.npy'), frame)
+        # Move, grow and age the systems
+        for system in systems:
+            system['x'] += system['vx']
+            system['y'] = np.clip(system['y'] + system['vy'], system['ry'],
+                                  y_dim - system['ry'])
+            if dateline and not 0 <= system['x'] < x_dim:
+                system['x'] %= x_dim
+                events['dateline'] += 1
+            elif not dateline:
+                system['x'] = np.clip(system['x'], system['rx'],
+                                      x_dim - system['rx'])
+            system['rx'] += system['dr']
+            system['ry'] += system['dr']
+            system['age'] += 1
+    name_list = {'input_path': input_path,
+                 'output_path': output_dir + 'output/',
+                 'thresholds': thresholds,
+                 'min_cluster_size': [3] * n_levels,
+                 'operator': '>=',
+                 'timestamp_pattern': '%Y%m%d_%H%M.npy',
+                 'delta_time': delta_time,
+                 'edges': dateline,
+                 'y_dim': y_dim,
+                 'x_dim': x_dim}
+    summary = {'y_dim': y_dim, 'x_dim': x_dim, 'n_frames': n_frames,
+               'n_clusters': n_clusters, 'merge_rate': merge_rate,
+               'split_rate': split_rate, 'thresholds': thresholds,
+               'dateline': dateline, 'radius': list(radius),
+               'life': list(life), 'delta_time': delta_time, 'seed': seed,
+               'events': events}
+    return name_list, summary
+
+
+def synthetic_table(output_dir, n_rows=1000000, n_files=1000, life=(1, 40),
+                    inner_rate=0.3, delta_time=10, seed=42):
+    """
+    Generate a synthetic tracking table, used to benchmark the post
+    processing without running the tracking.
+
+    Each cluster has a uid, a random first file and a random lifetime, and
+    one row in each file of its lifetime. A part of the clusters are inner
+    clusters, with an iuid. The files are written at output_dir +
+    'output/track/trackingtable/' as '%Y%m%d_%H%M.parquet' files, indexed
+    by cindex as the tracking table.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory of the workload.
+    n_rows : int
+        Approximate number of rows of the table.
+    n_files : int
+        Number of files (timestamps).
+    life : tuple
+        Range of the lifetime of the clusters, in files.
+    inner_rate : float
+        Fraction of inner clusters.
+    delta_time : int
+        Time between files, in minutes.
+    seed : int
+        Seed of the random generator.
+
+    Returns
+    -------
+    name_list : dict
+        Parameters of the table.
+    summary : dict
+        Parameters of the table and number of rows and clusters.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = int(n_rows / np.mean(life))
+    start = rng.integers(0, n_files, n_clusters)
+    end = np.minimum(start + rng.integers(*life, n_clusters), n_files)
+    uid = np.arange(1, n_clusters + 1, dtype=float)
+    iuid = np.where(rng.random(n_clusters) < inner_rate,
+                    uid + rng.random(n_clusters), np.nan)
+    # One row for each file of the lifetime of each cluster
+    lengths = end - start
+    cluster = np.repeat(np.arange(n_clusters), lengths)
+    file_id = start[cluster] + np.arange(len(cluster)) - \
+        np.repeat(np.cumsum(lengths) - lengths, lengths)
+    order = np.argsort(file_id, kind='stable')
+    cluster, file_id = cluster[order], file_id[order]
+    timestamps = pd.date_range('2000-01-01', periods=n_files,
+                               freq='{}min'.format(delta_time))
+    table = pd.DataFrame({'timestamp': timestamps[file_id],
+                          'uid': uid[cluster],
+                          'iuid': iuid[cluster],
+                          'threshold_level': np.isfinite(iuid[cluster]).astype(int),
+                          'size': rng.integers(3, 500, len(cluster)),
+                          'lifetime': (file_id - start[cluster]) * delta_time,
+                          'status': np.where(file_id == start[cluster], 'NEW',
+                                             'CON'),
+                          'geometry': 'POLYGON ((0 0, 1 0, 1 1, 0 1, 0 0))'})
+    table.index.name = 'cindex'
+    output_path = output_dir + 'output/'
+    table_path = output_path + 'track/trackingtable/'
+    os.makedirs(table_path, exist_ok=True)
+    bounds = np.searchsorted(file_id, np.arange(n_files + 1))
+    for ff, tstamp in enumerate(timestamps):
+        table.iloc[bounds[ff]:bounds[ff + 1]].to_parquet(
+            table_path + tstamp.strftime('%Y%m%d_%H%M.parquet'))
+    name_list = {'input_path': output_dir + 'input/',
+                 'output_path': output_path,
+                 'thresholds': [10, 25],
+                 'min_cluster_size': [3, 3],
+                 'operator': '>=',
+                 'timestamp_pattern': '%Y%m%d_%H%M.npy',
+                 'delta_time': delta_time,
+                 'y_dim': 1,
+                 'x_dim': 1}
+    summary = {'n_rows': len(table), 'n_files': n_files,
+               'n_clusters': n_clusters, 'life': list(life),
+               'inner_rate': inner_rate, 'delta_time': delta_time,
+               'seed': seed}
+    return name_list, summary
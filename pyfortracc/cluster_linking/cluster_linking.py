@@ -1,19 +1,28 @@
+import numpy as np
 import pandas as pd
 import pathlib
+import pyarrow.parquet as pq
 from pyfortracc.default_parameters import default_parameters
 from pyfortracc.utilities.utils import (get_feature_files, create_dirs, 
                                         get_loading_bar, get_featstamp,
                                         set_schema, set_outputdf,
                                         read_parquet, write_parquet,
-                                        check_operational_system)
+                                        check_operational_system,
+                                        set_nworkers, parquet_options)
+from pyfortracc.utilities.manifest import stage_files, set_stage
+from pyfortracc.utilities.executor import worker_map
+from pyfortracc.utilities.profiler import profile_step, file_size
 from .new_frame import new_frame
 from .max_uid import update_max_uid
 from .board_clusters import board_clusters
 from .refact_inside import refact_inside
 from .merge_trajectory import merge_trajectory
+from .stitch_blocks import (link_sources, orphan_clusters, uid_table,
+                            remap_frame, iuid_draws, stitch_iuids,
+                            stitch_frame)
 
 
-def cluster_linking(name_lst):
+def cluster_linking(name_lst, parallel=False):
     """
     The function links clusters over time, ensuring that clusters in different frames (representing different time points) 
     are identified and associated with each other based on spatial and temporal proximity.
@@ -22,18 +31,24 @@ def cluster_linking(name_lst):
     ----------
     name_lst : dict
         Dictionary with the parameters to be used.
+    parallel : bool
+        If True and name_lst['parallel_linking'] is set, contiguous blocks
+        of files are linked in parallel and stitched by chunked_linking.
     """
     print('Cluster linking:')
     # Set default parameters
     name_lst = default_parameters(name_lst)
     # Check operational system
-    name_lst, _ = check_operational_system(name_lst, False)
+    name_lst, parallel = check_operational_system(name_lst, parallel)
     # Get feature files to be processed
     feat_path = name_lst['output_path'] + 'track/processing/spatial/'
     output_path = name_lst['output_path'] + 'track/processing/linked/'
     name_lst['output_spatial'] = output_path
-    feat_files = get_feature_files(feat_path)
+    feat_files = stage_files(name_lst, 'spatial')
+    if feat_files is None:
+        feat_files = get_feature_files(feat_path)
     create_dirs(output_path)
+    set_stage(name_lst, 'linked')
     loading_bar = get_loading_bar(feat_files)
     # Get number of prev_files to skip based on the number of prev_time
     prev_skip = name_lst['num_prev_skip']
@@ -54,6 +69,15 @@ def cluster_linking(name_lst):
     prv_stamp = get_featstamp(feat_files[0]) - dt_time
     # Set idx counter is used to create cindex
     cdx = 0
+    # Link blocks in parallel if there are at least two files per block
+    if parallel and name_lst['parallel_linking'] and \
+        set_nworkers(name_lst) > 1 and \
+        len(feat_files) >= 2 * set_nworkers(name_lst):
+        chunked_linking(feat_files, name_lst, prv_stamp, max_dt_time,
+                        schema, loading_bar)
+        loading_bar.close()
+        set_stage(name_lst, 'linked', output_path)
+        return
     for feat_time, feat_file in enumerate(feat_files):
         prv_frame, prv_stamp, uid_iter, cdx = linking((feat_time, feat_file, 
                                                 prv_frame, prv_stamp,
@@ -61,9 +85,242 @@ def cluster_linking(name_lst):
                                                 max_dt_time, schema, cdx))
         loading_bar.update(1)
     loading_bar.close()
+    set_stage(name_lst, 'linked', output_path)
     return
 
 
+def chunked_linking(feat_files, name_lst, prv_stamp, max_dt, schm,
+                    loading_bar):
+    """
+    Link the clusters in contiguous blocks of files in parallel.
+
+    Each block is linked by link_block with provisional uids, starting from
+    the last file of the previous block (seed frame). The blocks are stitched
+    in order: the provisional uids are replaced by a lookup table built from
+    the seed frame, and the lifetime and trajectory of the clusters that come
+    from the seed frame are carried from the previous block. The workers
+    draw the random decimals of the iuids from copies of the same random
+    state, so the new iuids of each block, including the first one, are
+    drawn again in the order of the serial linking (stitch_iuids). The
+    cindex does not need stitching, because it only depends on the number
+    of clusters of the previous files. A block that can not be remapped is
+    linked again serially. The output is the same of the serial linking, as
+    checked by tests/linking_parity.py.
+
+    Parameters
+    ----------
+    feat_files : list
+        Spatial files to be linked.
+    name_lst : dict
+        Dictionary with the parameters to be used.
+    prv_stamp : pandas.Timestamp
+        The timestamp previous to the first file.
+    max_dt : pandas.Timedelta
+        The maximum allowed time difference between frames.
+    schm : np.dtype
+        Schema of the linked dataframe.
+    loading_bar : tqdm
+        Loading bar updated for each file.
+    """
+    n_workers = set_nworkers(name_lst)
+    # An empty frame increments the cindex by one
+    n_rows = np.array([pq.ParquetFile(file).metadata.num_rows
+                       for file in feat_files])
+    cdx_start = np.concatenate(([1], 1 + np.cumsum(np.maximum(n_rows, 1))))
+    blocks = np.array_split(np.arange(len(feat_files)), n_workers)
+    args = [(block, feat_files, prv_stamp, name_lst, max_dt, schm, cdx_start)
+            for block in blocks]
+    prv_true, prv_stamp_true = pd.DataFrame(), prv_stamp
+    uid_iter = name_lst['initial_uid']
+    for block, result in zip(blocks, worker_map(link_block, args, name_lst,
+                                                ordered=True)):
+        seed_uid_iter, end_uid_iter, seed_df, frames, orphan = result
+        stitched = stitch_block(frames, seed_df, prv_true, orphan,
+                                seed_uid_iter, end_uid_iter, uid_iter)
+        if stitched is not None:
+            uid_iter = end_uid_iter - seed_uid_iter + uid_iter
+        if stitched is None:
+            # Link the block again from the previous block
+            stitched = []
+            prv_frame, prv_stmp = prv_true, prv_stamp_true
+            for time_ in block:
+                cur_file = feat_files[time_]
+                cur_frame = read_parquet(cur_file, linking_columns())
+                prv_frame, linked_df, prv_stmp, uid_iter, _ = link_frame((
+                                        time_, cur_frame,
+                                        get_featstamp(cur_file),
+                                        prv_frame, prv_stmp, name_lst,
+                                        uid_iter, max_dt, schm,
+                                        cdx_start[time_] - 1))
+                stitched.append((time_, linked_df))
+        # Write the linked files of the block
+        for time_, linked_df in stitched:
+            output_file = name_lst['output_spatial'] + \
+                            pathlib.Path(feat_files[time_]).name
+            with profile_step(name_lst, 'linked', 'write',
+                              pathlib.Path(output_file).stem) as rec:
+                write_parquet(linked_df, output_file,
+                              parquet_options(name_lst))
+                rec['bytes'] = file_size(output_file)
+            # Previous stamp is kept for empty frames
+            if not linked_df.empty:
+                prv_stamp_true = get_featstamp(feat_files[time_])
+            loading_bar.update(1)
+        prv_true = stitched[-1][1]
+
+
+def stitch_block(frames, seed_df, prv_true, orphan, seed_uid_iter,
+                 end_uid_iter, uid_iter):
+    """
+    Replace the provisional uids, iuids, lifetime and trajectory of a block
+    linked by link_block with the values of the serial linking.
+
+    Parameters
+    ----------
+    frames : list
+        Frames returned by link_block.
+    seed_df : pandas.DataFrame
+        Seed frame linked inside the block.
+    prv_true : pandas.DataFrame
+        Last frame of the previous block, that is the seed frame linked
+        by the previous block.
+    orphan : bool
+        True if any file of the block has orphan inner clusters.
+    seed_uid_iter : int
+        Provisional uid iterator after the seed frame.
+    end_uid_iter : int
+        Provisional uid iterator at the end of the block.
+    uid_iter : int
+        Uid iterator of the serial linking at the start of the block.
+
+    Returns
+    -------
+    stitched : list or None
+        Time and linked frame of each file. None if the block can not be
+        stitched and must be linked again.
+    """
+    if orphan:
+        return None
+    lut = uid_table(seed_df, prv_true, seed_uid_iter, end_uid_iter, uid_iter)
+    if lut is None:
+        return None
+    # Lifetime offset of the seed frame, the seed clusters are new in the block
+    prv_prov = seed_df
+    prv_offset = np.zeros(len(seed_df))
+    if not seed_df.empty:
+        prv_offset = prv_true['lifetime'].values - seed_df['lifetime'].values
+    stitched = []
+    for time_, linked_df, raw_traj, traj_src, life_src, draws in frames:
+        prov_df = linked_df
+        linked_df, mapped = remap_frame(linked_df.copy(), lut)
+        if not mapped:
+            return None
+        linked_df = stitch_iuids(linked_df, prov_df, draws, prv_true, prv_prov)
+        if linked_df is None:
+            return None
+        if traj_src is None:
+            prv_offset = np.zeros(len(linked_df))
+        else:
+            linked_df, prv_offset = stitch_frame(linked_df, raw_traj, traj_src,
+                                                 life_src, prv_true, prv_prov,
+                                                 prv_offset)
+        prv_prov, prv_true = prov_df, linked_df
+        stitched.append((time_, linked_df))
+    return stitched
+
+
+def link_block(args):
+    """
+    Link a contiguous block of spatial files with provisional uids.
+
+    The block starts linking the last file of the previous block (seed frame)
+    as a new frame, so the clusters of the first file of the block are linked
+    to it. The provisional uids start at 1 and are replaced by chunked_linking.
+
+    Parameters
+    ----------
+    args : tuple
+        A tuple containing the following elements:
+        - block (numpy array): Positions of the files of the block.
+        - feat_files (list): Spatial files to be linked.
+        - prv_stamp (pandas.Timestamp): The timestamp previous to the first file.
+        - nm_lst (dict): A dictionary with necessary parameters.
+        - max_dt (pandas.Timedelta): The maximum allowed time difference between frames.
+        - schm (np.dtype): Schema of the linked dataframe.
+        - cdx_start (numpy array): First cindex of each file.
+
+    Returns
+    -------
+    tuple
+        A tuple containing the following elements:
+        - seed_uid_iter (int): Uid iterator after the seed frame.
+        - uid_iter (int): Uid iterator at the end of the block.
+        - seed_df (pandas.DataFrame): Linked seed frame.
+        - frames (list): Time, linked frame, spatial trajectories, sources
+          of trajectory and lifetime and positions of the new iuids of each
+          file, the sources are None if the file is not linked with the
+          previous file.
+        - orphan (bool): True if any file has orphan inner clusters.
+    """
+    block, feat_files, prv_stamp, nm_lst, max_dt, schm, cdx_start = args
+    uid_iter = nm_lst['initial_uid']
+    prv_frame, seed_df = pd.DataFrame(), pd.DataFrame()
+    orphan = False
+    if block[0] > 0:
+        uid_iter = 1
+        seed_file = feat_files[block[0] - 1]
+        seed_frame = read_parquet(seed_file, linking_columns())
+        orphan = orphan_clusters(seed_frame, False)
+        # All clusters of the seed frame receive a provisional uid
+        seed_frame['status'] = 'NEW'
+        prv_frame, seed_df, prv_stamp, uid_iter, _ = link_frame((0,
+                                            seed_frame,
+                                            get_featstamp(seed_file),
+                                            prv_frame, prv_stamp, nm_lst,
+                                            uid_iter, max_dt, schm, 0))
+    seed_uid_iter = uid_iter
+    frames = []
+    for time_ in block:
+        cur_file = feat_files[time_]
+        with profile_step(nm_lst, 'linked', 'frame',
+                          pathlib.Path(cur_file).stem) as rec:
+            with profile_step(nm_lst, 'linked', 'read',
+                              bytes=file_size(cur_file)):
+                cur_frame = read_parquet(cur_file, linking_columns())
+            cur_stamp = get_featstamp(cur_file)
+            # Same conditions of link_frame to link with the previous frame
+            linked = not (time_ == 0 or prv_frame.empty or cur_frame.empty or
+                          cur_stamp - prv_stamp > max_dt)
+            raw_traj, traj_src, life_src = None, None, None
+            if linked:
+                raw_traj = cur_frame['trajectory'].values.copy()
+                traj_src, life_src = link_sources(cur_frame, nm_lst)
+            orphan = orphan or orphan_clusters(cur_frame, linked)
+            with profile_step(nm_lst, 'linked', 'linking'):
+                prv_frame, linked_df, prv_stamp, uid_iter, _ = link_frame((
+                                            time_, cur_frame, cur_stamp,
+                                            prv_frame, prv_stamp, nm_lst,
+                                            uid_iter, max_dt, schm,
+                                            cdx_start[time_] - 1))
+            rec['clusters'] = len(linked_df)
+        frames.append((time_, linked_df, raw_traj, traj_src, life_src,
+                       iuid_draws(prv_frame)))
+    return seed_uid_iter, uid_iter, seed_df, frames, orphan
+
+
+def linking_columns():
+    """
+    Columns of the spatial files used by link_frame.
+
+    Returns
+    -------
+    list
+        Names of the columns.
+    """
+    return ['status', 'threshold_level', 'past_idx', 'inside_idx',
+            'merge_idx', 'split_pr_idx', 'board', 'board_idx', 'trajectory']
+
+
 def linking(args):
     """
     Links clusters between the current and previous frames, updates their unique identifiers (UIDs), 
@@ -93,15 +350,64 @@ def linking(args):
         - icdx (int): The updated index counter.
     """
     time_, cur_file, prv_frame, prv_stamp, nm_lst, uid_iter, max_dt, schm, icdx = args
-    # Read current file        print('Empty frame:', cur_file)
-    cur_frame = read_parquet(cur_file, ['status','threshold_level',
-                                        'past_idx','inside_idx',
-                                        'board','board_idx',
-                                        'trajectory'])
-    # Set output file
-    output_file = nm_lst['output_spatial'] + pathlib.Path(cur_file).name
-    # Replace any /spatial/ in the output file path with /linked/
-    output_file = output_file.replace('/spatial/', '/linked/')
+    with profile_step(nm_lst, 'linked', 'frame',
+                      pathlib.Path(cur_file).stem) as rec:
+        # Read current file        print('Empty frame:', cur_file)
+        with profile_step(nm_lst, 'linked', 'read', bytes=file_size(cur_file)):
+            cur_frame = read_parquet(cur_file, linking_columns())
+        # Set output file
+        output_file = nm_lst['output_spatial'] + pathlib.Path(cur_file).name
+        # Replace any /spatial/ in the output file path with /linked/
+        output_file = output_file.replace('/spatial/', '/linked/')
+        # Get current stamp
+        cur_stamp = get_featstamp(cur_file)
+        # Link the current frame and write linked file
+        with profile_step(nm_lst, 'linked', 'linking'):
+            cur_frame, linked_df, cur_stamp, uid_iter, icdx = link_frame((
+                                                    time_, cur_frame,
+                                                    cur_stamp, prv_frame,
+                                                    prv_stamp, nm_lst,
+                                                    uid_iter, max_dt, schm,
+                                                    icdx))
+        with profile_step(nm_lst, 'linked', 'write') as write_rec:
+            write_parquet(linked_df, output_file, parquet_options(nm_lst))
+            write_rec['bytes'] = file_size(output_file)
+        rec['clusters'] = len(linked_df)
+    return cur_frame, cur_stamp, uid_iter, icdx
+
+
+def link_frame(args):
+    """
+    Links the clusters of a frame already in memory with the previous frame.
+
+    Parameters
+    ----------
+    args : tuple
+        A tuple containing the following elements:
+        - time_ (int): The current time step index.
+        - cur_frame (pandas.DataFrame): The spatial DataFrame of the current frame.
+        - cur_stamp (pandas.Timestamp): The timestamp of the current frame.
+        - prv_frame (pandas.DataFrame): The DataFrame of the previous frame.
+        - prv_stamp (pandas.Timestamp): The timestamp of the previous frame.
+        - nm_lst (dict): A dictionary with necessary parameters.
+        - uid_iter (int): The current UID iterator used to assign new UIDs.
+        - max_dt (pandas.Timedelta): The maximum allowed time difference between frames.
+        - schm (pandas.DataFrame): The schema for the output DataFrame.
+        - icdx (int): The current index counter.
+
+    Returns
+    -------
+    tuple
+        A tuple containing the following elements:
+        - cur_frame (pandas.DataFrame): The processed DataFrame of the current frame.
+        - linked_df (pandas.DataFrame): The linked columns of the current frame.
+        - cur_stamp (pandas.Timestamp): The timestamp of the linked frame,
+          the previous timestamp is kept if the current frame is empty.
+        - uid_iter (int): The updated UID iterator.
+        - icdx (int): The updated index counter.
+    """
+    (time_, cur_frame, cur_stamp, prv_frame, prv_stamp,
+     nm_lst, uid_iter, max_dt, schm, icdx) = args
     icdx += 1 # Increment cindex 
     #create columns 
     cur_frame['prv_mrg_uids'] = [None]*len(cur_frame)
@@ -118,8 +424,7 @@ def linking(args):
         # Calculate lifetime
         cur_frame['lifetime'] = []
         cur_frame['lifetime'] = cur_frame['lifetime'].fillna(0)
-        write_parquet(cur_frame, output_file)
-        return cur_frame, prv_stamp, uid_iter, icdx
+        return cur_frame, cur_frame, prv_stamp, uid_iter, icdx
     # Get schema and cols
     link_df = set_outputdf(schm)
     linked_cols = list(link_df.columns)
@@ -128,8 +433,6 @@ def linking(args):
     cdx_range = range(icdx, icdx + len(cur_frame))
     cur_frame['cindex'] = cdx_range
     cur_frame = pd.concat([cur_frame, link_df])
-    # Get current stamp
-    cur_stamp = get_featstamp(cur_file)
     # Calculate delta time
     dt_time = cur_stamp - prv_stamp
     # Conditions to enter in this conditional below:
@@ -149,9 +452,7 @@ def linking(args):
         uid_iter = update_max_uid(cur_frame['uid'].max(), uid_iter)
         # Set lifetime equals to name_lst['delta_time']
         cur_frame['lifetime'] = nm_lst['delta_time']
-        # Write linked file
-        write_parquet(cur_frame[linked_cols], output_file)
-        return cur_frame, cur_stamp, uid_iter, cdx_range[-1]
+        return cur_frame, cur_frame[linked_cols], cur_stamp, uid_iter, cdx_range[-1]
     # Get previous indx based for conditions:
     #  - prev_idx is not null
     #  - status is not NEW
@@ -212,6 +513,4 @@ def linking(args):
             cur_frame.loc[split_frs.index, 'lifetime'] = lifetimes.values
     # Fill NaN values to 0
     cur_frame['lifetime'] = cur_frame['lifetime'].fillna(nm_lst['delta_time'])
-    # Write linked file
-    write_parquet(cur_frame[linked_cols], output_file)
-    return cur_frame, cur_stamp, uid_iter, cdx_range[-1]
+    return cur_frame, cur_frame[linked_cols], cur_stamp, uid_iter, cdx_range[-1]
@@ -45,6 +45,9 @@ def refact_inside(cur_frme, uid_iter):
     insd['iuid'] = insd['iuid'].astype(float)
     cur_frme.loc[insd.index, 'uid'] = insd['iuid'].astype(int).values
     cur_frme.loc[insd.index, 'iuid'] = insd['iuid'].values
+    # Order of the new iuids, used by chunked_linking to draw them again
+    cur_frme['iuid_draw'] = -1
+    cur_frme.loc[insd.index, 'iuid_draw'] = np.arange(len(insd))
     # Find any uid or iuid is null
     null_uid = cur_frme.loc[cur_frme['uid'].isnull()]
     # TODO: Check error in line 54: ValueError: arange: cannot compute length
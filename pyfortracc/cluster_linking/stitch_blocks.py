@@ -0,0 +1,336 @@
+import numpy as np
+import pandas as pd
+import shapely
+from .merge_trajectory import merge_lines
+
+
+def link_sources(cur_frame, nm_lst):
+    """
+    Get the positions in the previous frame that each cluster of the current
+    frame inherits its trajectory and lifetime from, following the same rules
+    of link_frame.
+
+    Parameters
+    ----------
+    cur_frame : pandas.DataFrame
+        Spatial dataframe of the current frame.
+    nm_lst : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    traj_src : numpy array
+        Previous position of the trajectory of each cluster, -1 if none.
+    life_src : numpy array
+        Previous position of the lifetime of each cluster, -1 if none.
+    """
+    linked = (cur_frame['past_idx'].notnull() &
+              ~cur_frame['status'].str.contains('NEW')).values
+    traj_src = np.full(len(cur_frame), -1, dtype=np.int64)
+    traj_src[linked] = cur_frame['past_idx'].values[linked].astype(int)
+    life_src = traj_src.copy()
+    if nm_lst['preserv_split']:
+        split = cur_frame['split_pr_idx'].notnull().values
+        life_src[split] = cur_frame['split_pr_idx'].values[split].astype(int)
+    return traj_src, life_src
+
+
+def orphan_clusters(cur_frame, linked):
+    """
+    Check if the frame has inner clusters that are not inside any cluster of
+    the base threshold and do not come from the previous frame. The uids of
+    these clusters are created from the maximum uid of the frame by
+    refact_inside, so they can not be remapped between blocks.
+
+    Parameters
+    ----------
+    cur_frame : pandas.DataFrame
+        Spatial dataframe of the current frame.
+    linked : bool
+        True if the frame is linked with the previous frame.
+
+    Returns
+    -------
+    bool
+        True if the frame has orphan inner clusters.
+    """
+    base = cur_frame.loc[cur_frame['threshold_level'] == 0, 'inside_idx']
+    inside = base.dropna().explode().dropna().values.astype(int)
+    orphan = ((cur_frame['threshold_level'] > 0).values &
+              ~np.isin(np.arange(len(cur_frame)), inside))
+    if linked:
+        orphan = orphan & (cur_frame['past_idx'].isnull() |
+                           cur_frame['status'].str.contains('NEW')).values
+    return bool(orphan.any())
+
+
+def uid_table(seed_prov, seed_true, seed_uid_iter, end_uid_iter, uid_iter):
+    """
+    Build the lookup table from the provisional uids of a block to the uids
+    of the serial linking.
+
+    The uids of the seed frame (last frame of the previous block) are mapped
+    to the uids of the same clusters in the previous block, and the uids
+    created inside the block are shifted to start at uid_iter.
+
+    Parameters
+    ----------
+    seed_prov : pandas.DataFrame
+        Seed frame linked inside the block.
+    seed_true : pandas.DataFrame
+        Seed frame linked by the previous block.
+    seed_uid_iter : int
+        Provisional uid iterator after the seed frame.
+    end_uid_iter : int
+        Provisional uid iterator at the end of the block.
+    uid_iter : int
+        Uid iterator of the serial linking at the start of the block.
+
+    Returns
+    -------
+    lut : numpy array or None
+        Lookup table indexed by the provisional uid. None if the uids of
+        the seed frame are not a one to one map.
+    """
+    seed_uid_iter, end_uid_iter = int(seed_uid_iter), int(end_uid_iter)
+    lut = np.full(max(end_uid_iter, seed_uid_iter) + 1, np.nan)
+    if not seed_prov.empty:
+        pairs = pd.DataFrame({'prov': seed_prov['uid'].values,
+                              'true': seed_true['uid'].values}).dropna()
+        pairs = pairs.drop_duplicates()
+        # Each provisional uid must have a single uid and each uid a single
+        # provisional uid, otherwise refact_inside can give new iuids to
+        # other clusters than the serial linking
+        if pairs['prov'].duplicated().any() or \
+            pairs['true'].duplicated().any():
+            return None
+        lut[pairs['prov'].values.astype(int)] = pairs['true'].values
+    new_uids = np.arange(seed_uid_iter, len(lut))
+    lut[new_uids] = new_uids - seed_uid_iter + uid_iter
+    return lut
+
+
+def remap_uid(uid, lut):
+    """
+    Replace a uid by the uid of the lookup table, keeping its type.
+
+    Parameters
+    ----------
+    uid : int or float
+        Provisional uid.
+    lut : numpy array
+        Lookup table of the uids.
+
+    Returns
+    -------
+    int or float
+        Uid of the lookup table.
+    """
+    if uid is None or pd.isna(uid):
+        return uid
+    return type(uid)(lut[int(uid)])
+
+
+def remap_frame(linked_df, lut):
+    """
+    Remap the uid columns of a linked frame with the lookup table. The iuids
+    are replaced by stitch_iuids.
+
+    Parameters
+    ----------
+    linked_df : pandas.DataFrame
+        Linked frame with provisional uids.
+    lut : numpy array
+        Lookup table of the uids.
+
+    Returns
+    -------
+    linked_df : pandas.DataFrame
+        Linked frame with the uids of the serial linking.
+    bool
+        False if any uid is not in the lookup table.
+    """
+    if linked_df.empty:
+        return linked_df, True
+    uids = linked_df['uid'].values
+    if np.isnan(uids.astype(float)).any() or uids.max() >= len(lut):
+        return linked_df, False
+    new_uids = lut[uids.astype(int)]
+    if np.isnan(new_uids).any():
+        return linked_df, False
+    linked_df['uid'] = new_uids.astype(uids.dtype)
+    linked_df['prv_spl_uid'] = [remap_uid(uid, lut)
+                                for uid in linked_df['prv_spl_uid'].values]
+    linked_df['prv_mrg_uids'] = [uids if uids is None else
+                                 [remap_uid(uid, lut) for uid in uids]
+                                 for uids in linked_df['prv_mrg_uids'].values]
+    return linked_df, True
+
+
+def iuid_draws(cur_frame):
+    """
+    Get the positions of the clusters that received a new iuid from
+    refact_inside, in the order of the random draws.
+
+    Parameters
+    ----------
+    cur_frame : pandas.DataFrame
+        Frame returned by link_frame.
+
+    Returns
+    -------
+    numpy array
+        Positions of the new iuids in the order they were drawn.
+    """
+    if 'iuid_draw' not in cur_frame.columns:
+        return np.array([], dtype=np.int64)
+    order = cur_frame['iuid_draw'].values
+    rows = np.flatnonzero(order >= 0)
+    return rows[np.argsort(order[rows])]
+
+
+def stitch_iuids(linked_df, prov_df, draws, prv_true, prv_prov):
+    """
+    Replace the provisional iuids of a linked frame of a block with the
+    iuids of the serial linking.
+
+    The iuids of the previous frame are followed by their provisional iuid.
+    The new iuids of the frame are drawn again in the order of
+    refact_inside, so the blocks use the random numbers of the serial
+    linking, and not the numbers of the worker.
+
+    Parameters
+    ----------
+    linked_df : pandas.DataFrame
+        Linked frame with the uids already remapped.
+    prov_df : pandas.DataFrame
+        Linked frame with the provisional uids.
+    draws : numpy array
+        Positions of the new iuids in the order they were drawn.
+    prv_true : pandas.DataFrame
+        Previous frame of the serial linking.
+    prv_prov : pandas.DataFrame
+        Previous frame linked inside the block.
+
+    Returns
+    -------
+    linked_df : pandas.DataFrame or None
+        Linked frame with the iuids of the serial linking. None if a
+        provisional iuid of the previous frame has more than one iuid.
+    """
+    if linked_df.empty:
+        return linked_df
+    # Iuids of the previous frame by provisional iuid
+    iuids = {}
+    if not prv_prov.empty:
+        pairs = pd.DataFrame({'prov': prv_prov['iuid'].values.astype(float),
+                              'true': prv_true['iuid'].values.astype(float)})
+        pairs = pairs.dropna(subset=['prov']).drop_duplicates()
+        if pairs['prov'].duplicated().any():
+            return None
+        iuids = dict(zip(pairs['prov'].values, pairs['true'].values))
+    prov_iuid = prov_df['iuid'].values.astype(float)
+    carried = ~np.isnan(prov_iuid)
+    carried[draws] = False
+    refs = [iuid for mrg in prov_df['prv_mrg_iuids'].values if mrg is not None
+            for iuid in mrg] + list(prov_df['prv_spl_iuid'].values)
+    refs = list(prov_iuid[carried]) + [iuid for iuid in refs
+                                       if not pd.isna(iuid)]
+    if any(iuid not in iuids for iuid in refs):
+        return None
+    iuid = np.full(len(linked_df), np.nan)
+    iuid[carried] = [iuids[prov] for prov in prov_iuid[carried]]
+    uids = linked_df['uid'].values
+    levels = linked_df['threshold_level'].values
+    for row in draws:
+        iuid[row] = float(str(int(uids[row])) + '.' +
+                          '0' * int(levels[row] - 1) +
+                          str(np.random.randint(1, 999)))
+    linked_df['iuid'] = iuid
+    linked_df['prv_spl_iuid'] = [iuid if iuid is None or pd.isna(iuid) else
+                                 iuids[iuid]
+                                 for iuid in prov_df['prv_spl_iuid'].values]
+    linked_df['prv_mrg_iuids'] = [mrg if mrg is None else
+                                  [iuid if iuid is None or pd.isna(iuid) else
+                                   iuids[iuid] for iuid in mrg]
+                                  for mrg in prov_df['prv_mrg_iuids'].values]
+    return linked_df
+
+
+def merge_trajs(prev_traj, cur_traj):
+    """
+    Merge the trajectories of the previous clusters with the trajectories of
+    the current clusters, following the same rules of merge_trajectory.
+
+    Parameters
+    ----------
+    prev_traj : numpy array
+        Merged trajectories of the previous clusters, as wkt.
+    cur_traj : numpy array
+        Trajectories of the current clusters from the spatial operations, as wkt.
+
+    Returns
+    -------
+    trajectory : numpy array
+        Merged trajectories of the current clusters, as wkt.
+    """
+    trajectory = cur_traj.copy()
+    merge = ((cur_traj != 'LINESTRING EMPTY') &
+             (prev_traj != 'LINESTRING EMPTY') &
+             (prev_traj != 'GEOMETRYCOLLECTION EMPTY'))
+    if merge.any():
+        merged = pd.DataFrame({'cur_traj': shapely.from_wkt(cur_traj[merge]),
+                               'prev_traj': shapely.from_wkt(prev_traj[merge])})
+        trajectory[merge] = [str(merge_lines(row))
+                             for row in merged.itertuples()]
+    return trajectory
+
+
+def stitch_frame(linked_df, raw_traj, traj_src, life_src, prv_true, prv_prov,
+                 prv_offset):
+    """
+    Carry the lifetime and trajectory of the previous frame of the serial
+    linking into a linked frame of a block.
+
+    Parameters
+    ----------
+    linked_df : pandas.DataFrame
+        Linked frame with the uids already remapped.
+    raw_traj : numpy array
+        Trajectories of the frame from the spatial operations.
+    traj_src : numpy array
+        Previous position of the trajectory of each cluster, -1 if none.
+    life_src : numpy array
+        Previous position of the lifetime of each cluster, -1 if none.
+    prv_true : pandas.DataFrame
+        Previous frame of the serial linking.
+    prv_prov : pandas.DataFrame
+        Previous frame linked inside the block.
+    prv_offset : numpy array
+        Lifetime offset between prv_true and prv_prov.
+
+    Returns
+    -------
+    linked_df : pandas.DataFrame
+        Linked frame with lifetime and trajectory of the serial linking.
+    offset : numpy array
+        Lifetime offset between the returned frame and linked_df.
+    """
+    prov_traj = linked_df['trajectory'].values
+    offset = np.zeros(len(linked_df))
+    if len(prv_offset) > 0:
+        has_src = life_src >= 0
+        offset[has_src] = prv_offset[life_src[has_src]]
+        linked_df['lifetime'] = linked_df['lifetime'] + offset.astype(
+                                        linked_df['lifetime'].dtype)
+        # Trajectories are merged again only if the previous trajectory changed
+        prv_traj = prv_true['trajectory'].values
+        changed = prv_traj != prv_prov['trajectory'].values
+        rows = np.where(traj_src >= 0)[0]
+        rows = rows[changed[traj_src[rows]]]
+        if len(rows) > 0:
+            trajectory = prov_traj.copy()
+            trajectory[rows] = merge_trajs(prv_traj[traj_src[rows]],
+                                           raw_traj[rows])
+            linked_df['trajectory'] = trajectory
+    return linked_df, offset
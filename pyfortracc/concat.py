@@ -4,10 +4,15 @@ import os
 import shutil
 import pandas as pd
 import pyarrow as pa
+import pyarrow.parquet as pq
 import pathlib
 from pyarrow.lib import Schema
-from multiprocessing import Pool
-from pyfortracc.utilities.utils import get_loading_bar, set_nworkers, check_operational_system
+from pyfortracc.utilities.utils import (get_loading_bar,
+                                        check_operational_system,
+                                        get_featstamp, parquet_options)
+from pyfortracc.utilities.manifest import stage_files, set_stage
+from pyfortracc.utilities.executor import worker_map
+from pyfortracc.utilities.profiler import profile_step, file_size
 from pyfortracc.default_parameters import default_parameters
 
 
@@ -19,6 +24,11 @@ def concat(name_list, mode='track', clean=True, parallel=True):
     trackingtable if the processing is track or directory.
     The parquet file contains the following columns:
 
+    If name_list['concat_dataset'] is True, the results are written as a
+    single dataset partitioned by date (one file per day) at the
+    output_path/trackingdataset or output_path/forecastdataset directory,
+    instead of one file per timestamp.
+
     Parameters
     -------
     name_list : dict
@@ -44,8 +54,12 @@ def concat(name_list, mode='track', clean=True, parallel=True):
         name_list['concat_path'] = name_list['output_path']
     if mode == 'track':
         output_path = name_list['concat_path'] + 'track/trackingtable/'
+        if name_list['concat_dataset']:
+            output_path = name_list['concat_path'] + 'track/trackingdataset/'
     elif mode == 'forecast':
         output_path = name_list['concat_path'] + 'forecast/forecastable/'
+        if name_list['concat_dataset']:
+            output_path = name_list['concat_path'] + 'forecast/forecastdataset/'
     else:
         raise ValueError('Invalid mode')
     # Check if proc_path exists
@@ -53,51 +67,206 @@ def concat(name_list, mode='track', clean=True, parallel=True):
         print('No files to concatenate, the trackingtable already exists')
         print(output_path)
         return
-    # Feature files
-    fet_files = sorted(glob.glob(proc_path + 'features/*.parquet'))
-    spt_files = sorted(glob.glob(proc_path + 'spatial/*.parquet'))
-    lnk_files = sorted(glob.glob(proc_path + 'linked/*.parquet'))
+    # Feature files, listed from the manifest if the stages were completed
+    stage_lists = []
+    for stage in ('features', 'spatial', 'linked'):
+        files = stage_files(name_list, stage) if mode == 'track' else None
+        if files is None:
+            files = sorted(glob.glob(proc_path + stage + '/*.parquet'))
+        stage_lists.append(files)
+    fet_files, spt_files, lnk_files = stage_lists
     # Set default columns
     if name_list['default_columns']:
         default_cols = default_columns(name_list)
         if name_list['validation_scores']:
-            last_spt = pd.read_parquet(spt_files[-1])
-            concat_cols = last_spt.columns
+            concat_cols = pq.read_schema(spt_files[-1]).names
             for col in concat_cols:
                 if 'hit' in col or 'false-alarm' in col:
                     default_cols.append(col)
     # Create output directory
     if not os.path.exists(output_path):
         os.makedirs(output_path)
-    # Get schema from the last file        
-    schema = read_files((fet_files[-1], spt_files[-1], lnk_files[-1], 
-                        default_cols, output_path, None, False))
+    # Get columns of each stage and schema once for all files
+    sources, schema = concat_schema(fet_files, spt_files, lnk_files,
+                                    default_cols, name_list)
+    # Group the files by output file
+    file_groups = {}
+    for fet_file, spt_file, lnk_file in zip(fet_files, spt_files, lnk_files):
+        file_name = pathlib.Path(fet_file).name
+        if name_list['concat_dataset']:
+            file_date = get_featstamp(fet_file).strftime('%Y-%m-%d')
+            file_name = 'date=' + file_date + '/' + file_date + '.parquet'
+        file_groups.setdefault(output_path + file_name, []).append(
+                                            (fet_file, spt_file, lnk_file))
     # Loading bar
     loading_bar = get_loading_bar(fet_files)
+    options = parquet_options(name_list, 'final')
+    args = [(files, sources, schema, output_file, options, name_list)
+            for output_file, files in file_groups.items()]
     if parallel:
-        # Set number of workers
-        n_workers = set_nworkers(name_list)
-        with Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(read_files,
-                                        [(fet_file, spt_file, lnk_file, 
-                                            default_cols, output_path, schema, clean)
-                                        for fet_file, spt_file, lnk_file in zip(fet_files, spt_files, lnk_files)]):
-                loading_bar.update(1)
-        pool.close()
+        for n_files in worker_map(concat_files, args, name_list):
+            loading_bar.update(n_files)
     else:
-        for fet_file, spt_file, lnk_file in zip(fet_files, spt_files, lnk_files):
-            read_files((fet_file, spt_file, lnk_file, default_cols, 
-                        output_path, schema, clean))
-            loading_bar.update(1)
+        for arg in args:
+            loading_bar.update(concat_files(arg))
     loading_bar.close()           
     # Clean the processing directory
     if clean:
         shutil.rmtree(proc_path)
-        
+    if mode == 'track':
+        if clean:
+            for stage in ('features', 'spatial', 'linked'):
+                set_stage(name_list, stage)
+        # The post processing reads the tables at the output_path, and the
+        # dataset files are grouped by date, not by timestamp
+        if output_path == name_list['output_path'] + 'track/trackingtable/':
+            set_stage(name_list, 'trackingtable', output_path)
+
+
+def concat_schema(fet_files, spt_files, lnk_files, default_columns,
+                  name_list=None):
+    '''
+    This function gets the columns to be read from each stage and the schema
+    of the tracking table, computed once for all files.
+
+    The type of each column is unified over all files of the stage, so the
+    empty frames (written with null types) and the columns with missing
+    values have the same type in all output files. With geometry_method
+    'lazy', the geometry column is read from the spatial files, where the
+    spatial operations write the geometries built from the pixels.
+
+    Parameters
+    -------
+    - `fet_files` : list
+        Feature files.
+    - `spt_files` : list
+        Spatial files.
+    - `lnk_files` : list
+        Linked files.
+    - `default_columns` : list
+        List of columns of the tracking table.
+    - `name_list` : dict, optional
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    - `sources` : list
+        Columns to be read from the feature, spatial and linked files.
+    - `schema` : pyarrow.Schema
+        Schema of the tracking table, with the pandas metadata of the cindex index.
+    '''
+    # Columns dropped from the spatial and linked frames, as concat_frames
+    dropped = [[], ['threshold_level', 'trajectory'], ['threshold_level']]
+    # Lazy geometries are null in the feature files
+    if name_list is not None and name_list['geometry_method'] == 'lazy':
+        dropped[0] = ['geometry']
+    stage_schemas = []
+    for files, drop in zip((fet_files, spt_files, lnk_files), dropped):
+        stage_schemas.append((unify_schema(files), drop))
+    # Each column is taken from the first stage that has it
+    sources, fields = [[], [], []], []
+    for col in dict.fromkeys(default_columns):
+        for stage, (stage_schema, drop) in enumerate(stage_schemas):
+            if col in stage_schema.names and col not in drop:
+                sources[stage].append(col)
+                fields.append(stage_schema.field(col))
+                break
+        else:
+            raise KeyError(col)
+    # Columns with types that depend on the values of the frames have the
+    # same types of the stream mode
+    types = tracking_types([field.name for field in fields])
+    fields = [types.field(field.name) if field.name in types.names else field
+              for field in fields]
+    # Lazy geometries are wkt, also in the spatial files of empty frames
+    if name_list is not None and name_list['geometry_method'] == 'lazy':
+        fields = [pa.field('geometry', pa.string())
+                  if field.name == 'geometry' else field for field in fields]
+    # Index is stored as the last column
+    fields = [field for field in fields if field.name != 'cindex'] + \
+                [field for field in fields if field.name == 'cindex']
+    schema = pa.schema(fields)
+    # Pandas metadata of the tracking table, from the last non empty frame
+    rows = [pq.ParquetFile(file).metadata.num_rows for file in lnk_files]
+    last = int(np.nonzero(rows)[0][-1]) if any(rows) else -1
+    table = read_files((fet_files[last], spt_files[last], lnk_files[last],
+                        sources, schema))
+    concat_df = table.to_pandas().set_index('cindex')
+    metadata = Schema.from_pandas(concat_df, preserve_index=True).metadata
+    return sources, schema.with_metadata(metadata)
+
+
+def tracking_types(columns):
+    '''
+    This function gets the types of the columns of the tracking table that
+    depend on the values of each frame: the positions in the previous frame,
+    the uids of the previous clusters, the lifetime and the far. Pandas
+    writes them as null, int or double depending on the missing values, so
+    the files and stream mode cast them to these types.
+
+    Parameters
+    -------
+    - `columns` : list
+        Columns of the tracking table.
+
+    Returns
+    -------
+    - `schema` : pyarrow.Schema
+        Types of the columns that are in columns.
+    '''
+    types = {'lifetime': pa.float64(),
+             'past_idx': pa.int64(),
+             'merge_idx': pa.list_(pa.int64()),
+             'split_pr_idx': pa.int64(),
+             'far': pa.float64(),
+             'prv_mrg_uids': pa.list_(pa.float64()),
+             'prv_mrg_iuids': pa.list_(pa.float64()),
+             'prv_spl_uid': pa.float64(),
+             'prv_spl_iuid': pa.float64()}
+    return pa.schema([pa.field(col, types[col]) for col in columns
+                      if col in types])
+
+
+def unify_schema(files):
+    '''
+    This function unifies the schemas of the files of a stage. Columns
+    without values are written by pandas with the null or double type, so a
+    type that can not be promoted is replaced by the nested type (list of
+    uids), and these columns are filled with nulls by read_files.
+
+    Parameters
+    -------
+    - `files` : list
+        Parquet files of the stage.
+
+    Returns
+    -------
+    - `schema` : pyarrow.Schema
+        Unified schema of the files.
+    '''
+    fields = {}
+    for file in files:
+        for field in pq.read_schema(file):
+            if field.name not in fields or fields[field.name].type == field.type:
+                fields.setdefault(field.name, field)
+                continue
+            try:
+                fields[field.name] = pa.unify_schemas(
+                                    [pa.schema([fields[field.name]]),
+                                     pa.schema([field])],
+                                    promote_options='permissive').field(0)
+            except (pa.ArrowTypeError, pa.ArrowInvalid):
+                if pa.types.is_nested(field.type):
+                    fields[field.name] = field
+    return pa.schema(list(fields.values()))
+
+
 def read_files(args):
     ''' 
-    This function reads multiple Parquet files, processes the data by dropping unnecessary columns, and concatenates them into a single DataFrame. 
-    The resulting DataFrame is then filtered based on a set of default columns, indexed, and cleaned of duplicate columns.
+    This function reads the features, spatial and linked files of a single
+    timestamp and joins them into the table of the tracking table. Only the
+    columns of the tracking table are read, and the columns of the files are
+    combined without copying the data.
 
     Parameters
     -------
@@ -107,26 +276,106 @@ def read_files(args):
         Path to the spatial file.
     - `link_file` : str
         Path to the link file.
+    - `sources` : list
+        Columns to be read from the feature, spatial and linked files.
+    - `schema` : pyarrow.Schema
+        Schema of the tracking table.
+
+    Returns
+    -------
+    - `table` : pyarrow.Table
+        The tracking table of the timestamp, with the schema.
+    '''
+    fet_file, spat_file, link_file, sources, schema = args
+    columns = {}
+    for file, cols in zip((fet_file, spat_file, link_file), sources):
+        stage_file = pq.ParquetFile(file)
+        file_cols = stage_file.schema_arrow.names
+        stage_table = stage_file.read(columns=[col for col in cols
+                                               if col in file_cols])
+        for col in cols:
+            field = schema.field(col)
+            # Columns missing in the file are filled with nulls
+            if col not in file_cols:
+                columns[col] = pa.nulls(stage_table.num_rows, field.type)
+                continue
+            column = stage_table.column(col)
+            if column.type != field.type:
+                # Columns without values may not be cast to the nested types
+                if column.null_count == len(column):
+                    column = pa.nulls(len(column), field.type)
+                else:
+                    column = column.cast(field.type)
+            columns[col] = column
+    return pa.table([columns[name] for name in schema.names], schema=schema)
+
+
+def concat_files(args):
+    '''
+    This function reads the files of one or more timestamps and writes them
+    into a single parquet file.
+
+    Parameters
+    -------
+    - `files` : list
+        Tuples with the feature, spatial and linked file of each timestamp.
+    - `sources` : list
+        Columns to be read from the feature, spatial and linked files.
+    - `schema` : pyarrow.Schema
+        Schema of the tracking table.
+    - `output_file` : str
+        Path of the output parquet file.
+    - `options` : dict
+        Writer options of the output parquet file.
+    - `name_list` : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    - `n_files` : int
+        Number of timestamps written.
+    '''
+    files, sources, schema, output_file, options, name_list = args
+    with profile_step(name_list, 'concat', 'frame',
+                      pathlib.Path(output_file).stem) as rec:
+        with profile_step(name_list, 'concat', 'read',
+                          bytes=sum(file_size(file) or 0 for group in files
+                                    for file in group)):
+            tables = [read_files((fet_file, spt_file, lnk_file, sources,
+                                  schema))
+                      for fet_file, spt_file, lnk_file in files]
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        table = pa.concat_tables(tables)
+        with profile_step(name_list, 'concat', 'write') as write_rec:
+            pq.write_table(table, output_file, **options)
+            write_rec['bytes'] = file_size(output_file)
+        rec['clusters'] = table.num_rows
+    return len(files)
+    
+
+def concat_frames(feat_df, spat_df, link_df, default_columns):
+    ''' 
+    This function joins the features, spatial and linked frames of a single timestamp
+    and selects the columns of the tracking table.
+
+    Parameters
+    -------
+    - `feat_df` : pd.DataFrame
+        Features frame.
+    - `spat_df` : pd.DataFrame
+        Spatial frame.
+    - `link_df` : pd.DataFrame
+        Linked frame.
     - `default_columns` : list
         List of columns to retain after concatenation.
-    - `output_path` : str
-        Directory path to save the processed Parquet file.
-    - `schema` : Schema or None
-        Schema for saving the output Parquet file. If None, the schema is inferred from the DataFrame.
-    - `clean` : bool
-        Flag to indicate whether to clean temporary files after saving.
 
     Returns
     -------
-    None
+    - `concat_df` : pd.DataFrame
+        The tracking table frame indexed by cindex.
     '''
-    fet_file, spat_file, link_file, default_columns, output_path, schema, clean = args
-    # Read feature files
-    feat_df = pd.read_parquet(fet_file)
-    spat_df = pd.read_parquet(spat_file)
     # Drop column threshold_level and trajectory from spat_df
     spat_df = spat_df.drop(columns=['threshold_level', 'trajectory'])
-    link_df = pd.read_parquet(link_file)
     # Drop column threshold_level from link_df
     link_df = link_df.drop(columns=['threshold_level'])
     concat_df = pd.concat([feat_df, spat_df, link_df], axis=1)
@@ -136,21 +385,11 @@ def read_files(args):
     concat_df.set_index('cindex', inplace=True)
     # Drop duplicates columns
     concat_df = concat_df.loc[:,~concat_df.columns.duplicated()]
-    # Check if schema is None
-    if schema is None:
-        return Schema.from_pandas(concat_df)
-    # Get the name of file
-    file_name = pathlib.Path(fet_file).name
-    file_name = output_path + file_name
-    # Check if file exist and remove it
-    if os.path.exists(file_name):
-        os.remove(file_name)
-    # Save the parquet file
-    save_parquet(concat_df, file_name, schema,
-                clean=False, del_files=[fet_file, spat_file, link_file])
-    
+    return concat_df
 
-def save_parquet(concat_df, output_file, schema, clean=False, del_files=[]):
+
+def save_parquet(concat_df, output_file, schema, clean=False, del_files=[],
+                 options=None):
     ''' 
     This function saves a DataFrame to a Parquet file with specified schema and compression. 
     It also provides an option to delete input files after saving.
@@ -162,20 +401,39 @@ def save_parquet(concat_df, output_file, schema, clean=False, del_files=[]):
     - `output_file` : str
         Path where the output Parquet file will be saved.
     - `schema` : pyarrow.Schema
-        Schema to enforce on the DataFrame before saving.
+        Types of the columns cast before saving, as tracking_types. If None,
+        the types are inferred by pandas.
     - `clean` : bool, optional
         If True, deletes the original input files specified in `del_files` after saving. Default is False.
     - `del_files` : list, optional
         List of file paths to be deleted if `clean` is set to True. Default is an empty list.
+    - `options` : dict, optional
+        Writer options from parquet_options. If None, gzip compression is used.
 
     Returns
     -------
     None
     '''
-    # table = pa.Table.from_pandas(concat_df, schema=schema)
-    # df_converted = table.to_pandas()
-    concat_df.to_parquet(output_file, engine='pyarrow', compression='gzip',
-                            )
+    if options is None:
+        options = {'compression': 'gzip'}
+    if schema is None:
+        concat_df.to_parquet(output_file, engine='pyarrow', **options)
+    else:
+        # The index is written as a column, as in concat_files
+        table = pa.Table.from_pandas(concat_df, preserve_index=True)
+        for field in schema:
+            if field.name not in table.column_names:
+                continue
+            position = table.column_names.index(field.name)
+            column = table.column(position)
+            if column.type == field.type:
+                continue
+            if column.null_count == len(column):
+                column = pa.nulls(len(column), field.type)
+            else:
+                column = column.cast(field.type)
+            table = table.set_column(position, field, column)
+        pq.write_table(table, output_file, **options)
     if clean:
         for file in del_files:
             os.remove(file)
@@ -231,6 +489,9 @@ def default_columns(name_list=None):
         uid_pos = columns.index('uid')
         columns = columns[:uid_pos + 1] + ['iuid'] + columns[uid_pos + 1:]
 
+    if name_list['segmentation_method'] == 'hierarchical':
+        columns = columns + ['parent_id']
+
     if name_list['validation']:
         columns = columns + ['far', 'method']
     if name_list['validation_scores']:
@@ -2,6 +2,7 @@ import glob
 import os
 import sys
 import psutil
+from .utilities.manifest import manifest_grid
 
 
 def get_input_files(input_path):
@@ -38,9 +39,24 @@ def default_parameters(name_lst=None, read_function=None):
     mean_dbz: bool
         If True, the mean reflectivity is used to perform the tracking.
     cluster_method: str
-        Method to perform the clustering. It can be 'dbscan' or 'ndimage'.
+        Method to perform the clustering. It can be 'dbscan', 'grid_dbscan'
+        or 'ndimage'. 'grid_dbscan' gives the same labels of 'dbscan',
+        computed on the grid instead of a kd-tree over all points.
     eps: int
-        Epsilon distance to be used in the clustering for the dbscan method.
+        Epsilon distance to be used in the clustering for the dbscan and
+        grid_dbscan methods.
+    geometry_method: str
+        Method to get the geometries of the clusters. 'eager' polygonizes the
+        clusters in the features extraction and stores them as wkt, and
+        'lazy' stores only the pixels and the geometries are built from the
+        pixels by the modules that use them. The spatial operations write
+        them in the spatial files, and the concatenation copies them into
+        the tracking table.
+    segmentation_method: str
+        Method to segment the thresholds. 'threshold' thresholds and labels
+        each threshold independently and 'hierarchical' computes the level
+        of all thresholds at once and adds the parent_id column, with the
+        cluster_id of the containing cluster of the previous threshold.
     delta_tolerance: int
         Delta tolerance is the maximum time difference between two files.
     num_prev_skip: int
@@ -50,8 +66,48 @@ def default_parameters(name_lst=None, read_function=None):
         It is used to perform the cluster linking in the edges of the domain.
     n_jobs: int
         Number of jobs to run in parallel.
+    executor: str
+        Backend of the workers of the parallel stages. It can be 'process'
+        (multiprocessing pool), 'thread' (pool of threads, for read and
+        write bound stages) or 'serial'. track starts the workers once and
+        shares them by all stages.
+    parallel_linking: bool
+        If True, the cluster linking of a parallel run links contiguous
+        blocks of files in parallel and stitches them. If False, the
+        cluster linking is serial.
+    prefetch: int
+        Number of files read ahead by background threads in the features
+        extraction and in the stream mode. If 0, the files are read when
+        they are processed.
+    prefetch_workers: int
+        Number of threads used to read the files ahead. More than 1 needs a
+        thread safe read function.
+    manifest: bool
+        If True, a run manifest is written at output_path + 'track/manifest/'
+        with the input files, their timestamps, the grid shape and the
+        completed stages. The input directory is globbed and the first file
+        read once per run, and the stages list their inputs from the manifest.
+    profile: bool
+        If True, the wall time of the steps of each frame (read, clustering,
+        statistics, overlay, classification, vector methods, validation,
+        linking and parquet I/O), the bytes read and written, the number of
+        clusters and the utilization of the workers are recorded, and track
+        writes the run report at output_path + 'track/profile/'.
     min_overlap: int
         Minimum overlap between two clusters to be considered as the same.
+    overlay_method: str
+        Method to compute the overlap between clusters. It can be 'geometry'
+        (intersection of the polygons) or 'pixel' (shared pixels of the clusters).
+    inside_method: str
+        Method to find the clusters inside the clusters of a lower threshold.
+        It can be 'geometry' (the polygons contain the inside polygons),
+        'pixel' (all pixels of the inside cluster are in the same cluster) or
+        'parent' (the parent_id of the hierarchical segmentation).
+    edges_method: str
+        Method to link the clusters split by the edges of the domain. It can be
+        'geometry' (buffers of the clusters touching the edges) or 'pixel'
+        (pixels near the first and last columns of the grid, with the same
+        distance of the buffers and the same board_idx).
     x_dim: int and y_dim: int
         Dimensions of the data.
     lat_min: float
@@ -84,6 +140,20 @@ def default_parameters(name_lst=None, read_function=None):
         Vector correction method for ellipse fitting.
     'epsg': int
         EPSG code for the projection.
+    concat_dataset: bool
+        If True, the tracking table is written as a dataset partitioned by
+        date, with one file per day, instead of one file per timestamp.
+    intermediate_codec: str
+        Parquet codec of the features, spatial and linked files. It can be
+        'none', 'snappy', 'gzip', 'brotli', 'lz4' or 'zstd'.
+    final_codec: str
+        Parquet codec of the tracking table.
+    compression_level: int
+        Compression level of the codecs, None uses the default level.
+    row_group_size: int
+        Maximum number of rows of each row group, None uses the default size.
+    use_dictionary: bool
+        If True, the dictionary encoding is used in the Parquet files.
     Returns
     -------
     name_lst : dict
@@ -108,6 +178,10 @@ def default_parameters(name_lst=None, read_function=None):
         name_lst['cluster_method'] = 'ndimage'
     if 'eps' not in name_lst:
         name_lst['eps'] = 1
+    if 'geometry_method' not in name_lst:
+        name_lst['geometry_method'] = 'eager'
+    if 'segmentation_method' not in name_lst:
+        name_lst['segmentation_method'] = 'threshold'
     if 'delta_tolerance' not in name_lst:
         name_lst['delta_tolerance'] = 0
     if 'pattern_position' not in name_lst:
@@ -118,6 +192,18 @@ def default_parameters(name_lst=None, read_function=None):
         name_lst['edges'] = False
     if 'n_jobs' not in name_lst:
         name_lst['n_jobs'] = -1
+    if 'executor' not in name_lst:
+        name_lst['executor'] = 'process'
+    if 'parallel_linking' not in name_lst:
+        name_lst['parallel_linking'] = False
+    if 'prefetch' not in name_lst:
+        name_lst['prefetch'] = 0
+    if 'prefetch_workers' not in name_lst:
+        name_lst['prefetch_workers'] = 1
+    if 'manifest' not in name_lst:
+        name_lst['manifest'] = False
+    if 'profile' not in name_lst:
+        name_lst['profile'] = False
     if 'a_memory' not in name_lst:
         a_memory = psutil.virtual_memory().available / 1024 / 1024 / 1024
         name_lst['a_memory'] = a_memory
@@ -125,13 +211,25 @@ def default_parameters(name_lst=None, read_function=None):
         name_lst['temp_folder'] = '/tmp'
     if 'min_overlap' not in name_lst:
         name_lst['min_overlap'] = 10
+    if 'overlay_method' not in name_lst:
+        name_lst['overlay_method'] = 'geometry'
+    if 'inside_method' not in name_lst:
+        name_lst['inside_method'] = 'geometry'
+    if 'edges_method' not in name_lst:
+        name_lst['edges_method'] = 'geometry'
     if 'x_dim' not in name_lst or 'y_dim' not in name_lst:
-        files = get_input_files(name_lst['input_path'])
-        for file in files:
-            if read_function:
-                data = read_function(file)
-                name_lst['y_dim'], name_lst['x_dim'] = data.shape
-                break
+        if name_lst['manifest']:
+            # The shape is read once per run and kept in the manifest
+            grid = manifest_grid(name_lst, read_function)
+            if grid is not None:
+                name_lst['y_dim'], name_lst['x_dim'] = grid
+        else:
+            files = get_input_files(name_lst['input_path'])
+            for file in files:
+                if read_function:
+                    data = read_function(file)
+                    name_lst['y_dim'], name_lst['x_dim'] = data.shape
+                    break
     if 'lat_min' not in name_lst:
         name_lst['lat_min'] = None
     if 'lon_min' not in name_lst:
@@ -164,6 +262,18 @@ def default_parameters(name_lst=None, read_function=None):
         name_lst['elp_correction'] = False
     if 'default_columns' not in name_lst:
         name_lst['default_columns'] = True
+    if 'concat_dataset' not in name_lst:
+        name_lst['concat_dataset'] = False
+    if 'intermediate_codec' not in name_lst:
+        name_lst['intermediate_codec'] = 'zstd'
+    if 'final_codec' not in name_lst:
+        name_lst['final_codec'] = 'gzip'
+    if 'compression_level' not in name_lst:
+        name_lst['compression_level'] = None
+    if 'row_group_size' not in name_lst:
+        name_lst['row_group_size'] = None
+    if 'use_dictionary' not in name_lst:
+        name_lst['use_dictionary'] = True
     if 'validation' not in name_lst:
         name_lst['validation'] = False
     if 'validation_scores' not in name_lst:
@@ -1,2 +1,3 @@
 from .features_extraction import features_extraction
-from .features_extraction import extract_features
\ No newline at end of file
+from .features_extraction import extract_features
+from .features_extraction import frame_features
\ No newline at end of file
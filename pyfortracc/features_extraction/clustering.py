@@ -1,5 +1,7 @@
 import numpy as np
 from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
 from sklearn.cluster import DBSCAN
 
 
@@ -29,6 +31,9 @@ def clustering(mtd, data, operator, thld, min_size, eps=None):
     if mtd == 'dbscan':
         clusters, labels = dbscan_clustering(data, operator, thld, min_size,
                                             eps=eps)
+    elif mtd == 'grid_dbscan':
+        clusters, labels = grid_dbscan_clustering(data, operator, thld,
+                                                  min_size, eps=eps)
     elif mtd == 'ndimage':
         clusters, labels = ndimage_clustering(data, operator, thld, min_size,
                                             eps=eps)
@@ -87,6 +92,194 @@ def dbscan_clustering(data, operator, threshold, min_size, eps=1):
     return clusters, labels
 
 
+def threshold_levels(data, operator, thresholds):
+    """
+    Return the number of thresholds reached by each point, in a single pass
+    over the data
+
+    The thresholds must be nested for the operator (ascending for '>=' and
+    '>', descending for '<=' and '<'), so the mask of the threshold level k is
+    levels > k, the same of operator(data, thresholds[k]).
+
+    parameters:
+    ----------
+    data: numpy matrix
+        matrix of data
+    operator: function
+        function to be used to thresholding segmentation
+    thresholds: list
+        threshold values
+
+    returns:
+    ------
+    levels: numpy matrix
+        matrix with the number of thresholds reached by each point
+    """
+    thresholds = np.asarray(thresholds, dtype=float)
+    # Descending operators are the ascending ones over the negative values
+    if operator in (np.greater_equal, np.greater):
+        sign = 1
+    elif operator in (np.less_equal, np.less):
+        sign = -1
+    else:
+        raise ValueError('Hierarchical segmentation needs an operator '
+                         '>=, >, <= or <')
+    if np.any(np.diff(sign * thresholds) < 0):
+        raise ValueError('Thresholds are not nested for the operator')
+    side = 'right' if operator in (np.greater_equal, np.less_equal) else 'left'
+    levels = np.searchsorted(sign * thresholds, sign * np.asarray(data),
+                             side=side)
+    # Points that do not reach the first threshold, including nan, are level 0
+    levels[~operator(data, thresholds[0])] = 0
+    return levels.astype(np.int32)
+
+
+def parent_ids(prv_clusters, labels):
+    """
+    Return the cluster of the previous threshold level that contains each
+    cluster
+
+    parameters:
+    ----------
+    prv_clusters: numpy matrix
+        matrix with the clusters of the previous threshold level
+    labels: numpy array
+        array with the positions and labels of the clusters (y, x, label)
+
+    returns:
+    ------
+    parents: numpy array
+        cluster id of the containing cluster, indexed by the cluster id. Nan
+        if the pixels of the cluster are not all in the same cluster
+    """
+    parents = np.full(labels[:, 2].max() + 1, np.nan)
+    # Each cluster is a segment of the pixels sorted by label
+    order = np.argsort(labels[:, 2], kind='stable')
+    cluster_ids, starts = np.unique(labels[order, 2], return_index=True)
+    prv_labels = prv_clusters[labels[order, 0], labels[order, 1]]
+    lowest = np.minimum.reduceat(prv_labels, starts)
+    highest = np.maximum.reduceat(prv_labels, starts)
+    inside = (lowest == highest) & (lowest > 0)
+    parents[cluster_ids[inside]] = lowest[inside]
+    return parents
+
+
+def box_count(mask, radius):
+    """
+    Count the points of a mask inside the square window of each pixel
+
+    parameters:
+    ----------
+    mask: numpy matrix
+        boolean matrix of points
+    radius: int
+        half width of the window, the window has 2 * radius + 1 pixels
+
+    returns:
+    ------
+    count: numpy matrix
+        number of points inside the window of each pixel, including itself
+    """
+    size = 2 * radius + 1
+    # Integral image, padded so all windows are inside the matrix
+    padded = np.pad(mask.astype(np.int32), (radius + 1, radius))
+    integral = padded.cumsum(axis=0, dtype=np.int32).cumsum(axis=1,
+                                                         dtype=np.int32)
+    count = (integral[size:, size:] - integral[:-size, size:] -
+             integral[size:, :-size] + integral[:-size, :-size])
+    return count
+
+
+def grid_dbscan_clustering(data, operator, threshold, min_size, eps=1):
+    """
+    Return the cluster labels for each point, using a DBSCAN computed on the
+    grid.
+
+    Same clustering of dbscan_clustering (chebyshev metric, min_samples=3),
+    without the neighbors search over all points. The core points are found
+    by the count of points in the window of each pixel, the clusters are the
+    connected components of the cores within eps of each other, and the
+    border points take the first cluster within eps, as in the expansion
+    order of sklearn. Cluster ids are numbered by the first core point in row
+    order, so the labels are the same of dbscan_clustering. eps is truncated
+    to an integer, as the distances on the grid are integers.
+
+    parameters:
+    ----------
+    data: numpy matrix
+        matrix of data
+    operator: function
+        function to be used to thresholding segmentation
+    threshold: float
+        threshold value
+    min_size: int
+        minimum number of points per cluster
+    eps: int
+        maximum chebyshev distance between neighbor points
+
+    returns:
+    ------
+    labels: numpy matrix
+        matrix with the clusters
+    """
+    mask = operator(data, threshold)
+    clusters = np.zeros(data.shape, dtype=np.int32)
+    radius = int(eps)
+    # Core points have at least 3 points within eps, including itself
+    core = mask & (box_count(mask, radius) >= 3)
+    if not core.any():
+        return clusters, np.empty((0, 3), dtype=np.int32)
+    # Cores at distance 1 are the 8-connected components of the core mask,
+    # numbered by their first core point in row order
+    structure = np.ones((3, 3), dtype=int)
+    core_lbl, num_lbl = ndimage.label(core, structure)
+    if radius > 1:
+        # Link the components with cores at distance 2 to eps, each offset
+        # of the upper half window once
+        rows, cols = [], []
+        y_dim, x_dim = data.shape
+        for dy in range(0, radius + 1):
+            for dx in range(-radius, radius + 1):
+                if (dy == 0 and dx <= 0) or max(dy, abs(dx)) < 2:
+                    continue
+                src = core_lbl[:y_dim - dy, max(0, -dx):x_dim - max(0, dx)]
+                dst = core_lbl[dy:, max(0, dx):x_dim - max(0, -dx)]
+                link = (src > 0) & (dst > 0) & (src != dst)
+                pairs = np.unique(np.stack((src[link], dst[link])), axis=1)
+                rows.append(pairs[0])
+                cols.append(pairs[1])
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        graph = coo_matrix((np.ones(rows.size, dtype=np.int8), (rows, cols)),
+                           shape=(num_lbl + 1, num_lbl + 1))
+        _, components = connected_components(graph, directed=False)
+        # The first core of a cluster is the first core of its lowest label
+        comps, first = np.unique(components[1:], return_index=True)
+        order = np.zeros(components.max() + 1, dtype=np.int32)
+        order[comps[np.argsort(first)]] = np.arange(1, comps.size + 1,
+                                                    dtype=np.int32)
+        lut = order[components]
+        lut[0] = 0
+        core_lbl = lut[core_lbl]
+    clusters[core] = core_lbl[core]
+    # Border points take the lowest cluster id within eps
+    border = mask & ~core
+    if border.any():
+        first_id = np.where(core, clusters, np.iinfo(np.int32).max)
+        first_id = ndimage.minimum_filter(first_id, size=2 * radius + 1,
+                                          mode='constant',
+                                          cval=np.iinfo(np.int32).max)
+        reach = border & (first_id != np.iinfo(np.int32).max)
+        clusters[reach] = first_id[reach]
+    # Remove clusters with less than min_size points
+    sizes = np.bincount(clusters.ravel())
+    clusters[(sizes < min_size)[clusters]] = 0
+    # Get positions of clusters and labels
+    labels = np.argwhere(clusters != 0)
+    labels = np.concatenate((labels, clusters[clusters != 0][:, np.newaxis]),
+                            axis=1)
+    return clusters, labels
+
+
 def ndimage_clustering(data, operator, threshold, min_size, eps=None):
     """
     Return the cluster labels for each point
@@ -1,13 +1,20 @@
+import numpy as np
 import pandas as pd
 import warnings
-from multiprocessing import Pool
 from pyfortracc.default_parameters import default_parameters
-from .clustering import clustering
+from .clustering import clustering, threshold_levels, parent_ids
 from .statistics import geo_statistics
 from pyfortracc.utilities.utils import (get_input_files, set_operator,
                                         create_dirs, write_parquet, set_schema,
+                                        parquet_options,
                                         set_outputdf, set_nworkers, check_operational_system,
                                         get_loading_bar, get_filestamp)
+from pyfortracc.utilities.reader import read_frame, prefetch_reader
+from pyfortracc.utilities.executor import worker_map, task_chunksize
+from pyfortracc.utilities.manifest import (remove_manifest, manifest_files,
+                                           set_stage)
+from pyfortracc.utilities.profiler import (profile_step, profile_function,
+                                           frame_key, file_size)
 warnings.simplefilter(action='ignore', category=FutureWarning)
 warnings.simplefilter(action='ignore', category=UserWarning)
 
@@ -26,12 +33,18 @@ def features_extraction(name_lst, read_fnc, parallel=True):
         True to run parallel, False to run in serial
     """
     print('Features Extraction:')
+    # A new run builds a new manifest
+    if name_lst.get('manifest'):
+        remove_manifest(name_lst)
     # Set default parameters
     name_lst = default_parameters(name_lst, read_fnc)
     # Check operational system
     name_lst, parallel = check_operational_system(name_lst, parallel)
     # Get the input files and filestamp
-    files = get_input_files(name_lst['input_path'])
+    if name_lst['manifest']:
+        files = manifest_files(name_lst)['file'].tolist()
+    else:
+        files = get_input_files(name_lst['input_path'])
     # Set the operator used to thresholding segmentation
     operator = set_operator(name_lst['operator'])
     # Get loading bar
@@ -45,22 +58,35 @@ def features_extraction(name_lst, read_fnc, parallel=True):
     schema = set_schema('features', name_lst)
     # Get geotransform
     # geotrnf, _ = get_geotransform(name_lst)
-    if parallel:
-        # Set number of workers
-        n_workers = set_nworkers(name_lst)
-        with Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(extract_features,
-                                        [(file, name_lst, operator,
-                                        read_fnc, schema)
-                                        for _, file in enumerate(files)]):
-                loading_bar.update(1)
-        pool.close()
+    if name_lst['prefetch'] > 0:
+        # Each chunk of files is read ahead by its own prefetch reader
+        args = (files, name_lst, operator, read_fnc, schema)
+        if parallel:
+            n_workers = set_nworkers(name_lst)
+            chunks = np.array_split(np.arange(len(files)),
+                                    max(1, min(len(files), n_workers * 4)))
+            for n_files in worker_map(features_chunk,
+                                      [(files[chunk[0]:chunk[-1] + 1],)
+                                       + args[1:]
+                                       for chunk in chunks
+                                       if len(chunk) > 0], name_lst):
+                loading_bar.update(n_files)
+        else:
+            features_chunk(args, loading_bar)
+    elif parallel:
+        for _ in worker_map(extract_features,
+                            [(file, name_lst, operator,
+                              read_fnc, schema)
+                             for _, file in enumerate(files)], name_lst,
+                            chunksize=task_chunksize(len(files), name_lst)):
+            loading_bar.update(1)
     else:
         for _, file in enumerate(files):
             extract_features((file, name_lst, operator,
                             read_fnc, schema))
             loading_bar.update(1)
     loading_bar.close()
+    set_stage(name_lst, 'features', output_path)
 
 
 def extract_features(args):
@@ -79,36 +105,206 @@ def extract_features(args):
         function to read the data
     """
     file, name_list, operator, read_func, schema = args
-    # Initialize the features dataframe
-    output_df = set_outputdf(schema)
+    read_func = profile_function(name_list, 'features', 'read_fnc', read_func)
+    with profile_step(name_list, 'features', 'frame',
+                      frame_key(name_list, file)) as rec:
+        # Read the data from the file using the read_func
+        data, error = read_frame(read_func, file)
+        rec['clusters'] = save_features(file, data, error, name_list,
+                                        operator, schema)
+    return
+
+
+def features_chunk(args, loading_bar=None):
+    """
+    Calculate the features of a list of files, reading the next files ahead
+    while the current one is processed
+
+    args parameters:
+    ----------
+    files: list
+        paths to the files
+    name_list: dictionary
+        dictionary with the parameters
+    operator: function
+        function to be used to thresholding segmentation
+    read_func: function
+        function to read the data
+    schema: numpy dtype
+        schema of the features dataframe
+    loading_bar: tqdm, optional
+        loading bar updated for each file
+
+    returns:
+    -------
+    int
+        number of processed files
+    """
+    files, name_list, operator, read_func, schema = args
+    read_func = profile_function(name_list, 'features', 'read_fnc', read_func)
+    for file, data, error in prefetch_reader(files, read_func,
+                                             name_list['prefetch'],
+                                             name_list['prefetch_workers']):
+        # The files are read ahead, so the frame does not include the read
+        with profile_step(name_list, 'features', 'frame',
+                          frame_key(name_list, file)) as rec:
+            rec['clusters'] = save_features(file, data, error, name_list,
+                                            operator, schema)
+        if loading_bar is not None:
+            loading_bar.update(1)
+    return len(files)
+
+
+def save_features(file, data, error, name_list, operator, schema):
+    """
+    Calculate the features of a file already read and save them
+
+    parameters:
+    ----------
+    file: string
+        path to the file
+    data: numpy array
+        2D field of the file, None if the read failed
+    error: Exception
+        error raised reading the file, None if the read succeeded
+    name_list: dictionary
+        dictionary with the parameters
+    operator: function
+        function to be used to thresholding segmentation
+    schema: numpy dtype
+        schema of the features dataframe
+
+    returns:
+    -------
+    int
+        number of clusters of the file
+    """
     # Get the timestamp from the file
     tstamp = get_filestamp(name_list, file)
     fpattern = '%Y%m%d_%H%M'  # File pattern
     output_path = name_list['output_features']
+    feature_file = output_path + '{}.parquet'.format(tstamp.strftime(fpattern))
+    if error is not None:
+        print('Error reading file: {}'.format(file), error)
+        output_df = set_outputdf(schema)
+    else:
+        # Calculate the features and save
+        output_df = frame_features(data, tstamp, file, name_list, operator,
+                                   schema)
+    with profile_step(name_list, 'features', 'write') as rec:
+        write_parquet(output_df, feature_file, parquet_options(name_list))
+        rec['bytes'] = file_size(feature_file)
+    return len(output_df)
+
+
+def frame_features(data, tstamp, file, name_list, operator, schema):
+    """
+    Calculate the features of a single frame already in memory
+
+    parameters:
+    ----------
+    data: numpy array
+        2D field of the frame
+    tstamp: datetime
+        timestamp of the frame
+    file: string
+        path to the file of the frame
+    name_list: dictionary
+        dictionary with the parameters
+    operator: function
+        function to be used to thresholding segmentation
+    schema: numpy dtype
+        schema of the features dataframe
+
+    returns:
+    -------
+    output_df: pandas dataframe
+        dataframe with the features of all thresholds
+    """
+    # Initialize the features dataframe
+    output_df = set_outputdf(schema)
     min_size = name_list['min_cluster_size']
     cluster_mtd = name_list['cluster_method']
-    feature_file = output_path + '{}.parquet'.format(tstamp.strftime(fpattern))
-    # Read the data from the file using the read_func
-    try:
-        data = read_func(file)
-    except Exception as e:
-        print('Error reading file: {}'.format(file), e)
-        write_parquet(output_df, feature_file)
-        return
+    if name_list['segmentation_method'] == 'hierarchical':
+        output_df = hierarchical_features(data, name_list, operator, output_df)
+        output_df['timestamp'] = tstamp
+        output_df['file'] = file
+        output_df.reset_index(inplace=True, drop=True)
+        return output_df
+    if name_list['segmentation_method'] != 'threshold':
+        raise ValueError('Invalid segmentation method')
     # Start processing clustering and geo_statistics
     for thld_lvl, threshold in enumerate(name_list['thresholds']):
         # Calculate the clusters
-        clusters, labels = clustering(cluster_mtd, data, operator,
-                                    threshold, min_size[thld_lvl],
-                                    name_list['eps'])
+        with profile_step(name_list, 'features', 'clustering'):
+            clusters, labels = clustering(cluster_mtd, data, operator,
+                                        threshold, min_size[thld_lvl],
+                                        name_list['eps'])
         # Calculate the geo_statistics
-        clu_stats = geo_statistics(clusters, labels, data, name_list)
+        with profile_step(name_list, 'features', 'geo_statistics') as rec:
+            clu_stats = geo_statistics(clusters, labels, data, name_list)
+            rec['clusters'] = len(clu_stats)
         clu_stats['threshold'] = threshold
         clu_stats['threshold_level'] = thld_lvl
         output_df = pd.concat([output_df, clu_stats], axis=0)
-    # Save the features
     output_df['timestamp'] = tstamp
     output_df['file'] = file
     output_df.reset_index(inplace=True, drop=True)
-    write_parquet(output_df, feature_file)
-    return
\ No newline at end of file
+    return output_df
+
+
+def hierarchical_features(data, name_list, operator, output_df):
+    """
+    Calculate the features of all thresholds from a single thresholding of
+    the frame, keeping the parent cluster of each cluster
+
+    The level of each point is computed once by threshold_levels and the
+    clusters of each threshold level are labeled over the whole level
+    matrix, not inside each cluster of the previous level, so the cluster
+    ids are the same of the threshold segmentation and the clusters of a
+    parent removed by min_cluster_size are kept. As the clusters of a
+    threshold are inside the clusters of the previous threshold, the
+    parent_id of each cluster is taken from the labels of the previous level
+    at its pixels, and the features of all levels are concatenated once.
+
+    parameters:
+    ----------
+    data: numpy array
+        2D field of the frame
+    name_list: dictionary
+        dictionary with the parameters
+    operator: function
+        function to be used to thresholding segmentation
+    output_df: pandas dataframe
+        empty features dataframe with the schema
+
+    returns:
+    -------
+    output_df: pandas dataframe
+        dataframe with the features of all thresholds
+    """
+    min_size = name_list['min_cluster_size']
+    cluster_mtd = name_list['cluster_method']
+    with profile_step(name_list, 'features', 'clustering'):
+        levels = threshold_levels(data, operator, name_list['thresholds'])
+    level_dfs = [output_df]
+    prv_clusters = None
+    for thld_lvl, threshold in enumerate(name_list['thresholds']):
+        # Points of the threshold level have a level greater than thld_lvl
+        with profile_step(name_list, 'features', 'clustering'):
+            clusters, labels = clustering(cluster_mtd, levels,
+                                          np.greater_equal, thld_lvl + 1,
+                                          min_size[thld_lvl],
+                                          name_list['eps'])
+        with profile_step(name_list, 'features', 'geo_statistics') as rec:
+            clu_stats = geo_statistics(clusters, labels, data, name_list)
+            rec['clusters'] = len(clu_stats)
+        if not clu_stats.empty:
+            clu_stats['threshold'] = threshold
+            clu_stats['threshold_level'] = thld_lvl
+            if prv_clusters is not None:
+                parents = parent_ids(prv_clusters, labels)
+                clu_stats['parent_id'] = parents[clu_stats['cluster_id'].values]
+            level_dfs.append(clu_stats)
+        prv_clusters = clusters
+    return pd.concat(level_dfs, axis=0)
@@ -1,7 +1,9 @@
 import pandas as pd
 import numpy as np
+import shapely
 from rasterio import features
 from shapely.geometry import Polygon, MultiPolygon
+from pyfortracc.utilities.pixels import cluster_pixels
 np.seterr(divide='ignore', invalid='ignore')
 
 
@@ -23,13 +25,45 @@ def geo_statistics(cluster_matrix, cluster_labels, values_matrix, name_list):
     output_df: pandas dataframe
         dataframe with the statistics for each cluster
     """
-    # Set output dataframe
-    output_df = pd.DataFrame()
+    # Check if have clusters
+    if len(cluster_labels) == 0:
+        return pd.DataFrame()
+    # Compute the statistics of all clusters in a single pass
+    stats_df = cluster_statistics(cluster_labels, values_matrix)
+    # Lazy geometries are built from the pixels by the modules that use them
+    if name_list['geometry_method'] == 'lazy':
+        stats_df['geometry'] = None
+        return stats_df
+    geo_ids, geometries = cluster_geometries(cluster_matrix, name_list)
+    # Clusters are kept in cluster_id order, the same order of the lazy
+    # method, so both methods give the same tracking
+    geometry = np.full(len(stats_df), None, dtype=object)
+    geometry[np.searchsorted(stats_df['cluster_id'].values, geo_ids)] = \
+        shapely.to_wkt(geometries, rounding_precision=-1)
+    stats_df['geometry'] = geometry
+    return stats_df
+
+
+def cluster_geometries(cluster_matrix, name_list):
+    """
+    Polygonize the clusters of a cluster matrix
+
+    parameters:
+    ----------
+    cluster_matrix: numpy array
+        array with the clusters
+    name_list: dictionary
+        dictionary with the parameters
+
+    returns:
+    -------
+    geo_ids: numpy array
+        ids of the clusters in the order of the polygons
+    geometries: numpy array
+        geometry of each cluster
+    """
     # Set Mask
     mask = cluster_matrix != 0
-    # Set y_, x_ coordinates and labels
-    y_, x_ = cluster_labels[:, 0], cluster_labels[:, 1]
-    labels = cluster_labels[:, 2]
     # Features.shapes returns a generator with the geometries
     # and the labels of the clusters
     # Connectiviy 8 is used to consider the diagonal neighbors
@@ -42,82 +76,118 @@ def geo_statistics(cluster_matrix, cluster_labels, values_matrix, name_list):
     else:
         lat_min = -0.5
         lon_min = -0.5
-    # Loop over the generator to get the statistics for each cluster
+    # Polygons are grouped by cluster id. A cluster could have more than one
+    # polygon when use eps parameter in DBSCAN > 1, that could merge clusters
+    # with distance > eps, in this case the polygons are merged in MultiPolygon
+    boundaries = {}
     for geo in features.shapes(cluster_matrix,
                             mask,
                             connectivity=8,
                             transform=(x_res, 0, lon_min, 0, y_res, lat_min)):
         # Get the cluster id
         cluster_id = int(geo[-1])
-        
         # Create polygon with holes support
         coordinates = geo[0]['coordinates']
         if len(coordinates) > 1:
             # First coordinate set is exterior, rest are holes
-            exterior = coordinates[0]
-            holes = coordinates[1:] if len(coordinates) > 1 else None
-            boundary = Polygon(exterior, holes)
+            boundary = Polygon(coordinates[0], coordinates[1:])
         else:
             # No holes, just exterior
             boundary = Polygon(coordinates[0])
-        # Get array of coordinates for the cluster
-        # array_y, array_x = np.where(cluster_matrix == cluster_id)
-        cluster_indices = np.argwhere(labels == cluster_id).ravel()
-        array_y = y_[cluster_indices]
-        array_x = x_[cluster_indices]
-        # Get array of values for the cluster
-        cluster_values = values_matrix[array_y, array_x]
-        # Append the statistics to the dataframe
-        cluster_stat = pd.DataFrame({'cluster_id': cluster_id,
-                                    'size': [len(cluster_values)],
-                                    'min': np.nanmin(cluster_values),
-                                    'mean': np.nanmean(cluster_values),
-                                    'max': np.nanmax(cluster_values),
-                                    'std': np.nanstd(cluster_values),
-                                    'array_values': [cluster_values],
-                                    'array_x': [array_x],
-                                    'array_y': [array_y],
-                                    'geometry': boundary})
-        # Append the statistics to the dataframe
-        output_df = pd.concat([output_df, cluster_stat], axis=0)
-    # Reset index
-    output_df.reset_index(drop=True, inplace=True)
-    # Get index of duplicated values at cluster_id column and groupby
-    # This part is used to merge the clusters that are duplicated, the this is
-    # occur when use eps parameter in DBSCAN > 1, and could merge clusters
-    # with distance > eps
-    if name_list['cluster_method'] == 'dbscan' and name_list['eps'] > 1:
-        # Find duplicated values
-        dupli_idx = output_df.duplicated(subset=['cluster_id'], keep=False)
-        if not dupli_idx.any():
-            # Check convex hull
-            if name_list['convex_hull'] and len(output_df) > 0:
-                output_df['geometry'] = output_df['geometry'].apply(lambda x: x.convex_hull)
-            # Convert geometry to wkt
-            if len(output_df) > 0: # Convert geometry to wkt
-                output_df['geometry'] = output_df['geometry'].apply(lambda x: x.wkt)
-            return output_df
-        # Group by cluster_id
-        dupli_group = output_df[dupli_idx].groupby('cluster_id')
-        for _, group in dupli_group:
-            multi_geo = MultiPolygon(list(group['geometry'].apply(Polygon)))
-            m_array= np.concatenate(group['array_values'].values)
-            m_array_x = np.concatenate(group['array_x'].values)
-            m_array_y = np.concatenate(group['array_y'].values)
-            output_df.loc[group.index[0], 'size'] = group['size'].sum()
-            output_df.loc[group.index[0], 'min'] = group['min'].min()
-            output_df.loc[group.index[0], 'mean'] = group['mean'].mean()
-            output_df.loc[group.index[0], 'max'] = group['max'].max()
-            output_df.loc[group.index[0], 'std'] = group['std'].mean()
-            output_df.loc[group.index[0], 'geometry'] = multi_geo
-            output_df.at[group.index[0], 'array_values'] = m_array
-            output_df.at[group.index[0], 'array_x'] = m_array_x
-            output_df.at[group.index[0], 'array_y'] = m_array_y
-            output_df.drop(group.index[1:], inplace=True)
+        boundaries.setdefault(cluster_id, []).append(boundary)
+    geometries = [polygons[0] if len(polygons) == 1 else MultiPolygon(polygons)
+                  for polygons in boundaries.values()]
+    geometries = np.array(geometries, dtype=object)
     # Check convex hull
-    if name_list['convex_hull'] and len(output_df) > 0:
-        output_df['geometry'] = output_df['geometry'].apply(lambda x: x.convex_hull)
-    # Convert geometry to wkt
-    if len(output_df) > 0:
-        output_df['geometry'] = output_df['geometry'].apply(lambda x: x.wkt)
-    return output_df
+    if name_list['convex_hull']:
+        geometries = shapely.convex_hull(geometries)
+    geo_ids = np.fromiter(boundaries.keys(), dtype=np.int64, count=len(boundaries))
+    return geo_ids, geometries
+
+
+def pixel_geometries(frame, name_list):
+    """
+    Build the geometries of the clusters of a frame from their pixels, the
+    same geometries of geo_statistics. Used when the features are extracted
+    with geometry_method 'lazy'.
+
+    The clusters of each threshold level are drawn in a cluster matrix with
+    the shape of the data and polygonized at once.
+
+    parameters:
+    ----------
+    frame: pandas dataframe
+        dataframe with the threshold_level, array_y and array_x columns
+    name_list: dictionary
+        dictionary with the parameters
+
+    returns:
+    -------
+    geometries: numpy array
+        geometry of each cluster, in the order of the frame
+    """
+    geometries = np.full(len(frame), None, dtype=object)
+    offsets, array_y, array_x, _ = cluster_pixels(frame, values=False)
+    positions = np.repeat(np.arange(len(frame)), np.diff(offsets))
+    levels = frame['threshold_level'].values
+    for level in np.unique(levels):
+        rows = np.flatnonzero(levels == level)
+        pixels = np.isin(positions, rows)
+        # Clusters are labeled by their position in the frame plus one
+        cluster_matrix = np.zeros((name_list['y_dim'], name_list['x_dim']),
+                                  dtype=np.int32)
+        cluster_matrix[array_y[pixels], array_x[pixels]] = positions[pixels] + 1
+        geo_ids, level_geoms = cluster_geometries(cluster_matrix, name_list)
+        geometries[geo_ids - 1] = level_geoms
+    return geometries
+
+
+def cluster_statistics(cluster_labels, values_matrix):
+    """
+    Calculate the statistics and the pixel arrays of all clusters at once.
+
+    The pixels are sorted by label, so each cluster is a contiguous segment
+    of the sorted arrays and the statistics are computed by segment reductions.
+
+    parameters:
+    ----------
+    cluster_labels: numpy array
+        array with the positions and labels of the clusters (y, x, label)
+    values_matrix: numpy array
+        array with the values
+
+    returns:
+    -------
+    stats_df: pandas dataframe
+        dataframe with the statistics for each cluster sorted by cluster_id
+    """
+    # Stable sort keep the raster order of the pixels inside each cluster
+    order = np.argsort(cluster_labels[:, 2], kind='stable')
+    array_y = cluster_labels[order, 0]
+    array_x = cluster_labels[order, 1]
+    labels = cluster_labels[order, 2]
+    cluster_ids, starts, sizes = np.unique(labels, return_index=True,
+                                           return_counts=True)
+    # Get values of the clusters
+    values = values_matrix[array_y, array_x]
+    fvalues = np.asarray(values, dtype=float)
+    valid = ~np.isnan(fvalues)
+    # Nan values are ignored in the statistics
+    counts = np.add.reduceat(valid.astype(np.int64), starts)
+    sums = np.add.reduceat(np.where(valid, fvalues, 0), starts)
+    means = sums / counts
+    deviation = np.where(valid, fvalues - np.repeat(means, sizes), 0)
+    stds = np.sqrt(np.add.reduceat(deviation ** 2, starts) / counts)
+    # Split the arrays by cluster, pixels are stored as int32 to reduce the
+    # size of the parquet list columns and values keep the source dtype
+    splits = starts[1:]
+    stats_df = pd.DataFrame({'cluster_id': cluster_ids.astype(int),
+                            'size': sizes,
+                            'min': np.fmin.reduceat(fvalues, starts),
+                            'mean': means,
+                            'max': np.fmax.reduceat(fvalues, starts),
+                            'std': stds,
+                            'array_values': np.split(values, splits),
+                            'array_x': np.split(array_x.astype(np.int32), splits),
+                            'array_y': np.split(array_y.astype(np.int32), splits)})
+    return stats_df
@@ -9,11 +9,11 @@ from pyfortracc.utilities.utils import get_feature_files, \
                                         set_schema, \
                                         get_edges, \
                                         get_geotransform, \
-                                        write_parquet
+                                        parquet_options
 from pyfortracc.features_extraction import extract_features
 from pyfortracc.spatial_operations import spatial_operation
 from pyfortracc.cluster_linking import linking
-from pyfortracc.concat import read_files as concat_files
+from pyfortracc.concat import concat_files, concat_schema
 from pyfortracc.concat import default_columns
 
 from pyfortracc.spatial_conversions.boundaries import translate_boundary
@@ -195,8 +195,9 @@ def forecast(name_list, read_function):
         # 5 - Fifth Step of the forecast is concatenate all forecast files
         print(f"  * Concatenating Forecast Files")
         def_cols = default_columns(name_list)
-        # Get schema from last tracked file
-        schema = pd.read_parquet(tracked_files[-1])
+        # Get columns of each stage and schema of the forecast files
+        sources, schema = concat_schema([fet_file], [spat_file], [linked_file],
+                                        def_cols, name_list)
 
         # Set forecast table path
         forecast_table = name_list['output_path'] + 'forecasttable/'
@@ -204,13 +205,12 @@ def forecast(name_list, read_function):
 
         # The arguments for the concat function
         concat_args = (
-            fet_file,
-            spat_file,
-            linked_file,
-            def_cols,
-            forecast_table,
+            [(fet_file, spat_file, linked_file)],
+            sources,
             schema,
-            True
+            forecast_table + pathlib.Path(fet_file).name,
+            parquet_options(name_list, 'final'),
+            name_list
         )
         # Concatenate the forecast files
         concat_files(concat_args)
@@ -237,6 +237,7 @@ def forecast(name_list, read_function):
                 None,  # pixel_area not used in forecast
                 None,  # xlat not used in forecast
                 None,  # xlon not used in forecast
-                None
+                None,
+                name_list
             ))
         
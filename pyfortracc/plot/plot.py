@@ -15,6 +15,7 @@ from cartopy.mpl.ticker import LongitudeFormatter, LatitudeFormatter
 from io import BytesIO
 from PIL import Image
 from pyfortracc.default_parameters import default_parameters
+from pyfortracc.utilities.pixels import cluster_pixels
 
 
 def plot(name_list,
@@ -163,9 +164,7 @@ def plot(name_list,
         data = np.where((data < min_val) | (data > max_val), np.nan, data)
     else:
         # Get array x, y and values
-        x = tck_table['array_x'].explode().values.astype(int)
-        y = tck_table['array_y'].explode().values.astype(int)
-        values = tck_table['array_values'].explode().values
+        _, y, x, values = cluster_pixels(tck_table)
         # Create a nan matrix
         data = np.full((y.max() + 1, x.max() + 1), np.nan)
         # Fill the matrix with the values
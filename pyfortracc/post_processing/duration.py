@@ -1,22 +1,34 @@
 import glob
-import pathlib
+import json
 import duckdb
+import numpy as np
 import pandas as pd
-import multiprocessing as mp
-from pyfortracc.utilities.utils import set_nworkers, get_loading_bar, check_operational_system
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyfortracc.utilities.utils import (set_nworkers, get_loading_bar,
+                                        check_operational_system,
+                                        parquet_options)
+from pyfortracc.utilities.manifest import stage_files
+from pyfortracc.utilities.executor import worker_map, task_chunksize
 from pyfortracc import default_parameters
 
 def compute_duration(namelist, parallel=True):
-    """ 
+    """
     This function calculates the duration of the clusters using DuckDB.
-    
+
+    The duration and genesis of all rows are computed by duration_table with
+    a single query over the tracking table, and each file of the tracking
+    table is rewritten once by update_parquet with the new columns. The
+    DuckDB connection is only used by the main process, the workers receive
+    the columns of their files.
+
     Parameters
     ----------
     namelist : dict
         Dictionary with the parameters to be used.
     parallel : bool, optional
         If True, the function will run in parallel. Default is True.
-        
+
     Returns
     -------
     None
@@ -24,129 +36,167 @@ def compute_duration(namelist, parallel=True):
     # Check operational system
     namelist, parallel = check_operational_system(namelist, parallel)
     # Get all track files
-    files = sorted(glob.glob(namelist['output_path'] + 'track/trackingtable/' + '*.parquet'))
+    files = stage_files(namelist, 'trackingtable')
+    if files is None:
+        files = sorted(glob.glob(namelist['output_path'] + 'track/trackingtable/' + '*.parquet'))
     if len(files) == 0:
         print('No track files found at ' + namelist['output_path'] + 'track/trackingtable/')
         return
-    # Get timestamps from files
-    tstamps = [pd.to_datetime(pathlib.Path(file).name, format='%Y%m%d_%H%M.parquet') for file in files]
     namelist = default_parameters(namelist)
-    n_workers = set_nworkers(namelist)
-    global df # Make df global to be used in update_parquet
-    global con
-    if len(namelist['thresholds']) > 1:
-        proc_col = 'iuid'
-        proc_col2 = 'uid'
-    else:
-        proc_col = 'uid'
-        proc_col2 = 'uid'
-    # Using DuckDB to read the parquet files and process the data
-    con = duckdb.connect(database=':memory:') 
-    con.execute('PRAGMA enable_progress_bar;')
-    con.execute(f"SET threads = {n_workers}")
-    # Set the query to be executed
-    # This query will group the data by the column proc_col and
-    #  calculate the duration of each cluster based on the timestamps
-    query = f"""
-        SELECT 
-            COALESCE({proc_col}, {proc_col2}) AS {proc_col}, 
-            MIN(timestamp) AS first_timestamp, 
-            MAX(timestamp) AS last_timestamp,
-            DATEDIFF('minute', MIN(timestamp), MAX(timestamp)) AS duration
-        FROM 
-            read_parquet('{namelist['output_path']}track/trackingtable/*.parquet')
-        WHERE 
-            {proc_col} IS NOT NULL OR {proc_col2} IS NOT NULL
-        GROUP BY 
-            COALESCE({proc_col}, {proc_col2})
-        HAVING 
-            DATEDIFF('minute', MIN(timestamp), MAX(timestamp)) > 0
-    """
-    con.execute("CREATE TABLE df AS " + query)
-    con.execute('PRAGMA disable_progress_bar;')
+    columns = duration_table(files, namelist)
     print('Computing duration:')
+    # Rows of each file, ordered by file
+    bounds = np.searchsorted(columns['file_id'], np.arange(len(files) + 1))
     # Loop over files
     load_bar = get_loading_bar(files)
+    options = parquet_options(namelist, 'final')
+    args = [(files[ff], columns['duration'][bounds[ff]:bounds[ff + 1]],
+             columns['genesis'][bounds[ff]:bounds[ff + 1]], options)
+            for ff in range(len(files))]
     if parallel:
-        with mp.Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(update_parquet, [(tstamps[tt], files[tt]) for tt in range(len(tstamps))]):
-                load_bar.update(1)
+        for _ in worker_map(update_parquet, args, namelist,
+                            chunksize=task_chunksize(len(args), namelist)):
+            load_bar.update(1)
     else:
-        for tt in range(len(tstamps)):
-            update_parquet((tstamps[tt], files[tt]))
+        for arg in args:
+            update_parquet(arg)
             load_bar.update(1)
     load_bar.close()
     return
 
+def duration_table(files, namelist):
+    """
+    Compute the duration and genesis of all rows of the tracking table with
+    a single window query.
+
+    The rows are grouped by cluster, the iuid (or the uid where iuid is
+    null) if there is more than one threshold and the uid otherwise. The
+    duration is the time in minutes between the first and the last
+    timestamp of the cluster. The genesis is 1 at the first timestamp, -1
+    at the last timestamp and 0 otherwise. Rows without cluster and
+    clusters with duration 0 have duration and genesis 0.
+
+    Parameters
+    ----------
+    files : list
+        Files of the tracking table.
+    namelist : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    columns : dict
+        Numpy arrays file_id (position of the file in files), duration and
+        genesis, ordered by file and by row in the file.
+    """
+    if len(namelist['thresholds']) > 1:
+        cluster = 'COALESCE(iuid, uid)'
+    else:
+        cluster = 'uid'
+    con = duckdb.connect(database=':memory:')
+    con.execute('PRAGMA enable_progress_bar;')
+    con.execute(f"SET threads = {set_nworkers(namelist)}")
+    con.register('files', pd.DataFrame({'filename': files,
+                                        'file_id': np.arange(len(files))}))
+    # The span of each cluster is computed by a window over all rows, so
+    # the tracking table is scanned once and only the keys are read
+    query = f"""
+        WITH spans AS (
+            SELECT
+                file_id,
+                file_row_number,
+                timestamp,
+                {cluster} AS cluster,
+                MIN(timestamp) OVER (PARTITION BY {cluster}) AS start_time,
+                MAX(timestamp) OVER (PARTITION BY {cluster}) AS end_time
+            FROM
+                read_parquet($files, filename = true, file_row_number = true)
+                JOIN files USING (filename)
+        ), durations AS (
+            SELECT
+                *,
+                CASE WHEN cluster IS NULL THEN 0
+                    ELSE DATEDIFF('minute', start_time, end_time)
+                END AS duration
+            FROM spans
+        )
+        SELECT
+            file_id,
+            GREATEST(duration, 0) AS duration,
+            CASE WHEN duration <= 0 THEN 0
+                WHEN timestamp = end_time THEN -1
+                WHEN timestamp = start_time THEN 1
+                ELSE 0
+            END AS genesis
+        FROM durations
+        ORDER BY file_id, file_row_number
+    """
+    columns = con.execute(query, {'files': files}).fetchnumpy()
+    con.execute('PRAGMA disable_progress_bar;')
+    con.close()
+    return {'file_id': np.asarray(columns['file_id']),
+            'duration': np.asarray(columns['duration'], dtype=np.int64),
+            'genesis': np.asarray(columns['genesis'], dtype=np.int64)}
+
 def update_parquet(args):
     """
-    Update the duration information in a Parquet file based on cluster data.
-    
+    Write the duration and genesis columns into a Parquet file of the
+    tracking table. The file is read and written with pyarrow, the other
+    columns and the pandas metadata of the cindex index are kept.
+
     Parameters
     ----------
     args : tuple
         A tuple containing:
-        - timestamp_ : pd.Timestamp
-            The timestamp used to filter clusters within a specific time range.
         - file_path : str
             The file path to the Parquet file that needs to be updated.
+        - duration : numpy array
+            Duration of each row of the file, in minutes.
+        - genesis : numpy array
+            Genesis of each row of the file.
+        - options : dict
+            Writer options of the Parquet file.
 
     Returns
     -------
     None
     """
-    timestamp_, file_path = args
+    file_path, duration, genesis, options = args
     try:
-        query = f"""
-        SELECT *
-        FROM df
-        WHERE first_timestamp <= '{timestamp_}' AND last_timestamp >= '{timestamp_}'
-        """
-        clusters = con.execute(query).fetch_df()
-        if clusters.empty:
-            return
-        # Read parquet file
-        feature_df = pd.read_parquet(file_path)
-        # Where iuid is null, set iuid to uid
-        if 'iuid' in feature_df.columns:
-            update = feature_df['iuid'].fillna(feature_df['uid']).reset_index()
-            update.set_index('iuid', inplace=True)
-            clusters = clusters.reset_index()
-            clusters.set_index('iuid', inplace=True)
-        else:
-            update = feature_df['uid'].reset_index()
-            update.set_index('uid', inplace=True)
-            clusters = clusters.reset_index()
-            clusters.set_index('uid', inplace=True)
-        # Update duration, start_time, and end_time
-        update['duration'] = clusters['duration']
-        update['start_time'] = clusters['first_timestamp']
-        update['end_time'] = clusters['last_timestamp']
-        update.set_index('cindex', inplace=True)
-        feature_df['duration'] = update['duration']
-        feature_df['duration'] = feature_df['duration'].fillna(0)
-        feature_df['duration'] = feature_df['duration'].astype(int)
-        # This part is used to compute lifetime using duration module, uncomment if needed
-        # Calculate lifetime based on timestamp and end_time
-        # feature_df['lifetime'] = feature_df['timestamp'] - update['start_time']
-        # feature_df['lifetime'] = feature_df['lifetime'].dt.total_seconds() / 60
-        # feature_df['lifetime'] = feature_df['lifetime'].fillna(0)
-        # feature_df['lifetime'] = feature_df['lifetime'].astype(int)
-        # # This part get lifetime of split clusters and add to splited clusters
-        # if len(feature_df.loc[feature_df['split_cur_idx'].notnull()]) > 0:
-        #     feature_df.reset_index(inplace=True)
-        #     split_frs = feature_df.loc[feature_df['split_cur_idx'].notnull()]
-        #     split_idx = split_frs['split_cur_idx'].values.astype(int)
-        #     lifetimes = feature_df.loc[split_idx]['lifetime']
-        #     feature_df.loc[split_frs.index, 'lifetime'] = lifetimes.values
-        #     feature_df.set_index('cindex', inplace=True)
-        # Add genesis column to indicate the start and end of the cluster
-        feature_df.loc[feature_df['timestamp'] == update['start_time'], 'genesis'] = 1
-        feature_df.loc[feature_df['timestamp'] == update['end_time'], 'genesis'] = -1
-        feature_df['genesis'] = feature_df['genesis'].fillna(0)
-        feature_df['genesis'] = feature_df['genesis'].astype(int)
-        del clusters
-        feature_df.to_parquet(file_path)
+        table = pq.read_table(file_path)
+        if table.num_rows != len(duration):
+            raise ValueError('The file changed after the duration query')
+        metadata = table.schema.metadata or {}
+        pandas_meta = None
+        if b'pandas' in metadata:
+            pandas_meta = json.loads(metadata[b'pandas'])
+        # Columns of a previous run are replaced
+        for col in ('duration', 'genesis'):
+            if col in table.column_names:
+                table = table.remove_column(table.column_names.index(col))
+                if pandas_meta is not None:
+                    pandas_meta['columns'] = [column for column in
+                                              pandas_meta['columns']
+                                              if column['name'] != col]
+        # New columns are written before the index, as by pandas
+        index_cols = []
+        if pandas_meta is not None:
+            index_cols = [col for col in pandas_meta['index_columns']
+                          if isinstance(col, str)]
+        position = table.num_columns - len(index_cols)
+        for col, values in (('genesis', genesis), ('duration', duration)):
+            table = table.add_column(position, col, pa.array(values,
+                                                             pa.int64()))
+        if pandas_meta is not None:
+            meta_position = len(pandas_meta['columns']) - len(index_cols)
+            pandas_meta['columns'][meta_position:meta_position] = [
+                {'name': col, 'field_name': col, 'pandas_type': 'int64',
+                 'numpy_type': 'int64', 'metadata': None}
+                for col in ('duration', 'genesis')]
+            metadata = dict(metadata)
+            metadata[b'pandas'] = json.dumps(pandas_meta).encode()
+            table = table.replace_schema_metadata(metadata)
+        pq.write_table(table, file_path, **options)
     except Exception as e:
         print(f'Error in file {file_path}: {e}')
     return
@@ -7,6 +7,7 @@ import pathlib
 from shapely import wkt
 # from shapely.affinity import affine_transform
 from pyfortracc.utilities.math_utils import uv2angle, uv2magn, calculate_vel_area
+from pyfortracc.utilities.utils import read_parquet
 # from pyfortracc.utilities.utils import get_geotransform, get_pixarea, calculate_pixel_area
 
 
@@ -14,9 +15,11 @@ def convert_parquet_to_family(name_list,defaults_path = 'track', default_undef=-
     
     input_columns = ['uid','threshold_level', 'cluster_id', 'timestamp', 'lifetime', 'size', 'expansion', 'u_', 'v_', 'status', 'geometry']
 
-    #reading the tracking table:
+    #reading the tracking table, only the clusters of the first threshold are used:
     tracking_files = sorted(glob.glob(name_list['output_path'] + defaults_path + '/trackingtable/*.parquet'))
-    tracking_table = pd.concat(pd.read_parquet(f,columns=input_columns) for f in tracking_files)
+    tracking_table = pd.concat(read_parquet(f, input_columns,
+                                            filters=[('threshold_level', '==', 0)])
+                               for f in tracking_files)
     tracking_table = tracking_table[input_columns]
 
     #find NaN, Inf, -Inf, empty strings, None, null, and replace for default_undef:
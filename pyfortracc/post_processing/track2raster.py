@@ -1,6 +1,5 @@
 import glob
 import pandas as pd
-import multiprocessing as mp
 import geopandas as gpd
 import xarray as xr
 import numpy as np
@@ -8,6 +7,7 @@ import pathlib
 from geocube.api.core import make_geocube
 from shapely.wkt import loads
 from pyfortracc.utilities.utils import set_nworkers, get_loading_bar, check_operational_system, get_geotransform
+from pyfortracc.utilities.executor import worker_map, task_chunksize
 from pyfortracc.default_parameters import default_parameters
 
 
@@ -44,12 +44,10 @@ def track2raster(name_list, read_function, columns=None, parallel=False):
     loading_bar = get_loading_bar(files)
     # Check if parallel or not
     if parallel and n_workers > 1:
-        # Create a pool of workers
-        with mp.Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(process_file, [(file, name_list, gtf_inv, columns) for file in files]):
-                loading_bar.update()
-        pool.close()
-        pool.join()
+        args = [(file, name_list, gtf_inv, columns) for file in files]
+        for _ in worker_map(process_file, args, name_list,
+                            chunksize=task_chunksize(len(args), name_list)):
+            loading_bar.update()
     else:
         for file in files:
             process_file((file, name_list, gtf_inv, columns))
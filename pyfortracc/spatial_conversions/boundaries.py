@@ -3,11 +3,12 @@ import pandas as pd
 import pathlib
 from shapely.wkt import loads
 from shapely.affinity import affine_transform
-from multiprocessing import Pool
 from pyfortracc.utilities.utils import (get_parquets, get_loading_bar,
-                                        set_nworkers, check_operational_system,
+                                        check_operational_system,
                                         read_parquet, create_dirs)
+from pyfortracc.utilities.executor import worker_map, task_chunksize
 from pyfortracc.utilities.math_utils import uv2angle, uv2magn, calculate_vel_area
+from pyfortracc.features_extraction.statistics import pixel_geometries
 
 
 
@@ -44,26 +45,21 @@ def boundaries(name_list, start_time, end_time,
     parquets = parquets.groupby(parquets.index)
     loading_bar = get_loading_bar(parquets)
     # geo_transf, _ = get_geotransform(name_list)
-    n_workers = set_nworkers(name_list)
     out_path = name_list['output_path'] + mode +  '/geometry/boundary/'
     # pixel_area, xlat, xlon = calculate_pixel_area(name_list)
     pixel_area, xlat, xlon = None, None, None
     delta_time = name_list['delta_time']
     create_dirs(out_path)
     if parallel:
-        with Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(translate_boundary,
-                                        [(vel_unit,
-                                        out_path, driver, parquet, 
-                                        pixel_area, xlat, xlon, delta_time)
-                                        for _, parquet
-                                        in enumerate(parquets)]):
-                loading_bar.update(1)
-        pool.close()
-        pool.join()
+        args = [(vel_unit, out_path, driver, parquet, pixel_area, xlat, xlon,
+                 delta_time, name_list) for _, parquet in enumerate(parquets)]
+        for _ in worker_map(translate_boundary, args, name_list,
+                            chunksize=task_chunksize(len(args), name_list)):
+            loading_bar.update(1)
     else:
         for _, parquet in enumerate(parquets):
-            translate_boundary((vel_unit, out_path, driver, parquet, pixel_area, xlat, xlon, delta_time))
+            translate_boundary((vel_unit, out_path, driver, parquet, pixel_area, xlat, xlon, delta_time,
+                                name_list))
             loading_bar.update(1)
     loading_bar.close()
 
@@ -82,6 +78,8 @@ def translate_boundary(args):
         3. output_path: The path where the processed file will be saved.
         4. driver: The format/driver for saving the output file (e.g., 'GeoJSON').
         5. parquet: The parquet data to be processed.
+        6. name_list: The name list, used to build the geometries from the pixels when the
+           tracking was done with geometry_method 'lazy'.
     
     Returns
     -------
@@ -100,6 +98,7 @@ def translate_boundary(args):
     xlat = args[5]
     xlon = args[6]
     delta_time = args[7]
+    name_list = args[8]
     parquet_file = parquet['file'].unique()[0]
     file_name = pathlib.Path(parquet_file).name.replace('.parquet', '.'+driver)
     # Open parquet file
@@ -138,8 +137,12 @@ def translate_boundary(args):
     if 'u_mrg' in parquet.columns and 'v_mrg' in parquet.columns:
         columns.append('u_mrg')
         columns.append('v_mrg')
-    # Load geometry
-    geometries = parquet['geometry'].apply(loads)
+    # Load geometry, lazy geometries are built from the pixels
+    if parquet['geometry'].isnull().all() and len(parquet) > 0:
+        geometries = pd.Series(pixel_geometries(parquet, name_list),
+                               index=parquet.index)
+    else:
+        geometries = parquet['geometry'].apply(loads)
     centroids = geometries.apply(lambda x: x.centroid)
     parquet['centroid'] = centroids.apply(lambda x: x.y)
     parquet['clon'] = centroids.apply(lambda x: x.x)
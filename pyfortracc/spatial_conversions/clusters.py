@@ -1,11 +1,11 @@
 import numpy as np
 import xarray as xr
-import pandas as pd
 import pathlib
-from multiprocessing import Pool
 from pyfortracc.utilities.utils import (get_parquets, get_loading_bar,
-                                        set_nworkers, check_operational_system,
+                                        check_operational_system,
                                         create_dirs, get_featstamp)
+from pyfortracc.utilities.executor import worker_map, task_chunksize
+from pyfortracc.utilities.pixels import read_pixels
 from pyfortracc.default_parameters import default_parameters
 
 
@@ -39,18 +39,14 @@ def clusters(name_list, start_time, end_time, read_function, mode='track', cmp_l
     parquets = parquets.loc[start_time:end_time]
     parquets = parquets.groupby(parquets.index)
     loading_bar = get_loading_bar(parquets)
-    n_workers = set_nworkers(name_list)
     out_path = name_list['output_path'] + mode + '/clusters/'
     create_dirs(out_path)
     if parallel:
-        with Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(translate_cluster,
-                                        [(out_path, parquet,
-                                        cmp_lvl, name_list)
-                                        for _, parquet in enumerate(parquets)]):
-                loading_bar.update(1)
-        pool.close()
-        pool.join()
+        args = [(out_path, parquet, cmp_lvl, name_list)
+                for _, parquet in enumerate(parquets)]
+        for _ in worker_map(translate_cluster, args, name_list,
+                            chunksize=task_chunksize(len(args), name_list)):
+            loading_bar.update(1)
     else:
         for _, parquet in enumerate(parquets):
             translate_cluster((out_path, parquet, cmp_lvl, name_list))
@@ -86,20 +82,18 @@ def translate_cluster(args):
     parquet_file = parquet['file'].unique()[0]
     file_name = pathlib.Path(parquet_file).stem
     timestamp = get_featstamp(parquet_file)
-    parquet = pd.read_parquet(parquet_file)
+    parquet, offsets, y_coords, x_coords, _ = read_pixels(parquet_file,
+                                                         ['threshold_level',
+                                                          'uid', 'iuid'],
+                                                         values=False)
     # Get shape and mount zeros array
     shape = (len(n_list['thresholds']), n_list['y_dim'], n_list['x_dim'])
     array = np.full(shape, 0, dtype=float)
-    for i, row in parquet.iterrows():
-        if row['threshold_level'] == 0:
-            level = int(row['threshold_level'])
-            values = row['uid']
-        else:
-            level = int(row['threshold_level'])
-            values = row['iuid']
-        y_coords = row['array_y']
-        x_coords = row['array_x']
-        array[level, y_coords, x_coords] = values
+    # The first threshold level is filled with uid and the others with iuid
+    level = parquet['threshold_level'].values.astype(int)
+    values = np.where(level == 0, parquet['uid'].values, parquet['iuid'].values)
+    sizes = np.diff(offsets)
+    array[np.repeat(level, sizes), y_coords, x_coords] = np.repeat(values, sizes)
     # Create longitude and latitude array
     LON_MIN = n_list['lon_min']
     LON_MAX = n_list['lon_max']
@@ -2,10 +2,10 @@ import geopandas as gpd
 import pathlib
 from shapely.wkt import loads
 from shapely.affinity import affine_transform
-from multiprocessing import Pool
 from pyfortracc.utilities.utils import (get_parquets, get_loading_bar,
-                                        set_nworkers, check_operational_system,
+                                        check_operational_system,
                                         read_parquet, create_dirs)
+from pyfortracc.utilities.executor import worker_map, task_chunksize
 
 
 def vectorfield(name_list, start_time, end_time, driver='GeoJSON', mode = 'track', parallel = True):
@@ -36,18 +36,14 @@ def vectorfield(name_list, start_time, end_time, driver='GeoJSON', mode = 'track
     parquets = parquets.loc[start_time:end_time]
     parquets = parquets.groupby(parquets.index)
     loading_bar = get_loading_bar(parquets)
-    n_workers = set_nworkers(name_list)
     out_path = name_list['output_path'] + mode + '/geometry/vector_field/'
     create_dirs(out_path)
     if parallel:
-        with Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(translate_vfield,
-                                        [(out_path, driver, parquet)
-                                        for _, parquet
-                                        in enumerate(parquets)]):
-                loading_bar.update(1)
-        pool.close()
-        pool.join()
+        args = [(out_path, driver, parquet)
+                for _, parquet in enumerate(parquets)]
+        for _ in worker_map(translate_vfield, args, name_list,
+                            chunksize=task_chunksize(len(args), name_list)):
+            loading_bar.update(1)
     else:
         for _, parquet in enumerate(parquets):
             translate_vfield((out_path, driver, parquet))
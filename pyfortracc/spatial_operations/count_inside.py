@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
+from pyfortracc.utilities.pixels import cluster_pixels
 
-def count_inside(cur_frme, thd_lvl):
+def count_inside(cur_frme, thd_lvl, method='geometry'):
     """
     Counts the number of clusters inside of cur_df.
     
@@ -10,6 +12,11 @@ def count_inside(cur_frme, thd_lvl):
         current frame
     - threshold :  float
         threshold of current frame
+    method : str
+        'geometry' checks if the geometries contain the inside geometries and
+        'pixel' checks if all pixels of the inside clusters are in the same
+        cluster of the current threshold and 'parent' follows the parent_id
+        of the hierarchical segmentation
     
     Returns
     ----------
@@ -29,18 +36,121 @@ def count_inside(cur_frme, thd_lvl):
     cur_thd_idx = cur_frme[cur_frme['threshold_level'] == thd_lvl].index.tolist()
     # Create cur_frme threshold frame
     cur_frme_th = cur_frme.loc[cur_thd_idx]
-    # Create inside frame based on index and apply a buffer to decrease the size
-    # of the geometry and apply a spatial join
     inside_frme = cur_frme.loc[ins_thd_idx]
-    inside_frme.loc[:, 'geometry'] = inside_frme['geometry'].buffer(-0.001)
-    # Spatial join (contains)
-    contains = cur_frme_th[['geometry']].sjoin(inside_frme[['geometry']],
-                                            predicate="contains",
-                                            lsuffix="base", 
-                                            rsuffix="inside").reset_index()
+    if method == 'pixel':
+        contains = inside_pixels(cur_frme_th, inside_frme)
+    elif method == 'parent':
+        contains = inside_parents(cur_frme, thd_lvl)
+    else:
+        # Apply a buffer to decrease the size of the inside geometries
+        # and apply a spatial join
+        inside_frme.loc[:, 'geometry'] = inside_frme['geometry'].buffer(-0.001)
+        # Spatial join (contains)
+        contains = cur_frme_th[['geometry']].sjoin(inside_frme[['geometry']],
+                                                predicate="contains",
+                                                lsuffix="base", 
+                                                rsuffix="inside").reset_index()
     # Pivot table and groupby to get a list of inside clusters
     contains = contains.pivot_table(columns=["index","index_inside"],
                                     aggfunc="size").reset_index()
     contains = contains.groupby('index')['index_inside'].apply(list).to_frame()
     contains['inside_len'] = contains['index_inside'].apply(lambda x: len(x))
     return cur_thd_idx, ins_thd_idx, contains
+
+
+def inside_pixels(cur_frme_th, inside_frme):
+    """
+    Find the cluster of the current threshold that contains each inside cluster
+    by their pixels.
+
+    The clusters of the current threshold are drawn in a label raster over the
+    bounding box of the inside clusters, and an inside cluster is contained
+    when the raster has the same label at all of its pixels. As the thresholds
+    are nested, this is the same of the containment of the geometries when
+    convex_hull is False, without depending on the units of the grid.
+
+    Parameters
+    ----------
+    cur_frme_th : DataFrame
+        clusters of the current threshold
+    inside_frme : DataFrame
+        clusters of the inside thresholds
+
+    Returns
+    ----------
+    contains : DataFrame
+        index of the containing cluster (index) and of the inside cluster
+        (index_inside) for each contained cluster
+    """
+    contains = pd.DataFrame({'index': cur_frme_th.index.values[:0],
+                             'index_inside': inside_frme.index.values[:0]})
+    cur_off, cur_y, cur_x, _ = cluster_pixels(cur_frme_th, values=False)
+    ins_off, ins_y, ins_x, _ = cluster_pixels(inside_frme, values=False)
+    if len(cur_y) == 0 or len(ins_y) == 0:
+        return contains
+    # Label raster of the current threshold over the inside clusters
+    y_min, x_min = ins_y.min(), ins_x.min()
+    raster = np.full((ins_y.max() - y_min + 1, ins_x.max() - x_min + 1), -1,
+                     dtype=np.int32)
+    cur_pos = np.repeat(np.arange(len(cur_frme_th), dtype=np.int32),
+                        np.diff(cur_off))
+    in_box = ((cur_y >= y_min) & (cur_y < y_min + raster.shape[0]) &
+              (cur_x >= x_min) & (cur_x < x_min + raster.shape[1]))
+    raster[cur_y[in_box] - y_min, cur_x[in_box] - x_min] = cur_pos[in_box]
+    labels = raster[ins_y - y_min, ins_x - x_min]
+    # An inside cluster is contained if all its pixels have the same label
+    has_pixels = np.diff(ins_off) > 0
+    starts = ins_off[:-1][has_pixels]
+    lowest = np.minimum.reduceat(labels, starts)
+    highest = np.maximum.reduceat(labels, starts)
+    inside = (lowest == highest) & (lowest >= 0)
+    contains = pd.DataFrame({
+        'index': cur_frme_th.index.values[lowest[inside]],
+        'index_inside': inside_frme.index.values[has_pixels][inside]})
+    return contains
+
+
+def inside_parents(cur_frme, thd_lvl):
+    """
+    Find the cluster of the current threshold that contains each inside cluster
+    by the parent_id column of the hierarchical segmentation.
+
+    The ancestor of the clusters of each threshold level is the ancestor of
+    their parent in the previous level, starting from the clusters of the
+    current threshold. It is the same of the 'pixel' method when the parents
+    are kept by min_cluster_size, that is the case of non increasing sizes.
+
+    Parameters
+    ----------
+    cur_frme : DataFrame
+        current frame with the parent_id column
+    thd_lvl : int
+        threshold level of the containing clusters
+
+    Returns
+    ----------
+    contains : DataFrame
+        index of the containing cluster (index) and of the inside cluster
+        (index_inside) for each contained cluster
+    """
+    if 'parent_id' not in cur_frme.columns:
+        raise ValueError("inside_method 'parent' needs segmentation_method "
+                         "'hierarchical'")
+    levels = cur_frme['threshold_level'].values
+    cluster_ids = cur_frme['cluster_id'].values
+    parents = cur_frme['parent_id'].values
+    # Containing cluster of each cluster id of the current level
+    base = levels == thd_lvl
+    ancestor = pd.Series(cur_frme.index.values[base], index=cluster_ids[base])
+    index, index_inside = [], []
+    for level in range(thd_lvl + 1, levels.max() + 1):
+        rows = levels == level
+        ancestors = ancestor.reindex(parents[rows]).values
+        ancestor = pd.Series(ancestors, index=cluster_ids[rows])
+        found = ~pd.isna(ancestors)
+        index.append(ancestors[found])
+        index_inside.append(cur_frme.index.values[rows][found])
+    contains = pd.DataFrame({
+        'index': np.concatenate(index).astype(cur_frme.index.dtype),
+        'index_inside': np.concatenate(index_inside)})
+    return contains
@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely import affinity
+from pyfortracc.utilities.pixels import cluster_pixels
 
 
 def edge_clusters(cur_df, left_edge, right_edge, name_lst):
@@ -24,6 +26,8 @@ def edge_clusters(cur_df, left_edge, right_edge, name_lst):
     touch_lower : list
         list of clusters touching the left edge
     """
+    if name_lst['edges_method'] == 'pixel':
+        return edge_pixels(cur_df, left_edge, right_edge, name_lst)
     # Set output
     touch_larger, touch_lower = [], []
     # Check if there is any intersected right_board
@@ -88,3 +92,117 @@ def edge_clusters(cur_df, left_edge, right_edge, name_lst):
         touch_lower.extend(lowest_idx)
  
     return touch_larger, touch_lower
+
+
+def edge_pixels(cur_df, left_edge, right_edge, name_lst):
+    """
+    This function links the clusters split by the edges of a periodic domain by
+    their pixels near the first and last columns of the grid.
+
+    The clusters touching the left and the right edge are linked with the same
+    tolerance of edge_clusters, where both clusters are buffered by x_res: two
+    pixels across the edge are linked when the distance between them is at
+    most 2 * x_res, e.g. a gap of up to two rows in the edge columns, or a
+    diagonal gap of one row and one column. The clusters are grouped as in
+    edge_clusters: each cluster of the left edge with the clusters of the
+    right edge it touches, and the other clusters of the group point to the
+    largest one, so both methods give the same board_idx.
+    The clusters are only linked when the right edge shifted by 360 degrees is
+    the left edge, as in edge_clusters.
+
+    Parameters
+    ----------
+    cur_df : GeoDataFrame
+        current frame
+    left_edge : GeoDataFrame
+        left edge
+    right_edge : GeoDataFrame
+        right edge
+    name_lst : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    ----------
+    touch_larger : list
+        list of largest clusters of each group
+    touch_lower : list
+        list of the other clusters of each group
+    """
+    # Set output
+    touch_larger, touch_lower = [], []
+    # Get the shift from the right to the left edge, same as edge_clusters
+    left_coord = left_edge['geometry'].iloc[0].coords[0][0]
+    rigth_coord = right_edge['geometry'].iloc[0].coords[0][0]
+    if rigth_coord + name_lst['x_res'] > 180:
+        shift = -360
+    elif rigth_coord - name_lst['x_res'] < -180:
+        shift = 360
+    else:
+        shift = 0
+    if abs(rigth_coord + shift - left_coord) >= name_lst['x_res'] or cur_df.empty:
+        return touch_larger, touch_lower
+    # Pixels of the clusters touching each edge, up to two columns from the
+    # edge, as the buffers of x_res on both sides reach 2 * x_res
+    offsets, array_y, array_x, _ = cluster_pixels(cur_df, values=False)
+    position = np.repeat(np.arange(len(cur_df)), np.diff(offsets))
+    last = name_lst['x_dim'] - 1
+    on_left = np.zeros(len(cur_df), dtype=bool)
+    on_left[position[array_x == 0]] = True
+    on_right = np.zeros(len(cur_df), dtype=bool)
+    on_right[position[array_x == last]] = True
+    near_left = on_left[position] & (array_x <= 2)
+    near_right = on_right[position] & (array_x >= last - 2)
+    left = pd.DataFrame({'row': array_y[near_left],
+                         'col_1': array_x[near_left],
+                         'pos_1': position[near_left]}).drop_duplicates()
+    right = pd.DataFrame({'row': array_y[near_right],
+                          'col_2': last - array_x[near_right],
+                          'pos_2': position[near_right]}).drop_duplicates()
+    # Pairs of pixels across the edge at most 2 * x_res apart
+    reach = 2 * name_lst['x_res']
+    max_drow = int(np.floor(reach / name_lst['y_res'])) + 1
+    pairs = pd.concat([left.assign(row=left['row'] + drow, drow=abs(drow))
+                       .merge(right, on='row')
+                       for drow in range(-max_drow, max_drow + 1)])
+    col_gap = (pairs['col_1'] + pairs['col_2']) * name_lst['x_res']
+    row_gap = np.maximum(pairs['drow'] - 1, 0) * name_lst['y_res']
+    pairs = pairs.loc[col_gap ** 2 + row_gap ** 2 <= reach ** 2]
+    pairs = pairs[['pos_1', 'pos_2']].drop_duplicates()
+    pairs = pairs.loc[pairs['pos_1'] != pairs['pos_2']]
+    if pairs.empty:
+        return touch_larger, touch_lower
+    # As edge_clusters, each cluster of the left edge is grouped with the
+    # clusters of the right edge it touches, and the other clusters of the
+    # group point to its largest cluster, the left cluster or the first
+    # right cluster on ties
+    index = cur_df.index.values
+    sizes = cur_df['size'].values.astype(float)
+    pairs = pairs.assign(label_1=index[pairs['pos_1'].values],
+                         label_2=index[pairs['pos_2'].values],
+                         size_1=sizes[pairs['pos_1'].values],
+                         size_2=sizes[pairs['pos_2'].values])
+    pairs = pairs.sort_values(['label_1', 'label_2'], kind='stable')
+    pairs = pairs.reset_index(drop=True)
+    first = pairs.sort_values(['label_1', 'size_2'], ascending=[True, False],
+                              kind='stable').drop_duplicates('label_1')
+    first = first.set_index('label_1')
+    left_largest = first['size_1'] >= first['size_2']
+    largest = np.where(left_largest, first.index.values, first['label_2'].values)
+    largest = pd.Series(largest, index=first.index)
+    pairs['largest'] = largest.loc[pairs['label_1'].values].values
+    # Lower clusters of each group: the left cluster first, then the right
+    # clusters in order
+    left = first.loc[~left_largest.values]
+    lower = pd.concat([pd.DataFrame({'label_1': left.index.values, 'order': -1,
+                                     'larger': largest.loc[left.index].values,
+                                     'lower': left.index.values}),
+                       pd.DataFrame({'label_1': pairs['label_1'].values,
+                                     'order': pairs.index.values,
+                                     'larger': pairs['largest'].values,
+                                     'lower': pairs['label_2'].values})])
+    lower = lower.loc[lower['lower'] != lower['larger']]
+    lower = lower.sort_values(['label_1', 'order'], kind='stable')
+    touch_larger = lower['larger'].tolist()
+    touch_lower = lower['lower'].tolist()
+    return touch_larger, touch_lower
+
@@ -1,5 +1,29 @@
+import numpy as np
 import pandas as pd
 
+
+def sum_sizes(frame, idx_lists):
+    """
+    This function sums the size of the clusters of a frame for each list of index.
+
+    Parameters
+    ----------
+    frame : geopandas.GeoDataFrame
+        Frame with the size of the clusters.
+    idx_lists : pandas.Series
+        Index of the clusters to be summed, as lists or single values.
+
+    Returns
+    -------
+    sizes : numpy array
+        Sum of the sizes for each element of idx_lists.
+    """
+    idx = idx_lists.reset_index(drop=True).explode().dropna()
+    sizes = pd.Series(frame.loc[idx.values, 'size'].values, index=idx.index)
+    sizes = sizes.groupby(level=0).sum()
+    return sizes.reindex(range(len(idx_lists)), fill_value=0).values
+
+
 def expansion(cur_df, prv_trj, prv_df, cur_news, dt, merg_exp, spl_exp):
     """
     This function calculates the normalized expansion between two clusters.
@@ -8,6 +32,8 @@ def expansion(cur_df, prv_trj, prv_df, cur_news, dt, merg_exp, spl_exp):
     ----------
     cur_df : geopandas.GeoDataFrame
         Current dataframe.
+    prv_trj : geopandas.GeoDataFrame
+        Previous clusters of the current dataframe, aligned with cur_df.
     prv_df : geopandas.GeoDataFrame
         Previous dataframe.
     dt : float
@@ -19,40 +45,41 @@ def expansion(cur_df, prv_trj, prv_df, cur_news, dt, merg_exp, spl_exp):
     
     Returns
     -------
-    expansions : list
-        List of normalized expansion values for each cluster.
+    expansion_idx : numpy array
+        Index of the clusters of each expansion value.
+    expansions : numpy array
+        Normalized expansion values for each cluster.
     """
-    expansions = []
-    expansion_idx = []
     #dt from minutes to seconds:
     dt = dt * 60
-    for i,row in cur_df.iterrows():
-        if isinstance(row['merge_idx'], list) and merg_exp: # Merge expansion correction
-            #Get the size of the current and previous clusters:
-            p=prv_df.loc[row['merge_idx']]['size'].sum() 
-            #Get the size of the current cluster:
-            c=row['size']
-            expansion = ((1 / ((c + p) / 2)) * ((c - p) / dt)) * 1e6
-            expansions.append(expansion)
-            expansion_idx.append(i)
-        if not pd.isna(row['split_cr_idx']) and spl_exp: # Split expansion correction
-            # Get the size of the current cluster:
-            c = row['size']
-            # Get the size of the previous cluster:
-            p = prv_df.loc[row['past_idx']]['size']
-            # Get the size of the new cluster generated by the split:
-            c_new = cur_news.loc[row['split_cr_idx']]['size'].sum()
+    # Get the size of the current and previous clusters
+    c = cur_df['size'].values
+    p = prv_trj['size'].values
+    expansions = ((1 / ((c + p) / 2)) * ((c - p) / dt)) * 1e6
+    if spl_exp: # Split expansion correction
+        splits = cur_df['split_cr_idx'].notnull().values
+        if splits.any():
             # C = área corrente (current size)
             # P = área no tempo anterior (previous size)
             # C_new = área do novo sistema gerado pelo split (não pertence ao sistema que está sendo corrigido)
-            expansion = ((1 / ((c + (p - c_new)) / 2)) * ((c - (p - c_new)) / dt)) * 1e6
-            expansions.append(expansion)
-            expansion_idx.append(i)
-        else:
-            p=prv_df.loc[row['past_idx']]['size']
-            c=row['size']
-            expansion = ((1 / ((c + p) / 2)) * ((c - p) / dt)) * 1e6
-            expansions.append(expansion)
-            expansion_idx.append(i)
-
-    return expansion_idx, expansions
\ No newline at end of file
+            c_s, p_s = c[splits], p[splits]
+            c_new = sum_sizes(cur_news, cur_df['split_cr_idx'].loc[splits])
+            expansions[splits] = ((1 / ((c_s + (p_s - c_new)) / 2)) *
+                                  ((c_s - (p_s - c_new)) / dt)) * 1e6
+    expansion_idx = cur_df.index.values
+    if merg_exp: # Merge expansion correction
+        merges = np.array([isinstance(idx, list)
+                           for idx in cur_df['merge_idx'].values], dtype=bool)
+        if merges.any():
+            # Sum of the size of the merged previous clusters
+            p_m = sum_sizes(prv_df, cur_df['merge_idx'].loc[merges])
+            c_m = c[merges]
+            mrg_exp = ((1 / ((c_m + p_m) / 2)) * ((c_m - p_m) / dt)) * 1e6
+            # The merge value of a cluster comes before its other value
+            rows = np.concatenate((np.flatnonzero(merges),
+                                   np.arange(len(cur_df))))
+            order = np.argsort(rows, kind='stable')
+            expansion_idx = np.concatenate((expansion_idx[merges],
+                                            expansion_idx))[order]
+            expansions = np.concatenate((mrg_exp, expansions))[order]
+    return expansion_idx, expansions
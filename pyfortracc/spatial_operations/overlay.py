@@ -1,3 +1,8 @@
+import numpy as np
+import pandas as pd
+from pyfortracc.utilities.pixels import cluster_pixels
+
+
 def overlay_(cur_df, prv_df, min_overlap):
     """ 
     This function overlays two dataframes and returns the result.
@@ -28,4 +33,61 @@ def overlay_(cur_df, prv_df, min_overlap):
     overlays["overlap"] = (overlays["ovrlp_area"] * 100) / overlays["prv_area"]
     # Filter the overlays based on the minimum
     overlays = overlays.loc[overlays["overlap"] >= min_overlap]
-    return overlays
\ No newline at end of file
+    return overlays
+
+
+def overlay_pixels(cur_df, prv_df, min_overlap):
+    """
+    This function overlays two dataframes by their pixels and returns the result.
+
+    Each pixel belongs to a single cluster of a threshold, so the overlap is
+    the count of pixels shared by each pair of clusters (a sparse contingency
+    table of current cluster by previous cluster). The result is the same of
+    overlay_ for the clusters geometries, without the convex hull.
+
+    Parameters
+    ----------
+    cur_df : geopandas.GeoDataFrame
+        Current dataframe.
+    prv_df : geopandas.GeoDataFrame
+        Previous dataframe.
+    min_overlap : float
+        Minimum overlap percentage.
+
+    Returns
+    -------
+    overlays : pandas.DataFrame
+        Dataframe with the overlays.
+    """
+    # Flatten the pixels of the clusters into a single index
+    cur_offsets, cur_y, cur_x, _ = cluster_pixels(cur_df, values=False)
+    prv_offsets, prv_y, prv_x, _ = cluster_pixels(prv_df, values=False)
+    cur_sizes = np.diff(cur_offsets)
+    prv_sizes = np.diff(prv_offsets)
+    n_cols = max(cur_x.max(), prv_x.max()) + 1
+    cur_pix = cur_y * n_cols + cur_x
+    prv_pix = prv_y * n_cols + prv_x
+    # Position of the cluster of each pixel
+    cur_pos = np.repeat(np.arange(len(cur_df)), cur_sizes)
+    prv_pos = np.repeat(np.arange(len(prv_df)), prv_sizes)
+    # Shared pixels between the frames
+    _, cur_shr, prv_shr = np.intersect1d(cur_pix, prv_pix, assume_unique=True,
+                                         return_indices=True)
+    # Count the shared pixels of each pair of clusters
+    pairs = cur_pos[cur_shr] * len(prv_df) + prv_pos[prv_shr]
+    pairs, ovrlp_area = np.unique(pairs, return_counts=True)
+    cur_idx, prv_idx = np.divmod(pairs, len(prv_df))
+    overlays = pd.DataFrame({
+        'index_1': cur_df.index.values[cur_idx],
+        'cluster_id_1': cur_df['cluster_id'].values[cur_idx],
+        'size_1': cur_df['size'].values[cur_idx],
+        'index_2': prv_df.index.values[prv_idx],
+        'cluster_id_2': prv_df['cluster_id'].values[prv_idx],
+        'size_2': prv_df['size'].values[prv_idx],
+        'prv_area': prv_sizes[prv_idx],
+        'ovrlp_area': ovrlp_area})
+    # Calculate the overlap percentage between the current and previous dataframes
+    overlays['overlap'] = (overlays['ovrlp_area'] * 100) / overlays['prv_area']
+    # Filter the overlays based on the minimum
+    overlays = overlays.loc[overlays['overlap'] >= min_overlap]
+    return overlays
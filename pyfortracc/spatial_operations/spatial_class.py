@@ -2,6 +2,56 @@ import numpy as np
 import pandas as pd
 
 
+def id_counts(ids):
+    """
+    Count how many times the cluster id of each overlap pair appears in the
+    overlays, null ids are counted as zero.
+
+    Parameters
+    ----------
+    ids : array
+        Cluster ids of the overlap pairs.
+
+    Returns
+    ----------
+    counts : array
+        Number of overlap pairs with the same cluster id of each pair.
+    """
+    counts = np.zeros(len(ids), dtype=np.int64)
+    valid = pd.notnull(ids)
+    if valid.any():
+        _, inverse, n_ids = np.unique(ids[valid], return_inverse=True,
+                                      return_counts=True)
+        counts[valid] = n_ids[inverse.ravel()]
+    return counts
+
+
+def group_rows(keys):
+    """
+    Sort the rows by key, keeping the order of the rows with the same key.
+
+    Parameters
+    ----------
+    keys : array
+        Group key of each row.
+
+    Returns
+    ----------
+    order : array
+        Positions of the rows sorted by key.
+    group : array
+        Group number of each sorted row.
+    starts : array
+        Position in order of the first row of each group.
+    """
+    _, group = np.unique(keys, return_inverse=True)
+    group = group.ravel()
+    order = np.argsort(group, kind='stable')
+    group = group[order]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    return order, group, starts
+
+
 def continuous(operation):
     """ 
     Identify and retrieve information about continuous clusters.
@@ -26,12 +76,9 @@ def continuous(operation):
         array containing 'index_2' for previous frame
     """
     # Get continuous clusters, i.e. clusters that are present in both frames
-    cont_cur = operation.groupby("cluster_id_1").filter(lambda group:
-                                group["cluster_id_1"].count() == 1).index.values
-    cont_past = operation.groupby("cluster_id_2").filter(lambda group:
-                                group["cluster_id_2"].count() == 1).index.values
-    # Get intersection of continuous clusters
-    conts = np.intersect1d(cont_cur, cont_past)
+    conts = ((id_counts(operation['cluster_id_1'].values) == 1) &
+             (id_counts(operation['cluster_id_2'].values) == 1))
+    conts = np.sort(operation.index.values[conts])
     cont_indx_1 = operation.loc[conts]['index_1'].values
     cont_indx_2 = operation.loc[conts]['index_2'].values
     return cont_indx_1, cont_indx_2
@@ -61,23 +108,29 @@ def merge(operation):
     merge_frame : DataFrame
         DataFrame containing detailed information about merging clusters,
     """
-    mergs_ = np.array(operation[
-                    (operation.duplicated(subset=["cluster_id_1"], keep=False))
-                    & ~operation["cluster_id_1"].isnull()].index.values)
-    mergs_idx_1 = operation.loc[mergs_]['index_1'].values
-    mergs_idx_1 = np.unique(mergs_idx_1)
+    mergs_ = operation.loc[id_counts(operation['cluster_id_1'].values) > 1]
+    merge_frame = pd.DataFrame(columns=['index_1', 'merge_ids', 'merge_counts',
+                                        'index_2', 'cluster_id_2'])
+    if mergs_.empty:
+        return np.array([]), np.array([]), merge_frame
+    # Group the merging pairs by current cluster
+    order, group, starts = group_rows(mergs_['index_1'].values)
+    index_1 = mergs_['index_1'].values[order]
+    index_2 = mergs_['index_2'].values[order]
+    size_2 = mergs_['size_2'].values[order]
+    # First previous cluster with the largest size of each merge
+    max_size = np.maximum.reduceat(size_2, starts)
+    is_max = np.flatnonzero(size_2 == max_size[group])
+    _, first_max = np.unique(group[is_max], return_index=True)
+    first_max = is_max[first_max]
     # Add complete merge information
-    merges_gp = operation.loc[mergs_][['index_1','index_2',
-                                        'cluster_id_2','size_2']]
-    merges_ids = merges_gp.groupby('index_1')['index_2'].apply(list)
-    merges_ids = merges_ids.reset_index(name='merge_ids')
-    merge_counts = merges_gp.groupby('index_1')['size_2'].apply(list)
-    merge_counts = merge_counts.reset_index(name='merge_counts')
-    mergMax = merges_gp.loc[merges_gp.groupby('index_1')['size_2'].idxmax()]
-    mergMax = mergMax.reset_index()[['index_1','index_2','cluster_id_2']]
-    merge_frame = pd.merge(merges_ids, merge_counts, on='index_1')
-    merge_frame = pd.merge(merge_frame, mergMax, on='index_1')
-    merge_frame = merge_frame.loc[merge_frame['index_1'].isin(mergs_idx_1)]
+    merge_frame = pd.DataFrame({
+        'index_1': index_1[starts],
+        'merge_ids': [ids.tolist() for ids in np.split(index_2, starts[1:])],
+        'merge_counts': [cnt.tolist() for cnt in np.split(size_2, starts[1:])],
+        'index_2': index_2[first_max],
+        'cluster_id_2': mergs_['cluster_id_2'].values[order][first_max]})
+    mergs_idx_1 = merge_frame['index_1'].values
     mergs_idx_2 = merge_frame['index_2'].values
     return mergs_idx_1, mergs_idx_2, merge_frame
 
@@ -103,34 +156,27 @@ def split(operation):
     - new_splts_prev_idx (array): containing 'index_2' previous are new splits
     """
     # Get splitting clusters, i.e. clusters that are present in both frames
-    splits_ = np.array(operation[
-                      (operation.duplicated(subset=["cluster_id_2"],keep=False))
-                      & ~operation["cluster_id_2"].isnull()].index.values)
-    splits_idx = operation.loc[splits_]['index_1'].values
-    splits_idx = np.unique(splits_idx)
-    splits_group = operation.loc[splits_][['index_1','index_2','cluster_id_1',
-                                           'cluster_id_2','size_1']]
-    splits_group = splits_group.groupby('cluster_id_2')
-    splits_idx = []
-    split_prev_idx = []
-    new_splts_idx = []
-    new_splts_prev_idx = []
-    new_splt_comming_idx = []
-    for _, sgroup in splits_group:
-        max_count = sgroup['size_1'].max()
-        max_idx = sgroup.loc[sgroup['size_1'] == max_count]['index_1'].values
-        min_idx = sgroup.loc[sgroup['size_1'] != max_count]['index_1'].values
-        splits_idx.append(max_idx[0])
-        split_prev_idx.append(sgroup['index_2'].unique()[0])
-        new_splts_idx.extend(min_idx)
-        new_splts_prev_idx.extend([sgroup['index_2'].unique()[0]]*len(min_idx))
-        new_splt_comming_idx.extend([sgroup['index_1'].unique()[0]]*len(min_idx))
-    # Convert lists to array
-    splits_idx = np.array(splits_idx)
-    split_prev_idx = np.array(split_prev_idx)
-    new_splts_idx = np.array(new_splts_idx)
-    new_splts_prev_idx = np.array(new_splts_prev_idx)
-    new_splt_comming_idx = np.array(new_splt_comming_idx)
+    splits_ = operation.loc[id_counts(operation['cluster_id_2'].values) > 1]
+    if splits_.empty:
+        return (np.array([]), np.array([]), np.array([]), np.array([]),
+                np.array([]))
+    # Group the splitting pairs by previous cluster
+    order, group, starts = group_rows(splits_['cluster_id_2'].values)
+    index_1 = splits_['index_1'].values[order]
+    index_2 = splits_['index_2'].values[order]
+    size_1 = splits_['size_1'].values[order]
+    # The first current cluster with the largest size continues the split,
+    # the others are new splits
+    max_size = np.maximum.reduceat(size_1, starts)
+    max_row = size_1 == max_size[group]
+    is_max = np.flatnonzero(max_row)
+    _, first_max = np.unique(group[is_max], return_index=True)
+    splits_idx = index_1[is_max[first_max]]
+    split_prev_idx = index_2[starts]
+    new_splts = ~max_row
+    new_splts_idx = index_1[new_splts]
+    new_splts_prev_idx = split_prev_idx[group[new_splts]]
+    new_splt_comming_idx = index_1[starts][group[new_splts]]
     return splits_idx, split_prev_idx, new_splts_idx, new_splts_prev_idx, new_splt_comming_idx
 
 
@@ -163,14 +209,19 @@ def merge_split(mergs_idx_1, splits_idx_1, cur_frame, prev_frame):
 
     # Find intersection of merging and splitting clusters using set operations, find duplicated past_idx values
     cur_mrgsplt_idx = np.intersect1d(mergs_idx_1, splits_idx_1)
-    past_index = []
-    if len(cur_mrgsplt_idx) > 0:
-        # For event in cur_mrgsplt_idx:
-        for idx in cur_mrgsplt_idx:
-            prv_idx = cur_frame.loc[idx][['split_pr_idx','merge_idx']].explode().dropna().values
-            prv_idx = np.unique(prv_idx)
-            # Get index of the largest cluster in the previous frame
-            prv_idx = prev_frame.loc[prev_frame.index.isin(prv_idx)]['size'].idxmax()
-            # Append to past_index
-            past_index.append(prv_idx)
-    return cur_mrgsplt_idx, past_index
\ No newline at end of file
+    if len(cur_mrgsplt_idx) == 0:
+        return cur_mrgsplt_idx, np.array([])
+    # Previous clusters of each event, from the split and merge columns
+    events = cur_frame.loc[cur_mrgsplt_idx]
+    prv_idx = pd.concat([events['split_pr_idx'],
+                         events['merge_idx'].explode()]).dropna()
+    event = np.searchsorted(cur_mrgsplt_idx, prv_idx.index.values)
+    prv_pos = prev_frame.index.get_indexer(prv_idx.values.astype(np.int64))
+    event, prv_pos = event[prv_pos >= 0], prv_pos[prv_pos >= 0]
+    # Get index of the largest cluster in the previous frame, the first one
+    # in the previous frame order on ties
+    prv_size = prev_frame['size'].values[prv_pos]
+    order = np.lexsort((prv_pos, -prv_size.astype(np.float64), event))
+    _, first = np.unique(event[order], return_index=True)
+    past_index = prev_frame.index.values[prv_pos[order][first]]
+    return cur_mrgsplt_idx, past_index
@@ -1,9 +1,8 @@
 import pandas as pd
 import numpy as np
 import pathlib
-from multiprocessing import Pool
 from shapely.geometry import LineString
-from shapely.wkt import loads
+import shapely
 from pyfortracc.default_parameters import default_parameters
 from pyfortracc.utilities.utils import (get_feature_files, get_edges,
                                         get_loading_bar, get_previous_file,
@@ -11,14 +10,19 @@ from pyfortracc.utilities.utils import (get_feature_files, get_edges,
                                         check_operational_system,
                                         get_geotransform, set_nworkers, 
                                         create_dirs, set_schema, set_outputdf,
-                                        read_parquet, write_parquet)
+                                        read_parquet, write_parquet,
+                                        parquet_options)
+from pyfortracc.utilities.manifest import stage_files, set_stage
+from pyfortracc.utilities.executor import worker_map
+from pyfortracc.utilities.profiler import profile_step, file_size
+from pyfortracc.features_extraction.statistics import pixel_geometries
 from pyfortracc.vector_methods.split_mtd import split_mtd
 from pyfortracc.vector_methods.merge_mtd import merge_mtd
 from pyfortracc.vector_methods.incores_mtd import innercores_mtd
 from pyfortracc.vector_methods.opticalflow_mtd import opticalflow_mtd
 from pyfortracc.vector_methods.ellipse_mtd import ellipse_mtd
 from .count_inside import count_inside
-from .overlay import overlay_
+from .overlay import overlay_, overlay_pixels
 from .spatial_class import continuous, merge, split, merge_split
 from .expansion import expansion
 from .trajectory import trajectory
@@ -50,12 +54,15 @@ def spatial_operations(name_lst, read_fnc, parallel=True):
     name_lst, parallel = check_operational_system(name_lst, parallel)
     # Get feature files to be processed
     feat_path = name_lst['output_path'] + 'track/processing/features/'
-    feat_files = get_feature_files(feat_path)
+    feat_files = stage_files(name_lst, 'features')
+    if feat_files is None:
+        feat_files = get_feature_files(feat_path)
     #feat_files = get_previous_proccessed_files(name_lst, feat_files)
     # Set ouput to spatial operations
     output_path = name_lst['output_path'] + 'track/processing/spatial/'
     name_lst['output_spatial'] = output_path
     create_dirs(output_path)  # Create the directories
+    set_stage(name_lst, 'spatial')
     # Get edges of the data, used to check if the cluster is on the edges
     left_edge, right_edge = get_edges(name_lst, feat_files, read_fnc)
     # Get loading bar
@@ -66,37 +73,58 @@ def spatial_operations(name_lst, read_fnc, parallel=True):
     prev_skip = name_lst['num_prev_skip']
     # Get geotransform
     geotrf, inv_geotrf = get_geotransform(name_lst)
+    args = [(feat_time, feat_file,
+             feat_files[feat_time - 1: feat_time],
+             feat_files[(feat_time - 1 + prev_skip) - 1: feat_time],
+             name_lst, left_edge, right_edge,
+             read_fnc, schema, False, geotrf)
+            for feat_time, feat_file in enumerate(feat_files)]
     if parallel:
         # Set number of workers
         n_workers = set_nworkers(name_lst)
-        with Pool(n_workers) as pool:
-            for _ in pool.imap_unordered(spatial_operation,
-                                         [(feat_time, feat_file,
-                                           feat_files[feat_time - 1:
-                                                      feat_time],
-                                           feat_files[(feat_time - 1 +
-                                                       prev_skip) - 1:
-                                                      feat_time],
-                                           name_lst, left_edge, right_edge,
-                                           read_fnc, schema, False, geotrf)
-                                          for feat_time, feat_file
-                                          in enumerate(feat_files)]):
-                loading_bar.update(1)
-        pool.close()
+        # Each worker processes contiguous chunks of files, so the previous
+        # frame is read only at the start of the chunk. There are more chunks
+        # than workers to balance the load
+        chunks = np.array_split(np.arange(len(args)),
+                                min(len(args), n_workers * 4))
+        for n_files in worker_map(spatial_chunk,
+                                  [args[chunk[0]:chunk[-1] + 1]
+                                   for chunk in chunks], name_lst):
+            loading_bar.update(n_files)
     else:
-        for feat_time, feat_file in enumerate(feat_files):
-            spatial_operation((feat_time, feat_file,
-                               feat_files[feat_time - 1: feat_time],
-                               feat_files[(feat_time - 1 + prev_skip) - 1:
-                                          feat_time],
-                               name_lst, left_edge, right_edge, 
-                               read_fnc, schema, False, geotrf))
-            loading_bar.update(1)
+        spatial_chunk(args, loading_bar)
     loading_bar.close()
+    set_stage(name_lst, 'spatial', output_path)
     return
 
 
-def spatial_operation(args):
+def spatial_chunk(chunk, loading_bar=None):
+    """
+    Process the spatial operations of contiguous files, keeping the loaded
+    frames in memory. Each frame is read and parsed once, and used again as
+    the previous frame of the next files.
+
+    Parameters
+    ----------
+    chunk : list
+        Arguments of spatial_operation of each file, in time order.
+    loading_bar : tqdm, optional
+        Loading bar updated for each file.
+
+    Returns
+    -------
+    int
+        Number of processed files.
+    """
+    frames = {}
+    for args in chunk:
+        spatial_operation(args, frames)
+        if loading_bar is not None:
+            loading_bar.update(1)
+    return len(chunk)
+
+
+def spatial_operation(args, frames=None):
     """
     Processes spatial operations for a given file, including computing cluster details, trajectories, and vector fields.
 
@@ -138,6 +166,9 @@ def spatial_operation(args):
             Schema or format of the data.
         - fct : bool
             Flag indicating if the data comes from a forecast.
+    frames : dict, optional
+        Cache of the loaded frames by file, updated with the current frame.
+        If None, the frames are read from the files.
 
     Returns
     -------
@@ -149,12 +180,137 @@ def spatial_operation(args):
     # Get current_file name using pathlib
     current_file_name = pathlib.Path(cur_file).name
     output_file = nm_lst['output_spatial'] + current_file_name
-    thresholds = nm_lst['thresholds']
     # Set necessary columns to spatial operations
     necs_cols = ['cluster_id','threshold_level', 'threshold', 'size',
-                'geometry', 'centroid', 'file','array_y', 'array_x']
-    # Read current file
-    cur_frame = read_parquet(cur_file, necs_cols)
+                'geometry', 'file','array_y', 'array_x']
+    # Optical flow uses the values of the pixels
+    if nm_lst['opt_correction']:
+        necs_cols.append('array_values')
+    # Parent of the clusters of the hierarchical segmentation
+    if nm_lst['segmentation_method'] == 'hierarchical':
+        necs_cols.append('parent_id')
+    with profile_step(nm_lst, 'spatial', 'frame',
+                      pathlib.Path(cur_file).stem) as rec:
+        # Read current file
+        cur_frame = cached_frame(cur_file, necs_cols, nm_lst, frames)
+        prv_frame = None
+        if time_ != 0 and not cur_frame.empty:
+            # Get previous file based on current file and search in previous files
+            prv_file = get_previous_file(cur_file, prv_file, prv_files, nm_lst)
+            if prv_file is not None:
+                # Read previous file
+                prv_frame = cached_frame(prv_file, necs_cols, nm_lst, frames)
+        if frames is not None:
+            # Keep the frames that can be previous frames of the next files
+            frames[cur_file] = cur_frame.copy()
+            while len(frames) > nm_lst['num_prev_skip'] + 1:
+                frames.pop(next(iter(frames)))
+        # Compute the spatial operations and save the result
+        spatial_df = spatial_frame(time_, cur_frame, prv_frame, nm_lst,
+                                   l_edge, r_edg, schm, fct, geotrf)
+        # Lazy geometries are passed to the concatenation as wkt
+        if nm_lst['geometry_method'] == 'lazy':
+            spatial_df['geometry'] = shapely.to_wkt(cur_frame['geometry'].values,
+                                                    rounding_precision=-1)
+        with profile_step(nm_lst, 'spatial', 'write') as write_rec:
+            write_parquet(spatial_df, output_file, parquet_options(nm_lst))
+            write_rec['bytes'] = file_size(output_file)
+        rec['clusters'] = len(spatial_df)
+    return
+
+
+def cached_frame(file, columns, nm_lst=None, frames=None):
+    """
+    Get the loaded frame of a features file from the cache, or read it.
+    The cache also keeps the geometries built from the pixels when
+    geometry_method is 'lazy', so they are built once for each frame.
+
+    Parameters
+    ----------
+    file : str
+        Path of the features file.
+    columns : list
+        Columns to be read.
+    nm_lst : dict, optional
+        Dictionary containing configuration settings and parameters.
+    frames : dict, optional
+        Cache of the loaded frames by file.
+
+    Returns
+    -------
+    frame : GeoDataFrame
+        Copy of the loaded frame, as returned by load_frame.
+    """
+    if frames is not None and file in frames:
+        return frames[file].copy()
+    with profile_step(nm_lst, 'spatial', 'read', bytes=file_size(file)):
+        frame = read_parquet(file, columns)
+    return load_frame(frame, nm_lst)
+
+
+def load_frame(frame, nm_lst=None):
+    """
+    Convert a features frame into a GeoDataFrame used by the spatial operations.
+
+    Parameters
+    ----------
+    frame : DataFrame
+        Features frame with the geometry column as wkt.
+    nm_lst : dict, optional
+        Dictionary containing configuration settings and parameters. If
+        geometry_method is 'lazy', the geometries are built from the pixels.
+
+    Returns
+    -------
+    frame : GeoDataFrame
+        Frame with the geometry and centroid columns as shapely geometries.
+    """
+    # Convert to shapely geometry
+    if nm_lst is not None and nm_lst['geometry_method'] == 'lazy':
+        # The wkt round trip gives the same coordinates of the eager method
+        geometries = shapely.to_wkt(pixel_geometries(frame, nm_lst),
+                                    rounding_precision=-1)
+        frame['geometry'] = shapely.from_wkt(geometries)
+    else:
+        frame['geometry'] = shapely.from_wkt(frame['geometry'].values)
+    frame['centroid'] = shapely.centroid(frame['geometry'].values)
+    frame = frame.set_geometry('geometry')
+    return frame
+
+
+def spatial_frame(time_, cur_frame, prv_frame, nm_lst, l_edge, r_edg,
+                  schm, fct, geotrf):
+    """
+    Perform the spatial operations between the current frame and the previous frame.
+
+    Parameters
+    ----------
+    time_ : int
+        The current time index or frame number.
+    cur_frame : GeoDataFrame
+        Current features frame, returned by load_frame.
+    prv_frame : GeoDataFrame or None
+        Previous features frame, returned by load_frame. None if the current
+        frame does not have a previous frame.
+    nm_lst : dict
+        Dictionary containing configuration settings and parameters.
+    l_edge : GeoDataFrame
+        The left edge boundary for edge detection.
+    r_edg : GeoDataFrame
+        The right edge boundary for edge detection.
+    schm : np.dtype
+        Schema of the spatial dataframe.
+    fct : bool
+        Flag indicating if the data comes from a forecast.
+    geotrf : tuple
+        Geotransform used by the optical flow method.
+
+    Returns
+    -------
+    spatial_df : DataFrame
+        Current frame with the spatial columns.
+    """
+    thresholds = nm_lst['thresholds']
     spatial_df = set_outputdf(schm)
     spatial_col = list(spatial_df.columns)
     cur_frame = pd.concat([cur_frame, spatial_df])
@@ -163,15 +319,11 @@ def spatial_operation(args):
     cur_frame['trajectory'] = LineString().wkt
     if nm_lst['opt_correction']:
         cur_frame['opt_field'] = LineString().wkt
-    # Convert to shapely geometry
-    cur_frame['geometry'] = cur_frame['geometry'].apply(loads)
-    # cur_frame['centroid'] = cur_frame['geometry'].centroid 
-    cur_frame['centroid'] = cur_frame['geometry'].apply(lambda row: row.centroid) # check this later
     cur_frame = cur_frame.set_geometry('geometry')
     # check if time is 0 and start the process or if the current frame is empty
     if time_ == 0 or cur_frame.empty:
         # Only count inside clusters and update the current frame
-        _, _, cnts = count_inside(cur_frame, 0)
+        _, _, cnts = count_inside(cur_frame, 0, nm_lst['inside_method'])
         cur_frame.loc[cnts.index, 'inside_idx'] = cnts['index_inside']
         cur_frame.loc[cnts.index, 'inside_clusters'] = cnts['inside_len']
         # Check if the cluster is on the edges
@@ -184,13 +336,11 @@ def spatial_operation(args):
         if nm_lst['validation']:
             cur_frame['method'] = 'noc'
             cur_frame['far'] = 1
-        write_parquet(cur_frame[spatial_col], output_file)
-        return
-    # Get previous file based on current file and search in previous files
-    prv_file = get_previous_file(cur_file, prv_file, prv_files, nm_lst)
-    if prv_file is None:
+        return cur_frame[spatial_col]
+    # Check if the current frame have a previous frame
+    if prv_frame is None:
         # Only count inside clusters and update the current frame
-        _, _, cnts = count_inside(cur_frame, 0)
+        _, _, cnts = count_inside(cur_frame, 0, nm_lst['inside_method'])
         cur_frame.loc[cnts.index, 'inside_idx'] = cnts['index_inside']
         # Check if the cluster is on the edges
         if nm_lst['edges']:
@@ -199,14 +349,7 @@ def spatial_operation(args):
             cur_frame.loc[touch_lowr,'board'] = True
             cur_frame.loc[touch_lowr,'board_idx'] = touch_lrg
         cur_frame['trajectory'] = cur_frame['trajectory'].astype(str)
-        write_parquet(cur_frame[spatial_col], output_file)
-        return
-    # Read previous file
-    prv_frame = read_parquet(prv_file, necs_cols)
-    prv_frame['geometry'] = prv_frame['geometry'].apply(loads)
-    # prv_frame['centroid'] = prv_frame['centroid'].apply(loads)
-    prv_frame['centroid'] = prv_frame['geometry'].apply(lambda row: row.centroid) # check this later
-    prv_frame = prv_frame.set_geometry('geometry')
+        return cur_frame[spatial_col]
     # Drop cindex if the frame come from forecast
     if fct:
         prv_frame.reset_index(drop=True, inplace=True)
@@ -220,10 +363,11 @@ def spatial_operation(args):
     # Optical flow method: Read instructions in optical_flow.py
     # This method is used outside the thresholds loop because not necessary
     if nm_lst['opt_correction']:
-        opt_idx, u_, v_, v_field = opticalflow_mtd(cur_frame,
-                                                   prv_frame,
-                                                   nm_lst,
-                                                   geotrf)
+        with profile_step(nm_lst, 'spatial', 'opticalflow_mtd'):
+            opt_idx, u_, v_, v_field = opticalflow_mtd(cur_frame,
+                                                       prv_frame,
+                                                       nm_lst,
+                                                       geotrf)
         # Update current frame based on index
         cur_frame.loc[opt_idx,'u_opt'] = u_
         cur_frame.loc[opt_idx,'v_opt'] = v_
@@ -238,13 +382,12 @@ def spatial_operation(args):
             cur_frame['u_noc'] = cur_frame['u_']
             cur_frame['v_noc'] = cur_frame['v_']
             # Call validation function
-            cur_frame = validation(cur_frame, prv_frame, nm_lst)
+            with profile_step(nm_lst, 'spatial', 'validation'):
+                cur_frame = validation(cur_frame, prv_frame, nm_lst)
             # Fill method equals None to noc
             cur_frame['method'] = cur_frame['method'].fillna('noc')
             cur_frame['far'] = cur_frame['far'].fillna(1)
-    # Save the result
-    write_parquet(cur_frame[spatial_col], output_file)
-    return
+    return cur_frame[spatial_col]
 
 
 def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
@@ -271,7 +414,8 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
     # in cur_frme.
     # Get threshold level
     thd_lvl = nm_lst['thresholds'].index(threshold)
-    cur_thd_idx, ins_thd_idx, cnts_ = count_inside(cur_frme, thd_lvl)
+    cur_thd_idx, ins_thd_idx, cnts_ = count_inside(cur_frme, thd_lvl,
+                                                 nm_lst['inside_method'])
     if len(cur_thd_idx) > 0:
         cur_frme.loc[cnts_.index, 'inside_idx'] = cnts_['index_inside']
         cur_frme.loc[cnts_.index, 'inside_clusters'] = cnts_['inside_len']
@@ -286,7 +430,12 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
     # Second spatial operation is overlay
     # For this function is necessary have both frames
     # in the same threshold, and pass the minimum overlap
-    overlays = overlay_(cur_frme, prv_frme, nm_lst['min_overlap'])
+    with profile_step(nm_lst, 'spatial', 'overlay'):
+        if nm_lst['overlay_method'] == 'pixel':
+            overlays = overlay_pixels(cur_frme, prv_frme,
+                                      nm_lst['min_overlap'])
+        else:
+            overlays = overlay_(cur_frme, prv_frme, nm_lst['min_overlap'])
     if overlays.empty:
         # Check if the cluster is on the edges
         if nm_lst['edges'] and nm_lst['thresholds'][0] == threshold:
@@ -300,9 +449,10 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
     # Update current frame based on index
     cur_frme.loc[ovrp_indx,'overlap'] = ovrp_area
     # Get index based on overlays
-    cont_indx, cont_prv_indx = continuous(overlays)
-    mergs_idx, mergs_prv_idx, merge_frame = merge(overlays)
-    splits_idx, split_prev_idx, nw_splt_idx, nw_splt_prv_idx, new_splt_comming_idx = split(overlays) 
+    with profile_step(nm_lst, 'spatial', 'classification'):
+        cont_indx, cont_prv_indx = continuous(overlays)
+        mergs_idx, mergs_prv_idx, merge_frame = merge(overlays)
+        splits_idx, split_prev_idx, nw_splt_idx, nw_splt_prv_idx, new_splt_comming_idx = split(overlays) 
 
     # Classify merge splits index
     cur_frme.loc[nw_splt_idx,'split_pr_idx'] =  nw_splt_prv_idx
@@ -324,8 +474,9 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
     
     # Check if there is any intersection between mergs and splits
     # If there is any intersection, the clusters are considered
-    mrg_spl_idx, prev_past_idx = merge_split(mergs_idx, splits_idx,
-                                 cur_frme, prv_frme)
+    with profile_step(nm_lst, 'spatial', 'classification'):
+        mrg_spl_idx, prev_past_idx = merge_split(mergs_idx, splits_idx,
+                                                 cur_frme, prv_frme)
     cur_frme.loc[mrg_spl_idx,'status'] =  'MRG/SPL'
     cur_frme.loc[mrg_spl_idx,'past_idx'] =  prev_past_idx
     
@@ -338,8 +489,9 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
         cur_trj = cur_frme.loc[cur_non_null_idx]
         cur_news = cur_frme.loc[nw_splt_idx]
         prev_trj = prv_frme.loc[cur_trj['past_idx'].values]
-        lines, u_, v_ = trajectory(cur_trj, prev_trj)
-        cur_frme.loc[cur_non_null_idx,'trajectory'] = [line.wkt for line in lines]
+        with profile_step(nm_lst, 'spatial', 'trajectory'):
+            lines, u_, v_ = trajectory(cur_trj, prev_trj)
+        cur_frme.loc[cur_non_null_idx,'trajectory'] = lines
         cur_frme.loc[cur_non_null_idx,'u_'] = u_
         cur_frme.loc[cur_non_null_idx,'v_'] = v_
         # calling expansion function with current and previous clusters and delta_time
@@ -353,8 +505,9 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
     if nm_lst['spl_correction'] and len(nw_splt_idx) > 0:
         cur_spl = cur_frme.loc[nw_splt_idx]
         prv_spl = prv_frme.loc[cur_spl['split_pr_idx'].values]
-        lines, u_, v_ = split_mtd(cur_spl, prv_spl, nw_splt_idx)
-        cur_frme.loc[nw_splt_idx,'trajectory'] = [line.wkt for line in lines]
+        with profile_step(nm_lst, 'spatial', 'split_mtd'):
+            lines, u_, v_ = split_mtd(cur_spl, prv_spl, nw_splt_idx)
+        cur_frme.loc[nw_splt_idx,'trajectory'] = lines
         cur_frme.loc[nw_splt_idx,'u_spl'] = u_
         cur_frme.loc[nw_splt_idx,'v_spl'] = v_
     # Merge method: Read instructions in merge_mtd.py
@@ -363,7 +516,8 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
         prev_mrgs = cur_frme.loc[mergs_idx,'merge_idx']
         perv_mrg_idx = prev_mrgs.explode().values
         prv_mrg = prv_frme.loc[perv_mrg_idx]
-        u_, v_= merge_mtd(cur_mrg, prv_mrg, mergs_idx, prev_mrgs)
+        with profile_step(nm_lst, 'spatial', 'merge_mtd'):
+            u_, v_= merge_mtd(cur_mrg, prv_mrg, mergs_idx, prev_mrgs)
         cur_frme.loc[mergs_idx,'u_mrg'] = u_
         cur_frme.loc[mergs_idx,'v_mrg'] = v_
     # Inner cores method: Read instructions in incores_mtd.py
@@ -379,14 +533,17 @@ def operations(cur_frme, prv_frme, threshold, l_edge, r_edg, nm_lst):
             cur_insd_idx = cur_base['inside_idx'].explode().values
             # Select only inside clusters, insd_frame comming from count_inside
             cur_inner = insd_frme.loc[cur_insd_idx]
-            u_, v_= innercores_mtd(cur_base, cur_inner, insd_idx, cur_inner_idx)
+            with profile_step(nm_lst, 'spatial', 'innercores_mtd'):
+                u_, v_= innercores_mtd(cur_base, cur_inner, insd_idx,
+                                       cur_inner_idx)
             cur_frme.loc[insd_idx,'u_inc'] = u_
             cur_frme.loc[insd_idx,'v_inc'] = v_
     # Ellipse method: Read instructions in ellipse_mtd.py
     if nm_lst['elp_correction'] and len(cur_non_null_idx) > 0:
         cur_ell = cur_frme.loc[cur_non_null_idx]
         prev_ell = prv_frme.loc[cur_ell['past_idx'].values]
-        u_, v_ = ellipse_mtd(cur_ell, prev_ell)
+        with profile_step(nm_lst, 'spatial', 'ellipse_mtd'):
+            u_, v_ = ellipse_mtd(cur_ell, prev_ell)
         cur_frme.loc[cur_non_null_idx,'u_elp'] = u_
         cur_frme.loc[cur_non_null_idx,'v_elp'] = v_
     # Check if the cluster is on the edges
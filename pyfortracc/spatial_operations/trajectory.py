@@ -1,5 +1,6 @@
-from shapely.geometry import LineString
-from pyfortracc.utilities.math_utils import uv_components
+import numpy as np
+import shapely
+
 
 def trajectory(cur_df, prev_df):
     """ 
@@ -14,21 +15,20 @@ def trajectory(cur_df, prev_df):
     
     Returns
     ----------
-    linestrings : list
-        list of LineStrings between centroids
-    u_ : list
-        list of u components
-    v_ : list
-        list of v components
+    linestrings : numpy array
+        wkt of the LineStrings between centroids
+    u_ : numpy array
+        u components
+    v_ : numpy array
+        v components
     """
-    # Set output
-    linestrings, u_, v_ = [], [], []
-    # Get centroids of current clusters and previous clusters
-    current_centroids = cur_df['centroid']
-    previous_centroids = prev_df['centroid']
-    for p,c in zip(previous_centroids, current_centroids):
-        linestrings.append(LineString([p,c])) # LineString between centroids
-        uv_ = uv_components(p.coords[0], c.coords[0])
-        u_.append(uv_[0])
-        v_.append(uv_[1])
-    return linestrings, u_, v_
\ No newline at end of file
+    # Get centroids of current clusters and previous clusters as x, y arrays
+    current_centroids = shapely.get_coordinates(cur_df['centroid'].values)
+    previous_centroids = shapely.get_coordinates(prev_df['centroid'].values)
+    # LineString between centroids
+    linestrings = shapely.linestrings(np.stack((previous_centroids,
+                                                current_centroids), axis=1))
+    linestrings = shapely.to_wkt(linestrings, rounding_precision=-1)
+    u_ = current_centroids[:, 0] - previous_centroids[:, 0]
+    v_ = current_centroids[:, 1] - previous_centroids[:, 1]
+    return linestrings, u_, v_
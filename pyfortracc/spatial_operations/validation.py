@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 import warnings
+from pyfortracc.utilities.pixels import cluster_pixels
 warnings.filterwarnings('ignore')
 
 def validation(cur_frame, prv_frame, name_list):
@@ -33,98 +34,101 @@ def validation(cur_frame, prv_frame, name_list):
     cur_frame[v_cols] = cur_frame[v_cols] / name_list['y_res']
     # Select not nan values of prev_idx
     cur_prv_frame = cur_frame[~cur_frame['past_idx'].isna()]
-    prv_y = prv_frame.loc[cur_prv_frame['past_idx']]['array_y']
-    prv_x = prv_frame.loc[cur_prv_frame['past_idx']]['array_x']
-    # Get the cluster points of prv_frame (Previous is t - 1) and add to cur_frame rows
-    cur_prv_frame.loc[cur_prv_frame.index, 'prev_y'] = prv_y.values
-    cur_prv_frame.loc[cur_prv_frame.index, 'prev_x'] = prv_x.values
-    # Add columns prev_y and prev_x to list of u_v columns
-    # u_v_cols = u_v_cols.insert(0, 'array_y')
-    # u_v_cols = u_v_cols.insert(1, 'array_x')
-    # u_v_cols = u_v_cols.insert(2, 'prev_y')
-    # u_v_cols = u_v_cols.insert(3, 'prev_x')
-    # print(u_v_cols)
-    # Calculate the scores
-    methods = cur_prv_frame.apply(lambda row: extrapolate(row, u_cols, v_cols), axis=1)
-    if methods.empty:
+    if cur_prv_frame.empty:
         # Return u_cols and v_cols to original values
         cur_frame[u_cols] = cur_frame[u_cols] * name_list['x_res']
         cur_frame[v_cols] = cur_frame[v_cols] * name_list['y_res']
         return cur_frame
-    cur_frame.loc[methods.index, 'u_'] = methods['u_']
-    cur_frame.loc[methods.index, 'v_'] = methods['v_']
-    cur_frame.loc[methods.index, 'far'] = methods['far']
-    cur_frame.loc[methods.index, 'method'] = methods['method']
-    # Drop the columns from the methods
-    methods = methods.drop(columns=['u_', 'v_', 'far', 'method'])
+    prv_clusters = prv_frame.loc[cur_prv_frame['past_idx']]
+    # Calculate the scores of all clusters for each method
+    hit, false_, far = extrapolate(cur_prv_frame, prv_clusters, u_cols, v_cols)
+    # Best method is the lowest far, the first method in a tie
+    best = np.argmin(np.where(np.isnan(far), np.inf, far), axis=1)
+    rows = np.arange(len(cur_prv_frame))
+    u_values = cur_prv_frame[u_cols].values.astype(float)
+    v_values = cur_prv_frame[v_cols].values.astype(float)
+    mtd_names = np.array([u_col[2:] if u_col[2:] != '' else 'noc' # noc = no correction
+                          for u_col in u_cols])
+    cur_frame.loc[cur_prv_frame.index, 'u_'] = u_values[rows, best]
+    cur_frame.loc[cur_prv_frame.index, 'v_'] = v_values[rows, best]
+    cur_frame.loc[cur_prv_frame.index, 'far'] = far[rows, best]
+    cur_frame.loc[cur_prv_frame.index, 'method'] = mtd_names[best]
     if name_list['validation_scores']:
+        # Add the scores of each method to cur_frame
+        scores = {}
+        for mtd, u_col in enumerate(u_cols):
+            scores['hit' + str(u_col[1:])] = hit[:, mtd]
+            scores['false-alarm' + str(u_col[1:])] = false_[:, mtd]
+            scores['far' + str(u_col[1:])] = far[:, mtd]
+        scores = pd.DataFrame(scores, index=cur_prv_frame.index)
         # Delete methods columns from cur_frame
-        cur_frame = cur_frame.drop(columns=methods.columns)
+        cur_frame = cur_frame.drop(columns=scores.columns, errors='ignore')
         # Join the methods to cur_frame
-        cur_frame = cur_frame.join(methods)
+        cur_frame = cur_frame.join(scores)
     # Return u_cols and v_cols to original values
     cur_frame[u_cols] = cur_frame[u_cols] * name_list['x_res']
     cur_frame[v_cols] = cur_frame[v_cols] * name_list['y_res']
     return cur_frame
 
-def extrapolate(row, u_, v_):
+
+def extrapolate(cur_frame, prv_frame, u_, v_):
     """
-    Extrapolates the previous cluster to the current frame and evaluates the correction methods.
+    Extrapolates the previous clusters to the current frame and evaluates
+    the correction methods.
+
+    The previous clusters of all rows are shifted at once by the rounded
+    u_ (y axis) and v_ (x axis) of each method. The pixels are encoded as
+    flat indices over the bounding box of the current clusters, together
+    with the row. Hits are the shifted pixels found in the current cluster
+    of the same row.
 
     Parameters
     ----------
-    row : pd.Series
-        A Series representing a single row from the DataFrame with both current and previous cluster data,
-        including velocity fields and previous cluster coordinates.
+    cur_frame : pd.DataFrame
+        Current clusters, with the array_y, array_x and the u_ and v_ columns.
+    prv_frame : pd.DataFrame
+        Previous cluster of each row of cur_frame, with the array_y and
+        array_x columns.
+    u_ : list
+        u columns of the correction methods.
+    v_ : list
+        v columns of the correction methods.
 
     Returns
     -------
-    row : pd.Series
-        The updated row with evaluation metrics for each correction method, including:
-        - 'u_': Extrapolated u velocity.
-        - 'v_': Extrapolated v velocity.
-        - 'far': False Alarm Rate (FAR) of the best method.
-        - 'method': The name of the best correction method.
+    hit : numpy array
+        Number of hits of each row (axis 0) and method (axis 1).
+    false_ : numpy array
+        Number of false alarms of each row and method.
+    far : numpy array
+        False Alarm Rate (FAR) of each row and method.
     """
-    # Set current cluster points
-    cur_cluster = tuple(zip(row['array_y'], row['array_x']))
-    # Loop over the methods
-    used_methods = []
-    best_method = pd.DataFrame()
-    for uv in range(len(u_)):
-        # Get u and v values and round to int
-        mtd_u, mtd_v = row[u_[uv]], row[v_[uv]]
-        mtd_u = np.round(mtd_u).astype(int)
-        mtd_v = np.round(mtd_v).astype(int)
-        mtd_u = mtd_u + row['prev_y'] # Apply method to previous cluster
-        mtd_v = mtd_v + row['prev_x'] # Apply method to previous cluster
-        # Create a tuple with the extrapolated previous cluster
-        prv_cluster = tuple(zip(mtd_u, mtd_v))
-        # Compute the scores
-        hit = len(set(prv_cluster).intersection(set(cur_cluster)))
-        false_ = len(set(prv_cluster).difference(set(cur_cluster)))
-        far = false_ / (hit + false_)
-        # Add to row for each method
-        row['hit' + str(u_[uv][1:])] = hit
-        row['false-alarm' + str(u_[uv][1:])] = false_
-        row['far' + str(u_[uv][1:])] = far
-        used_methods.append('hit' + str(u_[uv][1:]))
-        used_methods.append('false-alarm' + str(u_[uv][1:]))
-        used_methods.append('far' + str(u_[uv][1:]))
-        # Add to main far
-        best_method = pd.concat([best_method, pd.DataFrame(
-                                            [far, # Get the far value
-                                            u_[uv][2:], # Get the method name
-                                            row[u_[uv]], # Get the u_ value
-                                            row[v_[uv]]], # Get the v_ value
-                                            index=['far', 'method', 'u_', 'v_']).T])
-    # Fill '' at column method with none
-    best_method['method'] = best_method['method'].replace('', 'noc') # noc = no correction
-    # Select the used methods and the best method
-    row = row[used_methods]
-    best_method = best_method.sort_values(by='far', ascending=True).iloc[0]
-    row['u_'] = best_method['u_']
-    row['v_'] = best_method['v_']
-    row['far'] = best_method['far']
-    row['method'] = best_method['method']
-    return row
\ No newline at end of file
+    n_rows = len(cur_frame)
+    cur_off, cur_y, cur_x, _ = cluster_pixels(cur_frame, values=False)
+    prv_off, prv_y, prv_x, _ = cluster_pixels(prv_frame, values=False)
+    cur_rows = np.repeat(np.arange(n_rows), np.diff(cur_off))
+    prv_rows = np.repeat(np.arange(n_rows), np.diff(prv_off))
+    prv_size = np.diff(prv_off)
+    # Flat index of the pixels inside the bounding box of the current clusters
+    y_min, x_min = cur_y.min(), cur_x.min()
+    y_len, x_len = cur_y.max() - y_min + 1, cur_x.max() - x_min + 1
+    cur_keys = (cur_rows * y_len + (cur_y - y_min)) * x_len + (cur_x - x_min)
+    hit = np.zeros((n_rows, len(u_)))
+    for mtd in range(len(u_)):
+        mtd_u = cur_frame[u_[mtd]].values.astype(float)
+        mtd_v = cur_frame[v_[mtd]].values.astype(float)
+        # Methods without vector have no hits
+        valid = ~(np.isnan(mtd_u) | np.isnan(mtd_v))
+        shift_y = np.round(np.where(valid, mtd_u, 0)).astype(np.int64)
+        shift_x = np.round(np.where(valid, mtd_v, 0)).astype(np.int64)
+        ext_y = prv_y + shift_y[prv_rows] - y_min
+        ext_x = prv_x + shift_x[prv_rows] - x_min
+        inside = (valid[prv_rows] & (ext_y >= 0) & (ext_y < y_len) &
+                  (ext_x >= 0) & (ext_x < x_len))
+        ext_keys = (prv_rows[inside] * y_len + ext_y[inside]) * x_len + \
+                    ext_x[inside]
+        hits = np.isin(ext_keys, cur_keys, assume_unique=True)
+        hit[:, mtd] = np.bincount(prv_rows[inside][hits], minlength=n_rows)
+    false_ = prv_size[:, None] - hit
+    far = false_ / prv_size[:, None]
+    return hit, false_, far
@@ -1,9 +1,19 @@
 import shutil
+from .default_parameters import default_parameters
 from .features_extraction import features_extraction
 from .spatial_operations import spatial_operations
 from .cluster_linking import cluster_linking
 from .concat import concat
+from .tracker import Tracker
 from .post_processing.duration import compute_duration
+from .utilities.utils import (get_input_files, get_filestamp,
+                              get_loading_bar, check_operational_system,
+                              set_nworkers)
+from .utilities.reader import prefetch_reader
+from .utilities.manifest import remove_manifest, manifest_files, set_stage
+from .utilities.executor import start_executor, stop_executor
+from .utilities.profiler import (start_profile, profile_step,
+                                 profile_function, profile_report, frame_key)
 
 
 def track(name_lst={},
@@ -14,7 +24,8 @@ def track(name_lst={},
             clst_lnk=True,
             concat_r=True,
             duration=False,
-            clean=True):
+            clean=True,
+            mode='files'):
     """ Track Module
     It is a module that performs the tracking clusters in time and space.
 
@@ -32,27 +43,116 @@ def track(name_lst={},
         If True, spatial operations are performed.
     clst_lnk : bool
         If True, cluster linking is performed.
+    mode : str
+        'files' runs each stage over all files and writes the intermediate
+        stages at track/processing/. 'stream' carries each frame through all
+        stages in memory and writes only the tracking table, the stage flags
+        and parallel are ignored in this mode.
+
+    If parallel is True, the workers of name_lst['executor'] are started
+    once and shared by all stages of the run. If name_lst['profile'] is
+    True, the run report is written at output_path + 'track/profile/'.
     """
     # Parameters check
     if name_lst == {}:
         raise ValueError('name_lst parameter is empty')
     if read_fnc is None:
         raise ValueError('read_fnc object is empty')
+    if mode not in ('files', 'stream'):
+        raise ValueError('Invalid mode')
     # Clean previous results
     if clean:
         shutil.rmtree(name_lst['output_path'], ignore_errors=True)
-    # Extract features
-    if feat_ext:
-        features_extraction(name_lst, read_fnc, parallel=parallel)
-    # Spatial operations
-    if spat_ope:
-        spatial_operations(name_lst, read_fnc, parallel=parallel)
-    # Cluster linking
-    if clst_lnk:
-        cluster_linking(name_lst)
-    # Concatenate results
-    if concat_r:
-        concat(name_lst)
-    # Compute duration
-    if duration:
-        compute_duration(name_lst, parallel=parallel)
+    if name_lst.get('profile'):
+        start_profile(name_lst)
+    # The workers are started once and shared by all stages
+    workers = 1
+    if parallel and (mode == 'files' or duration):
+        start_executor(name_lst)
+        if name_lst.get('executor', 'process') != 'serial':
+            workers = set_nworkers(name_lst)
+    try:
+        if mode == 'stream':
+            with profile_step(name_lst, 'stream', 'stage', workers=1):
+                track_stream(name_lst, read_fnc)
+        else:
+            # Extract features
+            if feat_ext:
+                with profile_step(name_lst, 'features', 'stage',
+                                  workers=workers):
+                    features_extraction(name_lst, read_fnc, parallel=parallel)
+            # Spatial operations
+            if spat_ope:
+                with profile_step(name_lst, 'spatial', 'stage',
+                                  workers=workers):
+                    spatial_operations(name_lst, read_fnc, parallel=parallel)
+            # Cluster linking
+            if clst_lnk:
+                with profile_step(name_lst, 'linked', 'stage',
+                                  workers=workers):
+                    cluster_linking(name_lst, parallel=parallel)
+            # Concatenate results
+            if concat_r:
+                # The concatenation is always parallel
+                with profile_step(name_lst, 'concat', 'stage',
+                                  workers=1 if name_lst.get('executor') ==
+                                  'serial' else set_nworkers(name_lst)):
+                    concat(name_lst)
+        # Compute duration
+        if duration:
+            with profile_step(name_lst, 'duration', 'stage', workers=workers):
+                compute_duration(name_lst, parallel=parallel)
+    finally:
+        stop_executor()
+    if name_lst.get('profile'):
+        profile_report(name_lst)
+
+
+def track_stream(name_lst, read_fnc):
+    """
+    Track the clusters frame by frame in memory. Each frame is pushed to a
+    Tracker, that carries it through features extraction, spatial operations,
+    cluster linking and concatenation and only the tracking table is written.
+    Only the previous frame is kept in memory.
+
+    Parameters
+    ----------
+    name_lst : dict
+        Dictionary with the parameters to be used.
+    read_fnc : function
+        Function to read the data.
+
+    Returns
+    -------
+    None
+    """
+    print('Tracking (stream):')
+    # A new run builds a new manifest
+    if name_lst.get('manifest'):
+        remove_manifest(name_lst)
+    # Set default parameters
+    name_lst = default_parameters(name_lst, read_fnc)
+    # Check operational system
+    name_lst, _ = check_operational_system(name_lst, False)
+    if name_lst['manifest']:
+        files = manifest_files(name_lst)['file'].tolist()
+    else:
+        files = get_input_files(name_lst['input_path'])
+    tracker = Tracker(name_lst, checkpoint=False)
+    loading_bar = get_loading_bar(files)
+    read_fnc = profile_function(name_lst, 'stream', 'read_fnc', read_fnc)
+    # The next frames are read while the current one is tracked
+    for file, data, error in prefetch_reader(files, read_fnc,
+                                             name_lst['prefetch'],
+                                             name_lst['prefetch_workers']):
+        tstamp = get_filestamp(name_lst, file)
+        if error is not None:
+            print('Error reading file: {}'.format(file), error)
+        with profile_step(name_lst, 'stream', 'frame',
+                          frame_key(name_lst, file)) as rec:
+            rec['clusters'] = len(tracker.push(data, tstamp, file))
+        loading_bar.update(1)
+    loading_bar.close()
+    if tracker.output_path == name_lst['output_path'] + 'track/trackingtable/':
+        set_stage(name_lst, 'trackingtable', tracker.output_path)
+    return
@@ -0,0 +1,221 @@
+import os
+import glob
+import json
+import shutil
+import shapely
+import pandas as pd
+from .default_parameters import default_parameters
+from .features_extraction import frame_features
+from .spatial_operations import spatial_frame, load_frame
+from .cluster_linking import link_frame
+from .concat import (concat_frames, save_parquet, default_columns,
+                     tracking_types)
+from .utilities.utils import (get_edges, get_previous_file, get_geotransform,
+                              set_operator, set_schema, set_outputdf,
+                              create_dirs, read_parquet, write_parquet,
+                              parquet_options)
+
+
+class Tracker:
+    """
+    Incremental tracker, used to track one frame at a time as soon as it arrives.
+
+    Each push runs the features extraction, spatial operations and cluster
+    linking of the new frame against the previous frame kept in memory, so the
+    input directory is never globbed or reprocessed. The state of the tracker
+    (uid_iter, cindex counter and previous frame) is saved as a checkpoint at
+    output_path + 'track/checkpoint/' and restored when a Tracker is created
+    with the same output_path.
+
+    Parameters
+    ----------
+    name_lst : dict
+        Dictionary with the parameters to be used. x_dim and y_dim are mandatory.
+    checkpoint : bool
+        If True, the checkpoint is restored at start and saved after each push.
+    save : bool
+        If True, the tracking table of each frame is written at
+        output_path + 'track/trackingtable/'.
+    """
+
+    def __init__(self, name_lst, checkpoint=True, save=True):
+        if 'x_dim' not in name_lst or 'y_dim' not in name_lst:
+            raise ValueError('x_dim and y_dim must be set in name_lst')
+        name_lst = default_parameters(name_lst)
+        # Without read_function the default parameters set the resolution to 1
+        if name_lst['lat_min'] is not None and name_lst['lat_max'] is not None:
+            name_lst['y_res'] = abs(name_lst['lat_min'] - name_lst['lat_max']) / name_lst['y_dim']
+            name_lst['x_res'] = abs(name_lst['lon_min'] - name_lst['lon_max']) / name_lst['x_dim']
+        if 'initial_uid' not in name_lst.keys():
+            name_lst['initial_uid'] = 1
+        if 'concat_path' not in name_lst:
+            name_lst['concat_path'] = name_lst['output_path']
+        self.name_lst = name_lst
+        self.checkpoint = checkpoint
+        self.save = save
+        self.output_path = name_lst['concat_path'] + 'track/trackingtable/'
+        self.checkpoint_path = name_lst['output_path'] + 'track/checkpoint/'
+        # Set the operator used to thresholding segmentation
+        self.operator = set_operator(name_lst['operator'])
+        # Initialize schemas
+        self.f_schema = set_schema('features', name_lst)
+        self.s_schema = set_schema('spatial', name_lst)
+        self.l_schema = set_schema('linked', name_lst)
+        # Set columns of the tracking table
+        self.default_cols = default_columns(name_lst)
+        if name_lst['validation_scores']:
+            for col in set_outputdf(self.s_schema).columns:
+                if 'hit' in col or 'false-alarm' in col:
+                    self.default_cols.append(col)
+        # Types of the columns that depend on the values, as in concat
+        self.types = tracking_types(self.default_cols)
+        # Get edges of the data and geotransform
+        self.left_edge, self.right_edge = get_edges(name_lst, [], None)
+        self.geotrf, _ = get_geotransform(name_lst)
+        # Set linking parameters, same as cluster_linking
+        self.dt_time = pd.Timedelta(minutes=name_lst['delta_time'])
+        max_dt_time = pd.Timedelta(minutes=(name_lst['delta_time'] +
+                                            name_lst['delta_tolerance']))
+        self.max_dt_time = max_dt_time * (name_lst['num_prev_skip'] + 1)
+        # Initial state
+        self.time_ = 0
+        self.uid_iter = name_lst['initial_uid']
+        self.cdx = 0
+        self.prv_name = None
+        self.prv_stamp = None
+        self.prv_feat = None
+        self.prv_link = pd.DataFrame()
+        if self.save:
+            create_dirs(self.output_path)
+        if self.checkpoint:
+            self.load_checkpoint()
+
+    def push(self, data, timestamp, file=None):
+        """
+        Track a new frame against the previous frame.
+
+        Parameters
+        ----------
+        data : numpy array
+            2D field of the new frame. If None, the frame is tracked as empty.
+        timestamp : str, datetime or pd.Timestamp
+            Timestamp of the new frame.
+        file : str, optional
+            Path of the frame, stored in the file column.
+
+        Returns
+        -------
+        concat_df : pd.DataFrame
+            Tracking table rows of the new frame indexed by cindex.
+        """
+        nm_lst = self.name_lst
+        tstamp = pd.Timestamp(timestamp)
+        cur_name = '{}.parquet'.format(tstamp.strftime('%Y%m%d_%H%M'))
+        if self.prv_stamp is None:
+            self.prv_stamp = tstamp - self.dt_time
+        # Features extraction
+        if data is None:
+            feat_df = set_outputdf(self.f_schema)
+        else:
+            feat_df = frame_features(data, tstamp, file, nm_lst,
+                                     self.operator, self.f_schema)
+        # Spatial operations against the previous features frame
+        cur_feat = load_frame(feat_df.copy(), nm_lst)
+        prv_frame = None
+        if self.time_ != 0 and not cur_feat.empty and self.prv_name is not None:
+            if get_previous_file(cur_name, [self.prv_name], [self.prv_name],
+                                 nm_lst) is not None:
+                prv_frame = self.prv_feat
+        spat_df = spatial_frame(self.time_, cur_feat.copy(), prv_frame, nm_lst,
+                                self.left_edge, self.right_edge,
+                                self.s_schema, False, self.geotrf)
+        # Cluster linking against the previous linked frame
+        (self.prv_link, link_df, self.prv_stamp,
+         self.uid_iter, self.cdx) = link_frame((self.time_, spat_df.copy(),
+                                                tstamp, self.prv_link,
+                                                self.prv_stamp, nm_lst,
+                                                self.uid_iter,
+                                                self.max_dt_time,
+                                                self.l_schema, self.cdx))
+        # Concatenate the tracking table of the frame
+        concat_df = concat_frames(feat_df, spat_df, link_df, self.default_cols)
+        # Lazy geometries are written as wkt, as in the concat of the files
+        if nm_lst['geometry_method'] == 'lazy' and not concat_df.empty:
+            concat_df['geometry'] = shapely.to_wkt(cur_feat['geometry'].values,
+                                                   rounding_precision=-1)
+        self.time_ += 1
+        self.prv_name, self.prv_feat = cur_name, cur_feat
+        if self.save:
+            save_parquet(concat_df, self.output_path + cur_name, self.types,
+                         options=parquet_options(nm_lst, 'final'))
+        if self.checkpoint:
+            self.save_checkpoint(feat_df, link_df)
+        return concat_df
+
+    def save_checkpoint(self, feat_df, link_df):
+        """
+        Save the state of the tracker and the previous frame.
+
+        The frames are written in a new directory of the checkpoint, named
+        by the number of pushed frames, and state.json, that points to that
+        directory, is replaced at once. The checkpoint is kept consistent if
+        the process stops during the save: the previous state.json still
+        points to the previous frames, that are only removed after the
+        replace.
+
+        Parameters
+        ----------
+        feat_df : pd.DataFrame
+            Features frame of the last pushed frame.
+        link_df : pd.DataFrame
+            Linked frame of the last pushed frame.
+        """
+        frames = 'frames_{:08d}'.format(self.time_)
+        frames_path = self.checkpoint_path + frames + '/'
+        create_dirs(frames_path)
+        options = parquet_options(self.name_lst)
+        write_parquet(feat_df, frames_path + 'features.parquet', options)
+        write_parquet(link_df, frames_path + 'linked.parquet', options)
+        state = {'time': self.time_,
+                 'uid_iter': int(self.uid_iter),
+                 'cindex': int(self.cdx),
+                 'prv_name': self.prv_name,
+                 'prv_stamp': self.prv_stamp.isoformat(),
+                 'frames': frames}
+        state_file = self.checkpoint_path + 'state.json'
+        with open(state_file + '.tmp', 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(state_file + '.tmp', state_file)
+        # Frames of the previous checkpoints, or of a save that stopped
+        for old_frames in glob.glob(self.checkpoint_path + 'frames_*/'):
+            if os.path.basename(os.path.normpath(old_frames)) != frames:
+                shutil.rmtree(old_frames, ignore_errors=True)
+
+    def load_checkpoint(self):
+        """
+        Restore the state of the tracker and the previous frame, if a
+        checkpoint exists.
+
+        Returns
+        -------
+        bool
+            True if the checkpoint was restored.
+        """
+        state_file = self.checkpoint_path + 'state.json'
+        if not os.path.isfile(state_file):
+            return False
+        with open(state_file) as f:
+            state = json.load(f)
+        self.time_ = state['time']
+        self.uid_iter = state['uid_iter']
+        self.cdx = state['cindex']
+        self.prv_name = state['prv_name']
+        self.prv_stamp = pd.Timestamp(state['prv_stamp'])
+        frames_path = self.checkpoint_path + state['frames'] + '/'
+        self.prv_feat = load_frame(read_parquet(frames_path +
+                                                'features.parquet', None),
+                                   self.name_lst)
+        self.prv_link = read_parquet(frames_path + 'linked.parquet', None)
+        return True
@@ -0,0 +1,180 @@
+import time
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+from .utils import set_nworkers
+
+# Executor shared by the stages of a run, set by start_executor
+_ACTIVE = {'executor': None}
+
+
+class Executor:
+    """
+    Pool of workers used to map the tasks of the stages.
+
+    The 'process' backend is a multiprocessing pool, the 'thread' backend is
+    a pool of threads of the main process, which avoids the pickling of the
+    tasks but only helps when the tasks release the GIL, and the 'serial'
+    backend runs the tasks in the main process.
+
+    Parameters
+    ----------
+    backend : str
+        'process', 'thread' or 'serial'.
+    n_workers : int
+        Number of workers of the pool.
+    """
+
+    def __init__(self, backend='process', n_workers=1):
+        if backend not in ('process', 'thread', 'serial'):
+            raise ValueError('Invalid executor')
+        self.backend = backend
+        self.n_workers = n_workers
+        start = time.perf_counter()
+        self.pool = None
+        if backend == 'process':
+            self.pool = mp.Pool(n_workers)
+        elif backend == 'thread':
+            self.pool = ThreadPool(n_workers)
+        # Time to start the pool and number of mapped tasks
+        self.stats = {'backend': backend,
+                      'n_workers': n_workers,
+                      'startup': time.perf_counter() - start,
+                      'maps': 0,
+                      'tasks': 0}
+
+    def imap(self, fnc, args, ordered=True, chunksize=1):
+        """
+        Map the function over the arguments.
+
+        Parameters
+        ----------
+        fnc : function
+            Function of a single argument, picklable for the process backend.
+        args : list
+            Arguments of the tasks.
+        ordered : bool
+            If True, the results are yielded in the order of the arguments.
+        chunksize : int
+            Number of tasks sent at once to a worker. The objects shared by
+            the tasks of a chunk (e.g. name_list) are pickled once per chunk.
+
+        Returns
+        -------
+        iterator
+            Results of the tasks.
+        """
+        args = list(args)
+        self.stats['maps'] += 1
+        self.stats['tasks'] += len(args)
+        if self.pool is None:
+            return map(fnc, args)
+        if ordered:
+            return self.pool.imap(fnc, args, chunksize)
+        return self.pool.imap_unordered(fnc, args, chunksize)
+
+    def close(self):
+        """
+        Wait for the tasks and stop the workers.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def start_executor(name_list):
+    """
+    Start the executor shared by the next stages, replacing the previous one.
+    Until stop_executor is called, worker_map uses its workers instead of
+    creating a pool for each stage.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used, the backend is set by
+        'executor' and the number of workers by 'n_jobs'.
+
+    Returns
+    -------
+    executor : Executor
+        Executor of the run.
+    """
+    stop_executor()
+    _ACTIVE['executor'] = Executor(name_list.get('executor', 'process'),
+                                   set_nworkers(name_list))
+    return _ACTIVE['executor']
+
+
+def stop_executor():
+    """
+    Stop the executor shared by the stages.
+
+    Returns
+    -------
+    stats : dict or None
+        Backend, number of workers, startup time (s), number of maps and
+        tasks of the executor. None if there is no executor.
+    """
+    executor = _ACTIVE['executor']
+    if executor is None:
+        return None
+    executor.close()
+    _ACTIVE['executor'] = None
+    return executor.stats
+
+
+def worker_map(fnc, args, name_list, ordered=False, chunksize=1):
+    """
+    Map the function over the arguments with the executor of the run, or
+    with a pool created for this map if there is no executor.
+
+    Parameters
+    ----------
+    fnc : function
+        Function of a single argument.
+    args : list
+        Arguments of the tasks.
+    name_list : dict
+        Dictionary with the parameters to be used.
+    ordered : bool
+        If True, the results are yielded in the order of the arguments.
+    chunksize : int
+        Number of tasks sent at once to a worker.
+
+    Yields
+    ------
+    Results of the tasks.
+    """
+    executor = _ACTIVE['executor']
+    if executor is not None:
+        yield from executor.imap(fnc, args, ordered, chunksize)
+        return
+    with Executor(name_list.get('executor', 'process'),
+                  set_nworkers(name_list)) as executor:
+        yield from executor.imap(fnc, args, ordered, chunksize)
+
+
+def task_chunksize(n_tasks, name_list):
+    """
+    Get the chunksize that sends about four chunks of tasks to each worker.
+
+    Parameters
+    ----------
+    n_tasks : int
+        Number of tasks.
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    int
+        Number of tasks of each chunk.
+    """
+    return max(1, n_tasks // (set_nworkers(name_list) * 4))
+
@@ -0,0 +1,227 @@
+import os
+import json
+import shutil
+import pandas as pd
+from .utils import (get_input_files, get_filestamp, create_dirs,
+                    read_parquet, write_parquet)
+
+
+def manifest_path(name_list):
+    """
+    Get the directory of the run manifest.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    str
+        Path of the manifest directory.
+    """
+    return name_list['output_path'] + 'track/manifest/'
+
+
+def remove_manifest(name_list):
+    """
+    Remove the manifest of a previous run, so the next stage builds a new
+    manifest from the input directory.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    """
+    shutil.rmtree(manifest_path(name_list), ignore_errors=True)
+
+
+def build_manifest(name_list, read_fnc=None):
+    """
+    Build the manifest of a run. The input directory is globbed once and the
+    timestamp of each file is parsed once, the files and timestamps are
+    written at manifest/files.parquet and the grid shape and the status of
+    the stages at manifest/manifest.json. A previous manifest is replaced.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    read_fnc : function, optional
+        Function to read the data. If given and the grid shape is not set in
+        name_list, the shape is read from the first file.
+
+    Returns
+    -------
+    meta : dict
+        Input path, timestamp pattern, grid shape and stages of the run.
+    """
+    files = get_input_files(name_list['input_path'])
+    timestamps = [get_filestamp(name_list, file) for file in files]
+    files_df = pd.DataFrame({'file': files,
+                             'timestamp': pd.to_datetime(timestamps)})
+    grid = None
+    if 'y_dim' in name_list and 'x_dim' in name_list:
+        grid = [int(name_list['y_dim']), int(name_list['x_dim'])]
+    elif read_fnc is not None:
+        grid = [int(dim) for dim in read_fnc(files[0]).shape]
+    meta = {'input_path': name_list['input_path'],
+            'timestamp_pattern': name_list['timestamp_pattern'],
+            'pattern_position': list(name_list['pattern_position']),
+            'grid': grid,
+            'stages': {}}
+    create_dirs(manifest_path(name_list))
+    write_parquet(files_df, manifest_path(name_list) + 'files.parquet')
+    save_manifest(name_list, meta)
+    return meta
+
+
+def save_manifest(name_list, meta):
+    """
+    Write the manifest metadata, replacing the file at once.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    meta : dict
+        Manifest metadata.
+    """
+    meta_file = manifest_path(name_list) + 'manifest.json'
+    with open(meta_file + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_file + '.tmp', meta_file)
+
+
+def load_manifest(name_list):
+    """
+    Load the manifest metadata of the run.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    meta : dict or None
+        Manifest metadata. None if the manifest does not exist or was built
+        for other input path or timestamp pattern.
+    """
+    meta_file = manifest_path(name_list) + 'manifest.json'
+    if not os.path.isfile(meta_file):
+        return None
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta['input_path'] != name_list['input_path'] or \
+        meta['timestamp_pattern'] != name_list['timestamp_pattern'] or \
+        meta['pattern_position'] != list(name_list.get('pattern_position',
+                                                       [None, None])):
+        return None
+    return meta
+
+
+def manifest_grid(name_list, read_fnc=None):
+    """
+    Get the grid shape of the run from the manifest, building the manifest
+    if it does not exist.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    read_fnc : function, optional
+        Function to read the data, used if the shape is not in the manifest.
+
+    Returns
+    -------
+    tuple or None
+        Grid shape (y_dim, x_dim). None if the shape is unknown.
+    """
+    meta = load_manifest(name_list)
+    if meta is None:
+        meta = build_manifest(name_list, read_fnc)
+    if meta['grid'] is None and read_fnc is not None:
+        file = manifest_files(name_list)['file'].iloc[0]
+        meta['grid'] = [int(dim) for dim in read_fnc(file).shape]
+        save_manifest(name_list, meta)
+    if meta['grid'] is None:
+        return None
+    return tuple(meta['grid'])
+
+
+def manifest_files(name_list):
+    """
+    Get the input files and timestamps of the run, building the manifest if
+    it does not exist.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    files_df : pd.DataFrame
+        Input files sorted by path, with the columns file and timestamp.
+    """
+    if load_manifest(name_list) is None:
+        build_manifest(name_list)
+    return read_parquet(manifest_path(name_list) + 'files.parquet', None)
+
+
+def stage_files(name_list, stage):
+    """
+    Get the output files of a completed stage from the manifest. The output
+    of each stage has one file per timestamp named '%Y%m%d_%H%M.parquet'.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    stage : str
+        Name of the stage, 'features', 'spatial', 'linked' or 'trackingtable'.
+
+    Returns
+    -------
+    list or None
+        Sorted output files of the stage. None if the manifest is disabled or
+        the stage was not completed in this run, so the caller must list
+        the output directory.
+    """
+    if not name_list.get('manifest'):
+        return None
+    meta = load_manifest(name_list)
+    if meta is None or stage not in meta['stages']:
+        return None
+    stage_path = meta['stages'][stage]
+    timestamps = manifest_files(name_list)['timestamp']
+    names = sorted(set(timestamps.dt.strftime('%Y%m%d_%H%M.parquet')))
+    return [stage_path + name for name in names]
+
+
+def set_stage(name_list, stage, stage_path=None):
+    """
+    Record a stage of the run in the manifest.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    stage : str
+        Name of the stage.
+    stage_path : str, optional
+        Output directory of the completed stage. If None, the stage is
+        removed from the manifest, as when it is started again or its
+        output is removed.
+    """
+    if not name_list.get('manifest'):
+        return
+    meta = load_manifest(name_list)
+    if meta is None:
+        return
+    if stage_path is None:
+        meta['stages'].pop(stage, None)
+    else:
+        meta['stages'][stage] = stage_path
+    save_manifest(name_list, meta)
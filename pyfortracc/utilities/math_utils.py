@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 
 def uv_components(p0, p1):
     """ 
@@ -320,3 +321,76 @@ def calculate_vel_area(magnitude, vel_unit, pixel_area, delta):
         pixel_area = pixel_area * 0.386102
         velocity = np.sqrt(magnitude * pixel_area) / (delta / 60)
     return velocity
+
+
+def loc_groups(frame, idx_lists):
+    """ 
+    This function gets the rows of a frame selected by frame.loc for each list of index,
+    as flat arrays of positions and groups.
+
+    Parameters
+    ----------
+    frame : DataFrame
+        The frame to be selected, its index can be repeated.
+    idx_lists : list or Series
+        A list of index for each group.
+
+    Returns
+    -------
+    group : array
+        The group of each selected row.
+    positions : array
+        The position in the frame of each selected row, in the same order of frame.loc.
+
+    Notes
+    -------
+    As frame.loc, every row of a repeated index is selected each time the index appears in a list.
+    """
+    idx = pd.Series(list(idx_lists), dtype=object).explode().dropna()
+    labels = idx.values.astype(frame.index.dtype)
+    # Rows of each label are a slice of the index sorted with a stable sort
+    order = np.argsort(frame.index.values, kind='stable')
+    sorted_index = frame.index.values[order]
+    left = np.searchsorted(sorted_index, labels, side='left')
+    counts = np.searchsorted(sorted_index, labels, side='right') - left
+    group = np.repeat(idx.index.values, counts)
+    starts = np.repeat(left - np.cumsum(counts) + counts, counts)
+    positions = order[np.arange(len(starts)) + starts]
+    return group, positions
+
+
+def group_reduce(values, group, n_groups, reduce=np.sum):
+    """ 
+    This function reduces the values of each group, keeping the order of the values inside the group.
+
+    Parameters
+    ----------
+    values : array
+        The values to be reduced.
+    group : array
+        The group of each value, from 0 to n_groups - 1.
+    n_groups : int
+        The number of groups.
+    reduce : function
+        The reduction, called with axis=1 over a matrix with one group per row.
+
+    Returns
+    -------
+    result : array
+        The reduced value of each group, nan for groups without values.
+
+    Notes
+    -------
+    The groups with the same number of values are reduced together, so each group is reduced
+    by the same numpy loop of reduce(values), and the result is the same of a loop over the groups.
+    """
+    order = np.argsort(group, kind='stable')
+    values, group = values[order], group[order]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.cumsum(counts) - counts
+    result = np.full(n_groups, np.nan)
+    for size in np.unique(counts[counts > 0]):
+        groups = np.flatnonzero(counts == size)
+        rows = starts[groups][:, None] + np.arange(size)
+        result[groups] = reduce(values[rows], axis=1)
+    return result
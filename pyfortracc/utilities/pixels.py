@@ -0,0 +1,98 @@
+import numpy as np
+import pyarrow.parquet as pq
+
+
+def cluster_pixels(frame, values=True):
+    """
+    Get the pixels of all clusters of a frame as a single block.
+
+    The array_y, array_x and array_values columns are concatenated into flat
+    arrays, and the pixels of the cluster at position i are the slice
+    offsets[i]:offsets[i + 1] of the flat arrays (CSR layout). This replaces
+    the explode of the pixel columns, that creates an object array.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        Dataframe with the array_y, array_x and array_values columns.
+    values : bool
+        If True, the array_values column is also returned.
+
+    Returns
+    -------
+    offsets : numpy array
+        Offsets of the clusters in the flat arrays, with len(frame) + 1 elements.
+    array_y : numpy array
+        Flat y positions of the pixels.
+    array_x : numpy array
+        Flat x positions of the pixels.
+    array_values : numpy array or None
+        Flat values of the pixels.
+    """
+    sizes = np.fromiter((len(arr) for arr in frame['array_y'].values),
+                        dtype=np.int64, count=len(frame))
+    offsets = np.zeros(len(frame) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    if len(frame) == 0:
+        empty = np.array([], dtype=np.int64)
+        return offsets, empty, empty, (np.array([], dtype=np.float32)
+                                       if values else None)
+    array_y = np.concatenate(frame['array_y'].values).astype(np.int64)
+    array_x = np.concatenate(frame['array_x'].values).astype(np.int64)
+    array_values = None
+    if values:
+        array_values = np.concatenate(frame['array_values'].values)
+    return offsets, array_y, array_x, array_values
+
+
+def read_pixels(path_file, columns=None, values=True):
+    """
+    Read a parquet file with the pixels of the clusters as a single block.
+
+    The pixel columns are stored as parquet lists, that are already offsets
+    and flat arrays, so the block is taken directly from the arrow arrays
+    without building one numpy array per cluster.
+
+    Parameters
+    ----------
+    path_file : str
+        The file path of the Parquet file to be read.
+    columns : list of str, optional
+        Other columns to be read. If None, all other columns are read.
+    values : bool
+        If True, the array_values column is also read.
+
+    Returns
+    -------
+    dataframe : pd.DataFrame
+        Dataframe with the other columns.
+    offsets : numpy array
+        Offsets of the clusters in the flat arrays, with len(dataframe) + 1 elements.
+    array_y : numpy array
+        Flat y positions of the pixels.
+    array_x : numpy array
+        Flat x positions of the pixels.
+    array_values : numpy array or None
+        Flat values of the pixels.
+    """
+    pixel_cols = ['array_y', 'array_x'] + (['array_values'] if values else [])
+    if columns is not None:
+        columns = list(columns) + pixel_cols
+    table = pq.read_table(path_file, columns=columns, use_pandas_metadata=True)
+    dataframe = table.drop(pixel_cols).to_pandas()
+    # Empty frames are written without the list type
+    if table.num_rows == 0:
+        empty = np.array([], dtype=np.int64)
+        return (dataframe, np.zeros(1, dtype=np.int64), empty, empty,
+                np.array([], dtype=np.float32) if values else None)
+    block = []
+    for col in pixel_cols:
+        array = table.column(col).combine_chunks()
+        offsets = array.offsets.to_numpy()
+        block.append(array.flatten().to_numpy(zero_copy_only=False))
+    # Sliced arrays start at the first offset
+    offsets = offsets - offsets[0]
+    if not values:
+        block.append(None)
+    return (dataframe, offsets, block[0].astype(np.int64),
+            block[1].astype(np.int64), block[2])
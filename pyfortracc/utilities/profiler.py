@@ -0,0 +1,267 @@
+import os
+import glob
+import json
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from .utils import get_filestamp
+
+# Records of the current process, written by flush_records
+_RECORDS = []
+_LOCK = threading.Lock()
+# Frame being processed by each thread, inherited by the nested steps
+_LOCAL = threading.local()
+
+
+def profiling(name_list):
+    """
+    Check if the profiler is enabled.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    bool
+        True if name_list['profile'] is set.
+    """
+    return bool(name_list is not None and name_list.get('profile'))
+
+
+def profile_path(name_list):
+    """
+    Get the directory of the profile records and report.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    str
+        Path of the profile directory.
+    """
+    return name_list['output_path'] + 'track/profile/'
+
+
+def file_size(path):
+    """
+    Get the size of a file in bytes, None if it is not a local file.
+    """
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return None
+
+
+def frame_key(name_list, file):
+    """
+    Get the frame of an input file, its timestamp as '%Y%m%d_%H%M', the
+    name of the files of the processing stages. None if the profiler is
+    disabled.
+    """
+    if not profiling(name_list):
+        return None
+    return get_filestamp(name_list, file).strftime('%Y%m%d_%H%M')
+
+
+def start_profile(name_list):
+    """
+    Remove the records of a previous run and clear the records of the process.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    """
+    with _LOCK:
+        _RECORDS.clear()
+    shutil.rmtree(profile_path(name_list), ignore_errors=True)
+
+
+def flush_records(name_list):
+    """
+    Append the records of the process to its records file,
+    profile/records_<pid>.jsonl. The records inherited by a forked worker
+    from its parent are dropped, as they are written by the parent.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    """
+    pid = os.getpid()
+    with _LOCK:
+        records = [record for record in _RECORDS if record['pid'] == pid]
+        _RECORDS.clear()
+        if not records:
+            return
+        path = profile_path(name_list)
+        os.makedirs(path, exist_ok=True)
+        with open(path + 'records_{}.jsonl'.format(pid), 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+
+@contextmanager
+def profile_step(name_list, stage, step, frame=None, **fields):
+    """
+    Time a step of a stage. If the profiler is disabled, nothing is recorded.
+
+    The step 'frame' times the whole processing of a frame: the steps
+    nested in it take its frame and the records of the process are written
+    when it ends. The step 'stage' times a stage in the main process, with
+    the number of workers of the stage as the field workers.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    stage : str
+        Stage of the step, e.g. 'features' or 'spatial'.
+    step : str
+        Name of the step, e.g. 'read_fnc', 'overlay' or 'write'.
+    frame : str, optional
+        Timestamp of the frame ('%Y%m%d_%H%M'). If None, the frame of the
+        enclosing 'frame' step of the thread is used.
+    **fields
+        Fields of the record, e.g. bytes (read or written) and clusters.
+
+    Yields
+    ------
+    fields : dict
+        Fields of the record, that can be updated inside the step (e.g.
+        with the bytes written).
+    """
+    if not profiling(name_list):
+        yield fields
+        return
+    if frame is None:
+        frame = getattr(_LOCAL, 'frame', None)
+    elif step == 'frame':
+        _LOCAL.frame = frame
+    start = time.time()
+    begin = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record = {'stage': stage, 'step': step, 'frame': frame,
+                  'seconds': time.perf_counter() - begin, 'start': start,
+                  'pid': os.getpid(), 'bytes': None, 'clusters': None,
+                  'workers': None}
+        record.update(fields)
+        with _LOCK:
+            _RECORDS.append(record)
+        if step in ('frame', 'stage'):
+            _LOCAL.frame = None
+            flush_records(name_list)
+
+
+def profile_function(name_list, stage, step, fnc):
+    """
+    Wrap a read function, so each read is recorded with the size of the
+    file. The timestamp of the file is taken as its frame.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+    stage : str
+        Stage of the reads.
+    step : str
+        Name of the step, e.g. 'read_fnc'.
+    fnc : function
+        Function of a single file.
+
+    Returns
+    -------
+    function
+        The function itself if the profiler is disabled.
+    """
+    if not profiling(name_list):
+        return fnc
+
+    def profiled(file):
+        with profile_step(name_list, stage, step, frame_key(name_list, file),
+                          bytes=file_size(file)):
+            return fnc(file)
+    return profiled
+
+
+def profile_report(name_list):
+    """
+    Aggregate the records of the run into the run report. The records are
+    written at profile/records.parquet and the report at profile/report.json.
+
+    The report has the count, total, mean, median, 95th percentile and
+    maximum wall time of each step of each stage, with the bytes and
+    clusters, and for each stage the wall time, the busy time of the workers
+    (sum of the 'frame' steps), the worker utilization (busy time divided by
+    the wall time of all workers) and the slowest frames.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    Returns
+    -------
+    report : dict or None
+        Report of the run, None if there are no records.
+    """
+    flush_records(name_list)
+    path = profile_path(name_list)
+    parts = sorted(glob.glob(path + 'records_*.jsonl'))
+    records = []
+    for part in parts:
+        with open(part) as f:
+            records.extend(json.loads(line) for line in f)
+    if not records:
+        return None
+    records = pd.DataFrame(records).sort_values('start', ignore_index=True)
+    records.to_parquet(path + 'records.parquet', engine='pyarrow')
+    steps = []
+    for (stage, step), group in records.groupby(['stage', 'step'], sort=False):
+        seconds = group['seconds'].values
+        steps.append({'stage': stage, 'step': step,
+                      'count': len(group),
+                      'seconds': float(seconds.sum()),
+                      'mean': float(seconds.mean()),
+                      'p50': float(np.percentile(seconds, 50)),
+                      'p95': float(np.percentile(seconds, 95)),
+                      'max': float(seconds.max()),
+                      'bytes': int(group['bytes'].fillna(0).sum()),
+                      'clusters': int(group['clusters'].fillna(0).sum())})
+    stages = {}
+    for stage, group in records.groupby('stage', sort=False):
+        wall = group.loc[group['step'] == 'stage']
+        frames = group.loc[group['step'] == 'frame']
+        summary = {'seconds': None, 'workers': None,
+                   'frames': len(frames),
+                   'busy': float(frames['seconds'].sum()),
+                   'utilization': None,
+                   'slowest_frames': frames.nlargest(5, 'seconds')[
+                       ['frame', 'seconds']].to_dict('records')}
+        if not wall.empty:
+            summary['seconds'] = float(wall['seconds'].sum())
+            summary['workers'] = int(wall['workers'].max())
+            if summary['seconds'] > 0 and len(frames):
+                summary['utilization'] = summary['busy'] / \
+                    (summary['seconds'] * summary['workers'])
+        stages[stage] = summary
+    report = {'input_path': name_list['input_path'],
+              'output_path': name_list['output_path'],
+              'records': len(records),
+              'stages': stages,
+              'steps': steps}
+    with open(path + 'report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    for part in parts:
+        os.remove(part)
+    return report
@@ -0,0 +1,83 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+def read_frame(read_fnc, file):
+    """
+    Read a frame with the read function, returning the error instead of
+    raising it.
+
+    Parameters
+    ----------
+    read_fnc : function
+        Function to read the data.
+    file : str
+        Path of the file.
+
+    Returns
+    -------
+    data : numpy array or None
+        Data of the file, None if the read failed.
+    error : Exception or None
+        Error raised by the read function.
+    """
+    try:
+        return read_fnc(file), None
+    except Exception as e:
+        return None, e
+
+
+def prefetch_reader(files, read_fnc, depth=0, workers=1):
+    """
+    Read the files in order, decoding the next files in background threads
+    while the current one is processed.
+
+    At most depth files are read ahead of the file being processed, so the
+    memory is bounded by depth + 1 frames. The threads only help when the
+    read function releases the GIL (file and network I/O, decompression).
+    Read functions that are not thread safe (e.g. netCDF4 without a thread
+    safe HDF5) must use a single worker, which is the default.
+
+    Parameters
+    ----------
+    files : list
+        Files to be read.
+    read_fnc : function
+        Function to read the data.
+    depth : int
+        Number of files read ahead. If 0, the files are read when requested,
+        without threads.
+    workers : int
+        Number of reading threads.
+
+    Yields
+    ------
+    file : str
+        Path of the file.
+    data : numpy array or None
+        Data of the file, None if the read failed.
+    error : Exception or None
+        Error raised by the read function.
+    """
+    if depth <= 0:
+        for file in files:
+            yield (file,) + read_frame(read_fnc, file)
+        return
+    files = iter(files)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        # The file being processed and the files read ahead
+        for file in files:
+            pending.append((file, pool.submit(read_frame, read_fnc, file)))
+            if len(pending) > depth:
+                break
+        while pending:
+            file, future = pending.popleft()
+            data, error = future.result()
+            yield file, data, error
+            # Release the frame and read the next one ahead
+            data = None
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append((next_file, pool.submit(read_frame, read_fnc,
+                                                       next_file)))
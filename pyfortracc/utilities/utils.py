@@ -223,8 +223,12 @@ def get_parquets(name_list):
         The DataFrame is indexed by 'timestamp' and sorted in ascending order based on 
         this index.
     """
-    files_list = sorted(glob.glob(name_list['output_path'] + '**/trackingtable/*.parquet',
-                                recursive=True))
+    # Imported here because the manifest module uses these utilities
+    from .manifest import stage_files
+    files_list = stage_files(name_list, 'trackingtable')
+    if files_list is None:
+        files_list = sorted(glob.glob(name_list['output_path'] + '**/trackingtable/*.parquet',
+                                      recursive=True))
     files_df = pd.DataFrame(files_list, columns=['file'])
     files_df['timestamp'] = files_df['file'].apply(get_featstamp)
     files_df['mode'] = files_df['file'].apply(lambda x: pathlib.Path(x).parts[-3])
@@ -359,11 +363,14 @@ def get_edges(name_list, feat_files=[], read_fnc=None):
     if name_list['edges']:
         # Get the data shape from the first file
         for file in feat_files:
-            feat_df = pd.read_parquet(file)
+            feat_df = read_parquet(file, ['file'])
             if len(feat_df) > 0:
                 file_path = feat_df['file'].unique()[0]
                 data_shape = read_fnc(file_path).shape
                 break
+        # Without feature files use the dimensions of the name_list
+        if data_shape == (0, 0) and 'x_dim' in name_list and 'y_dim' in name_list:
+            data_shape = (name_list['y_dim'], name_list['x_dim'])
 
     # Check if lat_min is not defined
     if name_list['lat_min'] is None or name_list['lat_max'] is None:
@@ -528,6 +535,9 @@ def set_schema(module,name_list):
                 'prv_spl_iuid': float,
             }
         }
+    # Parent cluster of the previous threshold level
+    if name_list['segmentation_method'] == 'hierarchical':
+        s_dict['features']['parent_id'] = float
     # Add the methods field to spatial schema
     if name_list['spl_correction']:
         s_dict['spatial']['u_spl'] = float
@@ -673,9 +683,47 @@ def set_amemory(name_list):
     return name_list['a_memory']
 
 
-def write_parquet(dataframe, path_file):
+def parquet_options(name_list, stage='intermediate'):
     """
-    Write the DataFrame to a Parquet file with gzip compression.
+    Get the writer options of the Parquet files of a stage.
+
+    The intermediate files (features, spatial and linked) are deleted after the
+    concatenation, so they are written with intermediate_codec, while the
+    tracking table and the duration outputs are written with final_codec.
+
+    Parameters
+    ----------
+    name_list : dict
+        Dictionary with the parameters to be used.
+
+    stage : str
+        'intermediate' or 'final'.
+
+    Returns
+    -------
+    options : dict
+        Keyword arguments of pyarrow.parquet.write_table.
+    """
+    if stage == 'intermediate':
+        codec = name_list['intermediate_codec']
+    elif stage == 'final':
+        codec = name_list['final_codec']
+    else:
+        raise ValueError('Invalid stage')
+    if codec not in ('none', 'snappy', 'gzip', 'brotli', 'lz4', 'zstd'):
+        raise ValueError('Invalid parquet codec: {}'.format(codec))
+    options = {'compression': codec,
+               'use_dictionary': name_list['use_dictionary']}
+    if name_list['compression_level'] is not None and codec != 'none':
+        options['compression_level'] = name_list['compression_level']
+    if name_list['row_group_size'] is not None:
+        options['row_group_size'] = name_list['row_group_size']
+    return options
+
+
+def write_parquet(dataframe, path_file, options=None):
+    """
+    Write the DataFrame to a Parquet file.
 
     Parameters
     ----------
@@ -685,19 +733,28 @@ def write_parquet(dataframe, path_file):
     path_file : str
         The file path where the Parquet file will be saved.
 
+    options : dict, optional
+        Writer options from parquet_options. If None, gzip compression is used.
+
     Returns
     -------
     None
     """
-    # print(path_file)
+    if options is None:
+        options = {'compression': 'gzip'}
     dataframe.to_parquet(path_file,
                         engine='pyarrow',
-                        compression='gzip')
+                        **options)
 
 
-def read_parquet(path_file, columns):
+def read_parquet(path_file, columns, filters=None):
     """
-    Read a Parquet file into a DataFrame, with optional column selection.
+    Read a Parquet file into a DataFrame, with optional column selection and
+    row filters.
+
+    Only the selected columns are read from the file, and the filters are
+    applied by the reader, so the row groups without matching rows are
+    skipped.
 
     Parameters
     ----------
@@ -707,16 +764,18 @@ def read_parquet(path_file, columns):
     columns : list of str, optional
         A list of column names to read from the Parquet file. If None, all columns are read.
 
+    filters : list of tuple, optional
+        Row filters in the pyarrow format, e.g. [('threshold_level', '==', 0)].
+        If None, all rows are read. The filtered rows keep the index stored in
+        the file, a range index is renumbered from 0, so the filters are not
+        used for the frames whose clusters are referenced by position.
+
     Returns
     -------
     dataframe : pd.DataFrame
         The DataFrame containing the data from the Parquet file.
     """
-    if columns is None:
-        dataframe = pd.read_parquet(path_file)
-    else:
-        dataframe = pd.read_parquet(path_file)
-    return dataframe
+    return pd.read_parquet(path_file, columns=columns, filters=filters)
 
 
 def get_geotransform(name_list):
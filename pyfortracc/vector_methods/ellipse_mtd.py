@@ -1,6 +1,7 @@
+import numpy as np
+import shapely
 from shapely.geometry import Point
 from shapely.affinity import scale
-from pyfortracc.utilities.math_utils import uv_components
 
 def ellipse_mtd(cur_df, prv_df):
     ''' 
@@ -12,36 +13,24 @@ def ellipse_mtd(cur_df, prv_df):
     cur_df : DataFrame
         current frame
     prev_df : DataFrame
-        previous frame
+        previous frame, selected by the past_idx of the current frame
         
     Returns
     ----------
-    u_ : list 
-        list of zonal (u) components
-    v_ : list
-        list of meridional (v) components
+    u_ : array 
+        array of zonal (u) components
+    v_ : array
+        array of meridional (v) components
     '''  
     
-    u_, v_ = [], []
-    cur_df['elipse'] = cur_df.geometry.apply(envole_ellipse)
-    prv_df['elipse'] = prv_df.geometry.apply(envole_ellipse)
-    for _, row in cur_df.iterrows():
-        cur_ellip_cent = row.elipse.centroid
-        prv_ellip_cent = prv_df.loc[row['past_idx']].elipse.centroid
-        # If prv_ellip_cent is more than one, get centroid between points
-        if isinstance(prv_ellip_cent, Point) == False:
-            prv_ellip_cent = prv_ellip_cent.unary_union.centroid
-        uv_ = uv_components(prv_ellip_cent.coords[0], cur_ellip_cent.coords[0])
-        u_.append(uv_[0])
-        v_.append(uv_[1])
-    # import matplotlib.pyplot as plt
-    # fig, ax = plt.subplots()
-    # cur_df.geometry.boundary.plot(ax=ax, color='red')
-    # prv_df.geometry.boundary.plot(ax=ax, color='blue')
-    # cur_df.elipse.boundary.plot(ax=ax, color='green')
-    # prv_df.elipse.boundary.plot(ax=ax, color='green')
-    # plt.show()
-    # exit()
+    cur_ellip_cent = ellipse_centroids(cur_df['geometry'].values)
+    prv_ellip_cent = ellipse_centroids(prv_df['geometry'].values)
+    # If a past index is repeated, get centroid between points
+    if len(prv_df) != len(cur_df):
+        prv_ellip_cent = past_centroids(prv_ellip_cent, prv_df.index.values,
+                                        cur_df['past_idx'].values)
+    u_ = cur_ellip_cent[:, 0] - prv_ellip_cent[:, 0]
+    v_ = cur_ellip_cent[:, 1] - prv_ellip_cent[:, 1]
     return u_, v_
 
 
@@ -52,4 +41,77 @@ def envole_ellipse(geometry, scale_factor=1):
     semi_eixo_y = (maxy - miny) / 2
     elipse = Point(centroide).buffer(1)
     elipse = scale(elipse, xfact=semi_eixo_x * scale_factor, yfact=semi_eixo_y * scale_factor)
-    return elipse
\ No newline at end of file
+    return elipse
+
+
+def past_centroids(centroids, prv_index, past_idx):
+    """
+    Centroids of the previous ellipses of each current cluster, when the
+    previous frame has repeated indexes. The previous frame has the rows of
+    each past index in the order of the current frame, and the centroid of
+    a repeated index is the centroid of the union of its points.
+
+    Parameters
+    ----------
+    centroids : array
+        array of (x, y) coordinates of the previous ellipse centroids
+    prv_index : array
+        index of the previous frame
+    past_idx : array
+        past index of each current cluster
+
+    Returns
+    -------
+    centroids : array
+        array of (x, y) coordinates, one for each current cluster
+    """
+    labels, counts = np.unique(prv_index, return_counts=True)
+    position = np.searchsorted(labels, past_idx.astype(labels.dtype))
+    # Rows of each past index, divided by the times it is selected
+    sizes = counts[position] // np.bincount(position,
+                                            minlength=len(labels))[position]
+    starts = np.cumsum(sizes) - sizes
+    past_cent = centroids[starts]
+    for cidx in np.flatnonzero(sizes > 1):
+        points = shapely.points(centroids[starts[cidx]:starts[cidx] + sizes[cidx]])
+        past_cent[cidx] = shapely.get_coordinates(
+                          shapely.centroid(shapely.union_all(points)))[0]
+    return past_cent
+
+
+def ellipse_centroids(geometries, scale_factor=1):
+    """
+    Centroids of the envelope ellipses of an array of geometries, the same of
+    envole_ellipse(geometry).centroid. The unit circles of all geometries are
+    buffered and scaled at once, with the same operations of shapely.affinity.scale.
+
+    Parameters
+    ----------
+    geometries : array
+        array of geometries
+    scale_factor : float
+        scale factor of the ellipses
+
+    Returns
+    -------
+    centroids : array
+        array of (x, y) coordinates of the ellipse centroids
+    """
+    if len(geometries) == 0:
+        return np.empty((0, 2))
+    minx, miny, maxx, maxy = shapely.bounds(geometries).T
+    semi_eixo_x = (maxx - minx) / 2 * scale_factor
+    semi_eixo_y = (maxy - miny) / 2 * scale_factor
+    elipse = shapely.buffer(shapely.centroid(geometries), 1, quad_segs=16)
+    # Scale each circle from the center of its bounds
+    c_minx, c_miny, c_maxx, c_maxy = shapely.bounds(elipse).T
+    x0, y0 = (c_maxx + c_minx) / 2.0, (c_maxy + c_miny) / 2.0
+    coords, index = shapely.get_coordinates(elipse, return_index=True)
+    x, y = coords.T
+    xfact, yfact = semi_eixo_x[index], semi_eixo_y[index]
+    # Offset form of shapely.affinity.scale, kept for the bit-identical
+    # output checked by tests/vector_methods_parity.py
+    xp = xfact * x + (x0 - x0 * semi_eixo_x)[index]
+    yp = yfact * y + (y0 - y0 * semi_eixo_y)[index]
+    elipse = shapely.set_coordinates(elipse, np.stack([xp, yp]).T)
+    return shapely.get_coordinates(shapely.centroid(elipse))
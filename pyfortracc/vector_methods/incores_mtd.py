@@ -1,5 +1,6 @@
 import numpy as np
-from pyfortracc.utilities.math_utils import calc_mean_uv
+import pandas as pd
+from pyfortracc.utilities.math_utils import loc_groups, group_reduce
 
 def innercores_mtd(cur_base, cur_inner, cur_bse_idx, cur_ins_idx):
     """
@@ -14,14 +15,14 @@ def innercores_mtd(cur_base, cur_inner, cur_bse_idx, cur_ins_idx):
     cur_bse_idx : array
         array of indexes of current base cells
     cur_ins_idx : array
-        array of indexes of current inner cells
+        array of lists of indexes of current inner cells
     
     Returns
     -------
-    u_ : list
-        list of zonal (u) components
-    v_ : list
-        list of meridional (v) components
+    u_ : array
+        array of zonal (u) components
+    v_ : array
+        array of meridional (v) components
     
     Notes
     -------
@@ -30,18 +31,35 @@ def innercores_mtd(cur_base, cur_inner, cur_bse_idx, cur_ins_idx):
     v : float
         The meridional component, representing the north-south direction (meridional).
     """
-    # Set output
-    u_, v_ = [], []
-    # Loop over cur_inned_idx
-    for cidx in range(len(cur_bse_idx)):
-        cur_bse_uv = cur_base.loc[cur_bse_idx[cidx]][['u_','v_']].values
-        cur_inn_uv = cur_inner.loc[cur_ins_idx[cidx]][['u_','v_']]
-        cur_inn_uv = cur_inn_uv.dropna(axis=0).values
-        # if len(cur_inn_uv) == 0:
-        #     continue
-        uv_list = np.vstack((cur_bse_uv, cur_inn_uv))
-        # Calculate mean of vectors
-        mean_uv = calc_mean_uv(uv_list)
-        u_.append(mean_uv[0])
-        v_.append(mean_uv[1])
-    return u_, v_
\ No newline at end of file
+    # Vectors of the base cells and of their inner cells
+    cur_bse_uv = cur_base.loc[cur_bse_idx][['u_','v_']].values
+    group, positions = loc_groups(cur_inner, cur_ins_idx)
+    cur_inn_uv = cur_inner[['u_','v_']].values[positions]
+    valid = ~pd.isna(cur_inn_uv).any(axis=1)
+    # Calculate mean of vectors, the base vector is the first of each group
+    group = np.concatenate((np.arange(len(cur_bse_uv)), group[valid]))
+    uv_list = np.vstack((cur_bse_uv, cur_inn_uv[valid]))
+    uv_list = uv_list.astype(float)
+    u_ = group_reduce(uv_list[:, 0], group, len(cur_bse_uv), sequential_mean)
+    v_ = group_reduce(uv_list[:, 1], group, len(cur_bse_uv), sequential_mean)
+    return u_, v_
+
+
+def sequential_mean(values, axis):
+    """
+    Mean of the values summed one by one along an axis, as the mean of the
+    vectors of a cluster, that are python objects.
+
+    Parameters
+    ----------
+    values : array
+        array of values
+    axis : int
+        axis of the mean
+
+    Returns
+    -------
+    mean : array
+        array of means
+    """
+    return np.cumsum(values, axis=axis).take(-1, axis=axis) / values.shape[axis]
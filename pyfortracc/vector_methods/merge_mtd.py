@@ -1,6 +1,6 @@
 import numpy as np
-from scipy import stats
-from pyfortracc.utilities.math_utils import uv_components, calc_addition_uv
+import shapely
+from pyfortracc.utilities.math_utils import loc_groups, group_reduce
 
 
 def merge_mtd(cur_mrg_df, prv_mrg_df, cur_mrgs_idx, prv_mrg_idx):
@@ -17,14 +17,14 @@ def merge_mtd(cur_mrg_df, prv_mrg_df, cur_mrgs_idx, prv_mrg_idx):
     cur_mrgs_idx: array
         array of indexes of merged cells
     prv_mrg_idx: array 
-        array of indexes of previous merged cells
+        array of lists of indexes of previous merged cells
     
     Returns
     -------
-    u_ : list
-        list of zonal (u) components
-    v_ : list 
-        list of meridional (v) components
+    u_ : array
+        array of zonal (u) components
+    v_ : array 
+        array of meridional (v) components
     
     Notes
     -------
@@ -33,18 +33,13 @@ def merge_mtd(cur_mrg_df, prv_mrg_df, cur_mrgs_idx, prv_mrg_idx):
     v : float
         The meridional component, representing the north-south direction (meridional).
     """
-    # Set output
-    u_, v_ = [], []
-    # Transform prv_mrg_idx to list of events before merge
-    prv_mrg_idx = prv_mrg_idx.tolist()
-    # Loop over cur_mrg_idx
-    for cidx in range(len(cur_mrgs_idx)):
-        cur_crtd = cur_mrg_df.loc[cur_mrgs_idx[cidx]]['centroid']
-        prv_crtds = prv_mrg_df.loc[prv_mrg_idx[cidx]]['centroid'].values
-        uv_comps = np.array([uv_components(p.coords[0], cur_crtd.coords[0])
-                    for p in prv_crtds])
-        # Calculate adding of vectors
-        mean_uv = calc_addition_uv(uv_comps)
-        u_.append(mean_uv[0])
-        v_.append(mean_uv[1])    
-    return u_, v_
\ No newline at end of file
+    # Centroids of the current merged cells
+    cur_crtd = shapely.get_coordinates(cur_mrg_df.loc[cur_mrgs_idx]['centroid'].values)
+    # Centroids of the previous cells of each merge
+    group, positions = loc_groups(prv_mrg_df, prv_mrg_idx)
+    prv_crtds = shapely.get_coordinates(prv_mrg_df['centroid'].values[positions])
+    # Calculate adding of vectors
+    uv_comps = cur_crtd[group] - prv_crtds
+    u_ = group_reduce(uv_comps[:, 0], group, len(cur_crtd), np.sum)
+    v_ = group_reduce(uv_comps[:, 1], group, len(cur_crtd), np.sum)
+    return u_, v_
@@ -4,6 +4,7 @@ import numpy as np
 from shapely.ops import linemerge
 from shapely.geometry import Point, LineString, MultiLineString
 from pyfortracc.utilities.math_utils import point_position, calc_mean_uv
+from pyfortracc.utilities.pixels import cluster_pixels
 from .opticalflow_filters import histogram_equalization, apply_gaussian_blur
 from shapely.affinity import affine_transform
 
@@ -71,16 +72,12 @@ def opticalflow_mtd(cur_df, prev_df, name_list, geotrf):
     
 
     # Mount current image based on the current frame
-    cur_y = cur_df['array_y'].explode().values.astype(int)
-    cur_x = cur_df['array_x'].explode().values.astype(int)
-    cur_v = cur_df['array_values'].explode().values
+    _, cur_y, cur_x, cur_v = cluster_pixels(cur_df)
     current_img = np.zeros((name_list['y_dim'], name_list['x_dim']), dtype=np.float32)
     current_img[cur_y, cur_x] = cur_v
 
     # Mount previous image based on the previous frame
-    prev_y = prev_df['array_y'].explode().values.astype(int)
-    prev_x = prev_df['array_x'].explode().values.astype(int)
-    prev_v = prev_df['array_values'].explode().values
+    _, prev_y, prev_x, prev_v = cluster_pixels(prev_df)
     previous_img = np.zeros((name_list['y_dim'], name_list['x_dim']), dtype=np.float32)
     previous_img[prev_y, prev_x] = prev_v
 
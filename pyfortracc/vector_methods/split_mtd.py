@@ -1,6 +1,5 @@
-import geopandas as gpd
-from shapely.geometry import LineString
-from pyfortracc.utilities.math_utils import uv_components
+import numpy as np
+import shapely
 
 def split_mtd(cur_df, prv_df, spl_idx):
     """ 
@@ -19,30 +18,24 @@ def split_mtd(cur_df, prv_df, spl_idx):
     
     Returns
     ----------
-    linestrings : list
-        list of LineStrings between centroids
-    u_ : list 
-        list of zonal (u) components
-    v_ : list 
-        list of meridional (v) components
+    linestrings : array
+        wkt of the LineStrings between centroids
+    u_ : array 
+        array of zonal (u) components
+    v_ : array 
+        array of meridional (v) components
     """
-    # Set output
-    linestrings, u_, v_ = [], [], []
-    # Loop over spl_idx
-    for sidx in spl_idx:
-        cur_i_df = cur_df.loc[sidx]
-        cur_geom = cur_i_df['geometry']
-        prv_geom = prv_df.loc[cur_i_df['split_pr_idx']]['geometry']
-        # if is a instance of GeoSeries get the first geometry
-        if isinstance(cur_geom, gpd.GeoSeries):
-            cur_geom = cur_geom.iloc[0]
-        if isinstance(prv_geom, gpd.GeoSeries):
-            prv_geom = prv_geom.iloc[0]
-        # Get intersection between current and previous geometries
-        prv_ints_ctrd = cur_geom.intersection(prv_geom).centroid
-        cur_ctrd = cur_geom.centroid       
-        linestrings.append(LineString([prv_ints_ctrd,cur_ctrd]))
-        uv_ = uv_components(prv_ints_ctrd.coords[0], cur_ctrd.coords[0])
-        u_.append(uv_[0])
-        v_.append(uv_[1])
-    return linestrings, u_, v_
\ No newline at end of file
+    # Get the first row of each index, as in cur_df.loc[sidx]
+    cur_df = cur_df.loc[~cur_df.index.duplicated()].loc[spl_idx]
+    prv_df = prv_df.loc[~prv_df.index.duplicated()]
+    cur_geom = cur_df['geometry'].values
+    prv_geom = prv_df.loc[cur_df['split_pr_idx'].values]['geometry'].values
+    # Get intersection between current and previous geometries
+    prv_ints_ctrd = shapely.get_coordinates(
+                    shapely.centroid(shapely.intersection(cur_geom, prv_geom)))
+    cur_ctrd = shapely.get_coordinates(shapely.centroid(cur_geom))
+    linestrings = shapely.linestrings(np.stack((prv_ints_ctrd, cur_ctrd), axis=1))
+    linestrings = shapely.to_wkt(linestrings, rounding_precision=-1)
+    u_ = cur_ctrd[:, 0] - prv_ints_ctrd[:, 0]
+    v_ = cur_ctrd[:, 1] - prv_ints_ctrd[:, 1]
+    return linestrings, u_, v_
@@ -0,0 +1,87 @@
+import sys
+import time
+import argparse
+import numpy as np
+from scipy import ndimage
+sys.path.append('../')
+from pyfortracc.features_extraction.clustering import clustering
+from pyfortracc.features_extraction.statistics import (cluster_statistics,
+                                                       geo_statistics)
+
+# Benchmark of the statistics of the clusters of a synthetic global field.
+# cluster_statistics reduces all clusters at once with np.*.reduceat; the
+# per-cluster loop below selects the pixels of each cluster with argwhere,
+# as geo_statistics did before. The statistics of both must match.
+# Usage: python cluster_statistics_benchmark.py --y-dim 1800 --x-dim 3600
+
+
+def loop_statistics(cluster_labels, values_matrix):
+    """
+    Statistics and pixel arrays of each cluster, one cluster at a time.
+    """
+    y_, x_, labels = cluster_labels[:, 0], cluster_labels[:, 1], cluster_labels[:, 2]
+    output = []
+    for cluster_id in np.unique(labels):
+        cluster_indices = np.argwhere(labels == cluster_id).ravel()
+        array_y = y_[cluster_indices]
+        array_x = x_[cluster_indices]
+        cluster_values = values_matrix[array_y, array_x]
+        output.append((cluster_id, len(cluster_values),
+                       np.nanmin(cluster_values), np.nanmean(cluster_values),
+                       np.nanmax(cluster_values), np.nanstd(cluster_values),
+                       cluster_values, array_x, array_y))
+    return output
+
+
+def synthetic_field(y_dim, x_dim, seed):
+    rng = np.random.default_rng(seed)
+    field = rng.normal(0, 1, (y_dim // 10, x_dim // 10))
+    return ndimage.zoom(field, 10, order=1).astype(np.float32)
+
+
+def same_statistics(stats_df, loop):
+    if len(stats_df) != len(loop):
+        return False
+    for row, (cluster_id, size, min_, mean, max_, std, values, array_x,
+              array_y) in zip(stats_df.itertuples(), loop):
+        if (row.cluster_id != cluster_id or row.size != size or
+                not np.allclose([row.min, row.mean, row.max, row.std],
+                                [min_, mean, max_, std], rtol=1e-5) or
+                not np.array_equal(row.array_values, values) or
+                not np.array_equal(row.array_x, array_x) or
+                not np.array_equal(row.array_y, array_y)):
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--y-dim', type=int, default=1800)
+    parser.add_argument('--x-dim', type=int, default=3600)
+    parser.add_argument('--threshold', type=float, default=1.0)
+    parser.add_argument('--min-size', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skip-loop', action='store_true')
+    args = parser.parse_args()
+    field = synthetic_field(args.y_dim, args.x_dim, args.seed)
+    clusters, labels = clustering('ndimage', field, np.greater_equal,
+                                  args.threshold, args.min_size)
+    print('Grid {}x{}: {} clusters, {} pixels'.format(
+        args.y_dim, args.x_dim, len(np.unique(labels[:, 2])), len(labels)))
+    name_list = {'y_res': 180 / args.y_dim, 'x_res': 360 / args.x_dim,
+                 'lat_min': -90, 'lon_min': -180, 'cluster_method': 'ndimage',
+                 'eps': 1, 'convex_hull': False, 'geometry_method': 'eager'}
+    start = time.perf_counter()
+    stats_df = cluster_statistics(labels, field)
+    print('cluster_statistics: {:.3f} s'.format(time.perf_counter() - start))
+    start = time.perf_counter()
+    geo_statistics(clusters, labels, field, name_list)
+    print('geo_statistics: {:.3f} s'.format(time.perf_counter() - start))
+    if not args.skip_loop:
+        start = time.perf_counter()
+        loop = loop_statistics(labels, field)
+        print('per-cluster loop: {:.3f} s'.format(time.perf_counter() - start))
+        if not same_statistics(stats_df, loop):
+            print('The statistics are different')
+            sys.exit(1)
+        print('same statistics')
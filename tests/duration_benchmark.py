@@ -0,0 +1,29 @@
+import sys
+import time
+import argparse
+sys.path.append('../')
+from pyfortracc.benchmark import synthetic_table
+from pyfortracc.post_processing import compute_duration
+
+# Benchmark of the duration over a synthetic tracking table.
+# Usage: python duration_benchmark.py --rows 1000000 --files 1000 --parallel
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--dir', default='duration_benchmark/')
+    parser.add_argument('--parallel', action='store_true')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    name_list, table = synthetic_table(args.dir, n_rows=args.rows,
+                                       n_files=args.files)
+    print('Table: {} rows, {} clusters, {} files ({:.1f} s)'.format(
+        table['n_rows'], table['n_clusters'], table['n_files'],
+        time.perf_counter() - start))
+    name_list['n_jobs'] = args.n_jobs
+    start = time.perf_counter()
+    compute_duration(name_list, parallel=args.parallel)
+    print('compute_duration: {:.3f} s'.format(time.perf_counter() - start))
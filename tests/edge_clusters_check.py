@@ -0,0 +1,102 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+sys.path.append('../')
+from pyfortracc.default_parameters import default_parameters
+from pyfortracc.features_extraction import frame_features
+from pyfortracc.spatial_operations import load_frame
+from pyfortracc.spatial_operations.edge_clusters import edge_clusters
+from pyfortracc.utilities.utils import get_edges, set_schema, set_operator
+
+# Check of the pixel method of edge_clusters against the geometry method.
+# Smooth random fields on a global 1 degree grid are clustered with two
+# thresholds, and the clusters of each threshold are linked across the
+# edges with both methods. The linked clusters must form the same
+# components, and the board_idx set by spatial_frame from the links must be
+# the same.
+# Usage: python edge_clusters_check.py --frames 80
+
+
+def synthetic_field(seed, y_dim, x_dim):
+    rng = np.random.default_rng(seed)
+    field = ndimage.gaussian_filter(rng.random((y_dim, x_dim)), 3)
+    field = (field - field.mean()) / field.std()
+    return np.where(field > 1.2, 2.0, np.where(field > 0.3, 1.0, 0.0))
+
+
+def components(touch_larger, touch_lower):
+    # Clusters of each component of the links, by the smallest index
+    links = pd.DataFrame({'larger': touch_larger, 'lower': touch_lower})
+    label = {idx: idx for idx in np.unique(links.values)}
+    changed = True
+    while changed:
+        changed = False
+        for larger, lower in links.values:
+            root = min(label[larger], label[lower])
+            if label[larger] != root or label[lower] != root:
+                label[larger] = label[lower] = root
+                changed = True
+    return label
+
+
+def board_idx(clusters, touch_larger, touch_lower):
+    # board_idx of the clusters, set as in spatial_frame
+    board = pd.Series(np.nan, index=clusters.index)
+    board.loc[touch_lower] = touch_larger
+    return board
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=80)
+    args = parser.parse_args()
+    name_list = {'input_path': 'edge_clusters_check/',
+                 'output_path': 'edge_clusters_check/',
+                 'thresholds': [1, 2], 'min_cluster_size': [1, 1],
+                 'operator': '>=', 'timestamp_pattern': '%Y',
+                 'delta_time': 10, 'x_dim': 360, 'y_dim': 180,
+                 'lat_min': -90, 'lat_max': 90, 'lon_min': -180,
+                 'lon_max': 180, 'edges': True}
+    name_list = default_parameters(name_list)
+    name_list['y_res'], name_list['x_res'] = 1.0, 1.0
+    left_edge, right_edge = get_edges(name_list)
+    schema = set_schema('features', name_list)
+    operator = set_operator(name_list['operator'])
+    seconds = {'geometry': 0.0, 'pixel': 0.0}
+    links, failed, different = 0, [], 0
+    for seed in range(args.frames):
+        field = synthetic_field(seed, name_list['y_dim'], name_list['x_dim'])
+        frame = load_frame(frame_features(field, pd.Timestamp('2020'),
+                                          'synthetic', name_list, operator,
+                                          schema))
+        for threshold in name_list['thresholds']:
+            clusters = frame.loc[frame['threshold'] == threshold]
+            output = {}
+            for method in ('geometry', 'pixel'):
+                name_list['edges_method'] = method
+                start = time.perf_counter()
+                touch_larger, touch_lower = edge_clusters(clusters.copy(),
+                                                          left_edge,
+                                                          right_edge,
+                                                          name_list)
+                seconds[method] += time.perf_counter() - start
+                output[method] = (touch_larger, touch_lower)
+            links += len(set(output['pixel'][1]))
+            geometry = board_idx(clusters, *output['geometry'])
+            pixel = board_idx(clusters, *output['pixel'])
+            board = (geometry.fillna(-1) != pixel.fillna(-1)).sum()
+            if components(*output['geometry']) != components(*output['pixel']) \
+                    or board:
+                failed.append((seed, threshold))
+                different += board
+    print('{} frames, {} linked clusters'.format(args.frames, links))
+    print('geometry {:.2f} s, pixel {:.2f} s'.format(seconds['geometry'],
+                                                     seconds['pixel']))
+    if failed:
+        print('different components or board_idx (seed, threshold):', failed)
+        print('clusters with another board_idx: {}'.format(different))
+        sys.exit(1)
+    print('same components and board_idx')
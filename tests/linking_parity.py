@@ -0,0 +1,81 @@
+import sys
+import glob
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+sys.path.append('../')
+import pyfortracc
+from pyfortracc.benchmark import synthetic_workload, read_workload
+
+# Regression check of the chunked linking against the serial linking.
+# The same synthetic workload is tracked with the serial linking and with the
+# chunked linking (parallel_linking) for each n_jobs, with the same random
+# seed, and the tracking tables must have the same uid, iuid, lifetime,
+# trajectory, previous uids and iuids of merges and splits, duration and
+# genesis. The random decimals of the iuids are the same, as the chunked
+# linking draws them in the order of the serial linking.
+# Usage: python linking_parity.py --frames 80 --n-jobs 3,4
+
+
+def tracking_table(name_list, output_path, **parameters):
+    name_list = dict(name_list, output_path=output_path, **parameters)
+    shutil.rmtree(output_path, ignore_errors=True)
+    np.random.seed(0)
+    pyfortracc.track(name_list, read_workload, parallel=True, duration=True)
+    files = sorted(glob.glob(output_path + 'track/trackingtable/*.parquet'))
+    return pd.concat([pd.read_parquet(file) for file in files])
+
+
+def normalized(value):
+    # None and NaN are the same missing value, lists are compared as tuples
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(normalized(item) for item in value)
+    if pd.isna(value):
+        return None
+    return value
+
+
+def compare(serial, chunked):
+    differences = {}
+    if len(serial) != len(chunked):
+        return {'rows': (len(serial), len(chunked))}
+    columns = ['uid', 'iuid', 'lifetime', 'trajectory', 'prv_mrg_uids',
+               'prv_mrg_iuids', 'prv_spl_uid', 'prv_spl_iuid', 'duration',
+               'genesis']
+    for col in [col for col in columns if col in serial.columns]:
+        bad = sum(normalized(serial_value) != normalized(chunked_value)
+                  for serial_value, chunked_value in zip(serial[col].values,
+                                                         chunked[col].values))
+        if bad:
+            differences[col] = int(bad)
+    return differences
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=80)
+    parser.add_argument('--clusters', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n-jobs', default='3,4')
+    parser.add_argument('--dir', default='linking_parity/')
+    args = parser.parse_args()
+    name_list, _ = synthetic_workload(args.dir, n_frames=args.frames,
+                                      n_clusters=args.clusters,
+                                      seed=args.seed)
+    name_list['prv_uid'] = True
+    serial = tracking_table(name_list, args.dir + 'serial/',
+                            parallel_linking=False)
+    print('serial: {} rows, {} uids, {} iuids'.format(
+        len(serial), serial['uid'].nunique(), serial['iuid'].nunique()))
+    failed = False
+    for n_jobs in [int(n_jobs) for n_jobs in args.n_jobs.split(',')]:
+        chunked = tracking_table(name_list, args.dir + f'chunked_{n_jobs}/',
+                                 parallel_linking=True, n_jobs=n_jobs)
+        differences = compare(serial, chunked)
+        print('n_jobs={}: {}'.format(n_jobs, differences or 'same'))
+        failed = failed or bool(differences)
+    if failed:
+        sys.exit(1)
@@ -0,0 +1,70 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+sys.path.append('../')
+from pyfortracc.default_parameters import default_parameters
+from pyfortracc.features_extraction import frame_features
+from pyfortracc.spatial_operations import load_frame
+from pyfortracc.spatial_operations.overlay import overlay_, overlay_pixels
+from pyfortracc.utilities.utils import set_operator, set_schema
+
+# Benchmark of the overlay of two synthetic frames with the geometry
+# (overlay_) and the pixel (overlay_pixels) methods. The current field is
+# the previous one shifted and with noise. For each threshold, both methods
+# must give the same pairs of clusters and overlaps.
+# Usage: python overlay_benchmark.py --dim 1000 --thresholds 20,30,40
+
+
+def synthetic_fields(dim, seed):
+    rng = np.random.default_rng(seed)
+    previous = ndimage.gaussian_filter(rng.normal(size=(dim, dim)), 4)
+    previous = (previous - previous.mean()) / previous.std() * 15 + 20
+    current = np.roll(previous, (2, 3), axis=(0, 1))
+    current = current + rng.normal(scale=1, size=previous.shape)
+    return current, previous
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dim', type=int, default=1000)
+    parser.add_argument('--thresholds', default='20,30,40')
+    parser.add_argument('--min-overlap', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    thresholds = [float(threshold) for threshold in args.thresholds.split(',')]
+    name_list = default_parameters({'thresholds': thresholds,
+                                    'min_cluster_size': [5] * len(thresholds),
+                                    'operator': '>=', 'x_dim': args.dim,
+                                    'y_dim': args.dim,
+                                    'timestamp_pattern': '%Y'})
+    operator = set_operator(name_list['operator'])
+    schema = set_schema('features', name_list)
+    current, previous = synthetic_fields(args.dim, args.seed)
+    cur_frame = load_frame(frame_features(current, pd.Timestamp(0), '',
+                                          name_list, operator, schema))
+    prv_frame = load_frame(frame_features(previous, pd.Timestamp(0), '',
+                                          name_list, operator, schema))
+    failed = False
+    for threshold in thresholds:
+        cur_df = cur_frame.loc[cur_frame['threshold'] == threshold]
+        prv_df = prv_frame.loc[prv_frame['threshold'] == threshold]
+        start = time.perf_counter()
+        geometry = overlay_(cur_df.copy(), prv_df.copy(), args.min_overlap)
+        geometry_time = time.perf_counter() - start
+        start = time.perf_counter()
+        pixel = overlay_pixels(cur_df, prv_df, args.min_overlap)
+        pixel_time = time.perf_counter() - start
+        same = (np.array_equal(geometry[['index_1', 'index_2']].values,
+                               pixel[['index_1', 'index_2']].values) and
+                np.allclose(geometry['overlap'].values,
+                            pixel['overlap'].values))
+        print('threshold {}: {} and {} clusters, {} overlays, geometry '
+              '{:.3f} s, pixel {:.3f} s, {}'.format(
+                  threshold, len(cur_df), len(prv_df), len(pixel),
+                  geometry_time, pixel_time, 'same' if same else 'DIFFERENT'))
+        failed = failed or not same
+    if failed:
+        sys.exit(1)
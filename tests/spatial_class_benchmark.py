@@ -0,0 +1,65 @@
+import sys
+import time
+import numpy as np
+import pandas as pd
+sys.path.append('../')
+from pyfortracc.spatial_operations.spatial_class import (continuous, merge,
+                                                         split, merge_split)
+
+# Micro-benchmark of the event classification of the spatial operations
+# with a synthetic overlay table. Usage: python spatial_class_benchmark.py [n_pairs]
+
+
+def synthetic_overlays(n_pairs, seed=0):
+    """
+    Build a synthetic overlay table with n_pairs overlap pairs. Most clusters
+    are continuous, and part of them merge, split or merge and split.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = int(n_pairs * 0.8)
+    cur_pos = rng.integers(0, n_clusters, 3 * n_pairs)
+    # Most pairs keep the previous cluster, the others shift it
+    prv_pos = np.where(rng.random(3 * n_pairs) < 0.7, cur_pos,
+                       cur_pos + rng.integers(-3, 4, 3 * n_pairs))
+    prv_pos = np.clip(prv_pos, 0, n_clusters - 1)
+    pairs = np.unique(cur_pos * n_clusters + prv_pos)
+    pairs = np.sort(rng.choice(pairs, min(n_pairs, len(pairs)), replace=False))
+    cur_pos, prv_pos = np.divmod(pairs, n_clusters)
+    cur_size = rng.integers(1, 500, n_clusters)
+    prv_size = rng.integers(1, 500, n_clusters)
+    overlays = pd.DataFrame({'index_1': cur_pos,
+                             'cluster_id_1': cur_pos + 1.0,
+                             'size_1': cur_size[cur_pos],
+                             'index_2': prv_pos,
+                             'cluster_id_2': prv_pos + 1.0,
+                             'size_2': prv_size[prv_pos]})
+    cur_frame = pd.DataFrame({'size': cur_size,
+                              'merge_idx': None,
+                              'split_pr_idx': np.nan})
+    prv_frame = pd.DataFrame({'size': prv_size})
+    return overlays, cur_frame, prv_frame
+
+
+def classify(overlays, cur_frame, prv_frame):
+    """
+    Run the event classification in the same order of spatial_operations.
+    """
+    cont_idx, _ = continuous(overlays)
+    mergs_idx, _, merge_frame = merge(overlays)
+    splits_idx, _, nw_splt_idx, nw_splt_prv_idx, _ = split(overlays)
+    cur_frame.loc[nw_splt_idx, 'split_pr_idx'] = nw_splt_prv_idx
+    cur_frame.loc[mergs_idx, 'merge_idx'] = merge_frame['merge_ids'].values
+    mrg_spl_idx, _ = merge_split(mergs_idx, splits_idx, cur_frame, prv_frame)
+    return cont_idx, mergs_idx, splits_idx, nw_splt_idx, mrg_spl_idx
+
+
+if __name__ == '__main__':
+    n_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    overlays, cur_frame, prv_frame = synthetic_overlays(n_pairs)
+    start = time.perf_counter()
+    events = classify(overlays, cur_frame, prv_frame)
+    elapsed = time.perf_counter() - start
+    print('Overlap pairs: {}'.format(len(overlays)))
+    for name, idx in zip(['CON', 'MRG', 'SPL', 'NEW/SPL', 'MRG/SPL'], events):
+        print('{}: {}'.format(name, len(idx)))
+    print('Elapsed: {:.3f} s'.format(elapsed))
@@ -0,0 +1,50 @@
+import sys
+import argparse
+sys.path.append('../')
+from pyfortracc.benchmark import synthetic_workload, run_benchmark, compare_reports
+
+# Benchmark of the tracking stages with a synthetic workload of moving systems.
+# Usage: python track_benchmark.py --size 1800x3600 --frames 24 --report new.json
+#        python track_benchmark.py ... --report new.json --compare base.json
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', default='200x400', help='y_dim x x_dim')
+    parser.add_argument('--frames', type=int, default=24)
+    parser.add_argument('--clusters', type=int, default=20)
+    parser.add_argument('--merge-rate', type=float, default=0.05)
+    parser.add_argument('--split-rate', type=float, default=0.05)
+    parser.add_argument('--thresholds', default='10,25,40')
+    parser.add_argument('--no-dateline', action='store_true')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--dir', default='benchmark/')
+    parser.add_argument('--parallel', action='store_true')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--executor', default='process')
+    parser.add_argument('--report', default='benchmark.json')
+    parser.add_argument('--label', default=None)
+    parser.add_argument('--compare', default=None, help='base report')
+    args = parser.parse_args()
+    y_dim, x_dim = [int(dim) for dim in args.size.split('x')]
+    name_list, workload = synthetic_workload(
+        args.dir, y_dim=y_dim, x_dim=x_dim, n_frames=args.frames,
+        n_clusters=args.clusters, merge_rate=args.merge_rate,
+        split_rate=args.split_rate,
+        thresholds=[float(thr) for thr in args.thresholds.split(',')],
+        dateline=not args.no_dateline, seed=args.seed)
+    name_list['n_jobs'] = args.n_jobs
+    name_list['executor'] = args.executor
+    report = run_benchmark(name_list, parallel=args.parallel,
+                           workload=workload, report_file=args.report,
+                           label=args.label)
+    print('Workload events:', workload['events'])
+    for stage, result in report['stages'].items():
+        print('{:<20} {:>9.3f} s {:>9.1f} MB'.format(stage, result['seconds'],
+                                                    result['peak_rss_mb']))
+    print('{:<20} {:>9.3f} s'.format('total', report['total_seconds']))
+    if args.compare is not None:
+        comparison = compare_reports(args.compare, report)
+        print(comparison.to_string(index=False))
+        if comparison['regression'].any():
+            sys.exit(1)
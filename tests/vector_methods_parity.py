@@ -0,0 +1,227 @@
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import LineString, Point
+sys.path.append('../')
+from pyfortracc.utilities.math_utils import (uv_components, calc_addition_uv,
+                                             calc_mean_uv)
+from pyfortracc.vector_methods.split_mtd import split_mtd
+from pyfortracc.vector_methods.merge_mtd import merge_mtd
+from pyfortracc.vector_methods.incores_mtd import innercores_mtd
+from pyfortracc.vector_methods.ellipse_mtd import ellipse_mtd, envole_ellipse
+
+# Parity check of the vectorized vector methods against the previous loops.
+# The loops below are the previous split_mtd, merge_mtd, innercores_mtd and
+# ellipse_mtd. Both are run on synthetic frames with repeated indexes, with
+# the frames selected as in spatial_operations, and the outputs must be
+# bit-identical.
+# Usage: python vector_methods_parity.py --clusters 3000 --events 800
+
+
+def loop_split_mtd(cur_df, prv_df, spl_idx):
+    linestrings, u_, v_ = [], [], []
+    for sidx in spl_idx:
+        cur_i_df = cur_df.loc[sidx]
+        cur_geom = cur_i_df['geometry']
+        prv_geom = prv_df.loc[cur_i_df['split_pr_idx']]['geometry']
+        if isinstance(cur_geom, gpd.GeoSeries):
+            cur_geom = cur_geom.iloc[0]
+        if isinstance(prv_geom, gpd.GeoSeries):
+            prv_geom = prv_geom.iloc[0]
+        prv_ints_ctrd = cur_geom.intersection(prv_geom).centroid
+        cur_ctrd = cur_geom.centroid
+        linestrings.append(LineString([prv_ints_ctrd, cur_ctrd]))
+        uv_ = uv_components(prv_ints_ctrd.coords[0], cur_ctrd.coords[0])
+        u_.append(uv_[0])
+        v_.append(uv_[1])
+    return linestrings, u_, v_
+
+
+def loop_merge_mtd(cur_mrg_df, prv_mrg_df, cur_mrgs_idx, prv_mrg_idx):
+    u_, v_ = [], []
+    prv_mrg_idx = prv_mrg_idx.tolist()
+    for cidx in range(len(cur_mrgs_idx)):
+        cur_crtd = cur_mrg_df.loc[cur_mrgs_idx[cidx]]['centroid']
+        prv_crtds = prv_mrg_df.loc[prv_mrg_idx[cidx]]['centroid'].values
+        uv_comps = np.array([uv_components(p.coords[0], cur_crtd.coords[0])
+                             for p in prv_crtds])
+        mean_uv = calc_addition_uv(uv_comps)
+        u_.append(mean_uv[0])
+        v_.append(mean_uv[1])
+    return u_, v_
+
+
+def loop_innercores_mtd(cur_base, cur_inner, cur_bse_idx, cur_ins_idx):
+    u_, v_ = [], []
+    for cidx in range(len(cur_bse_idx)):
+        cur_bse_uv = cur_base.loc[cur_bse_idx[cidx]][['u_', 'v_']].values
+        cur_inn_uv = cur_inner.loc[cur_ins_idx[cidx]][['u_', 'v_']]
+        cur_inn_uv = cur_inn_uv.dropna(axis=0).values
+        uv_list = np.vstack((cur_bse_uv, cur_inn_uv))
+        mean_uv = calc_mean_uv(uv_list)
+        u_.append(mean_uv[0])
+        v_.append(mean_uv[1])
+    return u_, v_
+
+
+def loop_ellipse_mtd(cur_df, prv_df):
+    u_, v_ = [], []
+    cur_df['elipse'] = cur_df.geometry.apply(envole_ellipse)
+    prv_df['elipse'] = prv_df.geometry.apply(envole_ellipse)
+    for _, row in cur_df.iterrows():
+        cur_ellip_cent = row.elipse.centroid
+        prv_ellip_cent = prv_df.loc[row['past_idx']].elipse.centroid
+        if isinstance(prv_ellip_cent, Point) == False:
+            prv_ellip_cent = prv_ellip_cent.unary_union.centroid
+        uv_ = uv_components(prv_ellip_cent.coords[0], cur_ellip_cent.coords[0])
+        u_.append(uv_[0])
+        v_.append(uv_[1])
+    return u_, v_
+
+
+def synthetic_frame(rng, n_clusters, repeated):
+    """
+    Build a frame of circular clusters. A fraction of the index labels is
+    repeated, so frame.loc of these labels selects more than one row.
+    """
+    labels = np.arange(n_clusters)
+    dup = rng.choice(n_clusters, int(n_clusters * repeated), replace=False)
+    labels[dup] = rng.integers(0, n_clusters, len(dup))
+    labels = np.sort(labels)
+    geometry = shapely.buffer(shapely.points(rng.random((n_clusters, 2)) * 1000),
+                              rng.random(n_clusters) * 20 + 5)
+    v_ = np.where(rng.random(n_clusters) < 0.2, np.nan,
+                  rng.normal(size=n_clusters))
+    return gpd.GeoDataFrame({'geometry': geometry,
+                             'centroid': shapely.centroid(geometry),
+                             'u_': rng.normal(size=n_clusters),
+                             'v_': v_}, index=labels)
+
+
+def unique_labels(frame):
+    return frame.index[~frame.index.duplicated(keep=False)].values
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    output = function(*args)
+    return output, time.perf_counter() - start
+
+
+def same(old, new):
+    return np.array_equal(np.asarray(old, dtype=float),
+                          np.asarray(new, dtype=float), equal_nan=True)
+
+
+def check_split(rng, cur_frme, prv_frme, n_events):
+    # The first row of each previous index is a shifted copy of the first
+    # current cluster that splits from it, the other rows of the index are
+    # clusters of prv_frme. The split events can repeat a current index
+    cur_frme = cur_frme.copy()
+    first = ~cur_frme.index.duplicated()
+    split_pr_idx = rng.permutation(first.sum())
+    cur_frme['split_pr_idx'] = rng.choice(split_pr_idx,
+                                          len(cur_frme)).astype(float)
+    cur_frme.loc[first, 'split_pr_idx'] = split_pr_idx.astype(float)
+    shift = rng.normal(scale=5, size=2)
+    prv_geom = shapely.transform(cur_frme.loc[first, 'geometry'].values,
+                                 lambda coords: coords + shift)
+    repeated = prv_frme.loc[~prv_frme.index.duplicated(keep='first')]
+    repeated = repeated.set_axis(rng.choice(split_pr_idx, len(repeated)))
+    prv_frme = pd.concat([gpd.GeoDataFrame(
+        {'geometry': prv_geom, 'centroid': shapely.centroid(prv_geom),
+         'u_': 0.0, 'v_': 0.0}, index=split_pr_idx),
+        repeated]).sort_index(kind='stable')
+    nw_splt_idx = np.sort(rng.choice(cur_frme.index.values, n_events))
+    cur_spl = cur_frme.loc[nw_splt_idx]
+    prv_spl = prv_frme.loc[cur_spl['split_pr_idx'].values]
+    old, old_time = timed(loop_split_mtd, cur_spl, prv_spl, nw_splt_idx)
+    new, new_time = timed(split_mtd, cur_spl, prv_spl, nw_splt_idx)
+    old_wkt = shapely.to_wkt(np.array(old[0]), rounding_precision=-1)
+    equal = (list(old_wkt) == list(new[0]) and same(old[1], new[1]) and
+             same(old[2], new[2]))
+    return equal, len(nw_splt_idx), old_time, new_time
+
+
+def check_merge(rng, cur_frme, prv_frme, n_events, max_clusters):
+    mergs_idx = np.sort(rng.choice(unique_labels(cur_frme), n_events,
+                                   replace=False))
+    prv_labels = np.unique(prv_frme.index.values)
+    prev_mrgs = pd.Series([list(rng.choice(prv_labels,
+                                           rng.integers(2, max_clusters + 1),
+                                           replace=False))
+                           for _ in mergs_idx], index=mergs_idx)
+    cur_mrg = cur_frme.loc[mergs_idx]
+    prv_mrg = prv_frme.loc[prev_mrgs.explode().values]
+    old, old_time = timed(loop_merge_mtd, cur_mrg, prv_mrg, mergs_idx,
+                          prev_mrgs)
+    new, new_time = timed(merge_mtd, cur_mrg, prv_mrg, mergs_idx, prev_mrgs)
+    equal = same(old[0], new[0]) and same(old[1], new[1])
+    return equal, len(mergs_idx), old_time, new_time
+
+
+def check_innercores(rng, cur_frme, insd_frme, n_events, max_clusters):
+    insd_idx = np.sort(rng.choice(unique_labels(cur_frme), n_events,
+                                  replace=False))
+    insd_labels = np.unique(insd_frme.index.values)
+    cur_base = cur_frme.loc[insd_idx]
+    cur_base['inside_idx'] = [list(rng.choice(insd_labels,
+                                              rng.integers(1, max_clusters + 1),
+                                              replace=False))
+                              for _ in insd_idx]
+    cur_inner_idx = cur_base['inside_idx'].values
+    cur_inner = insd_frme.loc[cur_base['inside_idx'].explode().values]
+    old, old_time = timed(loop_innercores_mtd, cur_base, cur_inner, insd_idx,
+                          cur_inner_idx)
+    new, new_time = timed(innercores_mtd, cur_base, cur_inner, insd_idx,
+                          cur_inner_idx)
+    equal = same(old[0], new[0]) and same(old[1], new[1])
+    return equal, len(insd_idx), old_time, new_time
+
+
+def check_ellipse(rng, cur_frme, prv_frme, n_events):
+    cur_frme = cur_frme.copy()
+    cur_frme['past_idx'] = rng.choice(prv_frme.index.values,
+                                      len(cur_frme)).astype(float)
+    cur_non_null_idx = np.sort(rng.choice(unique_labels(cur_frme), n_events,
+                                          replace=False))
+    cur_ell = cur_frme.loc[cur_non_null_idx]
+    prev_ell = prv_frme.loc[cur_ell['past_idx'].values]
+    new, new_time = timed(ellipse_mtd, cur_ell.copy(), prev_ell.copy())
+    old, old_time = timed(loop_ellipse_mtd, cur_ell.copy(), prev_ell.copy())
+    equal = same(old[0], new[0]) and same(old[1], new[1])
+    return equal, len(cur_non_null_idx), old_time, new_time
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clusters', type=int, default=3000)
+    parser.add_argument('--events', type=int, default=800)
+    parser.add_argument('--max-clusters', type=int, default=11)
+    parser.add_argument('--repeated', type=float, default=0.1)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    rng = np.random.default_rng(args.seed)
+    cur_frme = synthetic_frame(rng, args.clusters, args.repeated)
+    prv_frme = synthetic_frame(rng, args.clusters, args.repeated)
+    insd_frme = synthetic_frame(rng, args.clusters, args.repeated)
+    checks = {'split_mtd': check_split(rng, cur_frme, prv_frme, args.events),
+              'merge_mtd': check_merge(rng, cur_frme, prv_frme, args.events,
+                                       args.max_clusters),
+              'innercores_mtd': check_innercores(rng, cur_frme, insd_frme,
+                                                 args.events,
+                                                 args.max_clusters),
+              'ellipse_mtd': check_ellipse(rng, cur_frme, prv_frme,
+                                           args.events)}
+    failed = False
+    for name, (equal, n_events, old_time, new_time) in checks.items():
+        print('{}: {} events, {}, loop {:.3f} s, vectorized {:.3f} s'.format(
+            name, n_events, 'same' if equal else 'DIFFERENT', old_time,
+            new_time))
+        failed = failed or not equal
+    if failed:
+        sys.exit(1)